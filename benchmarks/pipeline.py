@@ -0,0 +1,358 @@
+"""
+This file contains the end-to-end benchmark of the RAG pipeline
+
+Usage:
+    python -m benchmarks.pipeline --sizes 100 1000 10000
+    python -m benchmarks.pipeline --save-baseline benchmarks/baseline.json
+    python -m benchmarks.pipeline --baseline benchmarks/baseline.json
+
+Every stage runs offline against synthetic corpora generated from the
+`maintenance_requests` schema, a hashing embedding model and a stub LLM with
+configurable latency, so results are reproducible across runs and machines
+of the same type. Each corpus size runs in a fresh process so its peak RSS
+is measured in isolation. With --baseline, the run fails (exit code 1) when
+a throughput or latency metric regresses by more than the tolerance.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import queue as queue_module
+import random
+import resource
+import sys
+import time
+
+from llama_index.core import Settings
+from llama_index.core.schema import MetadataMode, QueryBundle
+from sklearn.metrics import classification_report
+from benchmarks.stubs import HashingEmbedding, StubLLM
+from data.examples import maintenance_requests
+from src.engine import build_completion_prompt, create_engine, direct_parse_response
+
+
+STAGES = ("retrieval", "prompt", "generation", "parsing")
+
+FIRST_NAMES = ("David", "Linda", "Chris", "Jessica", "Michael", "Sarah", "Kevin")
+LAST_NAMES = ("Brown", "Turner", "Taylor", "White", "Green", "Martinez", "Hill")
+
+
+def synthesize_records(n_records, seed=0):
+    """
+    Generates a reproducible synthetic corpus from the schema and
+    vocabulary of `maintenance_requests`. Descriptions are recombined from
+    the sentences of the real records, so retrieval sees realistic text.
+
+    Args:
+        n_records (int): Number of records to generate.
+        seed (int, optional): Random seed.
+
+    Returns:
+        generator: Maintenance requests in dictionary form.
+    """
+    rng = random.Random(seed)
+    base = list(maintenance_requests)
+    sentences = [
+        sentence.strip()
+        for record in base
+        for sentence in record["Description of Issue"].split(". ")
+        if sentence.strip()
+    ]
+    for i in range(n_records):
+        template = base[rng.randrange(len(base))]
+        description = ". ".join(rng.sample(sentences, rng.randint(3, 6)))
+        yield {
+            "Form Type": template["Form Type"],
+            "Request ID": f"NAV-{100000 + i}",
+            "Date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "Requested By": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "Department": template["Department"],
+            "Priority": template["Priority"],
+            "Description of Issue": description.rstrip(".") + ".",
+            "Additional Notes": template["Additional Notes"],
+        }
+
+
+def percentile(values, q):
+    """
+    Returns the nearest-rank percentile of a list of values.
+
+    Args:
+        values (list): Measurements.
+        q (float): Percentile between 0 and 100.
+
+    Returns:
+        float: The percentile.
+    """
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies):
+    """
+    Summarizes the latencies of a stage.
+
+    Args:
+        latencies (list): Latencies in seconds.
+
+    Returns:
+        dict: Throughput (operations per second) and p50/p95/p99 latency in
+              milliseconds.
+    """
+    total = sum(latencies)
+    return {
+        "throughput": len(latencies) / total if total else float("inf"),
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+        "p99_ms": 1000 * percentile(latencies, 99),
+    }
+
+
+def run_size(n_records, n_queries, llm_latency, token_latency, seed):
+    """
+    Benchmarks every pipeline stage on one corpus size. The stages are
+    timed separately, the prompt with the engine's own QA template and the
+    generation as one LLM call on that prompt, and end to end is timed as a
+    real `engine.query` plus parsing.
+
+    Args:
+        n_records (int): Corpus size.
+        n_queries (int): Number of form completions to run.
+        llm_latency (float): Stub LLM seconds per call.
+        token_latency (float): Stub LLM seconds per token.
+        seed (int): Random seed of the workload.
+
+    Returns:
+        dict: Metrics per stage and peak RSS in MiB.
+    """
+    Settings.embed_model = HashingEmbedding()
+    Settings.llm = StubLLM(latency=llm_latency, token_latency=token_latency)
+    results = {"records": n_records, "queries": n_queries}
+
+    start = time.perf_counter()
+    query_engine, _ = create_engine(
+        Settings.llm, synthesize_records(n_records, seed)
+    )
+    build_seconds = time.perf_counter() - start
+    results["index_build"] = {
+        "seconds": build_seconds,
+        "throughput": n_records / build_seconds,
+    }
+
+    # Queries are the first sentences of a sample of the corpus, which is
+    # generated again rather than kept in memory
+    rng = random.Random(seed + 1)
+    picks = [rng.randrange(n_records) for _ in range(n_queries)]
+    wanted = set(picks)
+    picked = {
+        i: record
+        for i, record in enumerate(synthesize_records(n_records, seed))
+        if i in wanted
+    }
+    qa_template = query_engine.get_prompts()[
+        "response_synthesizer:text_qa_template"
+    ]
+    latencies = {stage: [] for stage in STAGES}
+    end_to_end = []
+    expected, generated = [], []
+    for record in (picked[i] for i in picks):
+        summary = record["Description of Issue"].split(". ")[0]
+
+        start = time.perf_counter()
+        query = build_completion_prompt(summary)
+        bundle = QueryBundle(query)
+        nodes = query_engine.retrieve(bundle)
+        latencies["retrieval"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        context = "\n\n".join(
+            node.node.get_content(metadata_mode=MetadataMode.LLM)
+            for node in nodes
+        )
+        prompt = qa_template.format(
+            llm=Settings.llm, context_str=context, query_str=query
+        )
+        latencies["prompt"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        response_text = Settings.llm.complete(prompt).text
+        latencies["generation"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        form = direct_parse_response(response_text)
+        latencies["parsing"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        direct_parse_response(query_engine.query(query).response)
+        end_to_end.append(time.perf_counter() - start)
+
+        expected.append(record["Department"])
+        generated.append(form["Department"][0])
+
+    start = time.perf_counter()
+    classification_report(expected, generated, zero_division=0)
+    results["metrics"] = {"seconds": time.perf_counter() - start}
+
+    for stage, values in latencies.items():
+        results[stage] = summarize(values)
+    results["end_to_end"] = summarize(end_to_end)
+
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mib"] = peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+    return results
+
+
+def _run_size_in_child(queue, *args):
+    queue.put(run_size(*args))
+
+
+def run_isolated(*args, timeout=None):
+    """
+    Runs `run_size` in a fresh process, so peak RSS is per corpus size.
+
+    Args:
+        *args: Arguments of `run_size`.
+        timeout (float, optional): Seconds to wait for the results.
+
+    Returns:
+        dict: The results of `run_size`.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_size_in_child, args=(queue, *args))
+    process.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # Polls so a child that crashes or is killed (e.g. out of memory) fails
+    # the run instead of blocking it forever
+    while True:
+        try:
+            results = queue.get(timeout=1.0)
+            break
+        except queue_module.Empty:
+            if process.exitcode is not None and queue.empty():
+                raise RuntimeError(
+                    f"Benchmark of {args[0]} records exited with code "
+                    f"{process.exitcode} before reporting results"
+                )
+            if deadline is not None and time.monotonic() > deadline:
+                process.terminate()
+                process.join()
+                raise TimeoutError(
+                    f"Benchmark of {args[0]} records timed out after {timeout}s"
+                )
+    process.join()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares a run against a baseline run.
+
+    Args:
+        results (dict): Current run, keyed by corpus size.
+        baseline (dict): Saved run, keyed by corpus size.
+        tolerance (float): Allowed relative regression, e.g. 0.1 for 10%.
+
+    Returns:
+        list: Descriptions of the metrics that regressed.
+    """
+    regressions = []
+    for size, current in results["sizes"].items():
+        saved = baseline["sizes"].get(size)
+        if saved is None:
+            continue
+        checks = [("index_build", "throughput", True)]
+        checks += [
+            (stage, metric, metric == "throughput")
+            for stage in STAGES + ("end_to_end",)
+            for metric in ("throughput", "p50_ms", "p95_ms", "p99_ms")
+        ]
+        checks.append((None, "peak_rss_mib", False))
+        for stage, metric, higher_is_better in checks:
+            new = current[stage][metric] if stage else current[metric]
+            old = saved[stage][metric] if stage else saved[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (
+                not higher_is_better and change > tolerance
+            ):
+                name = f"{stage}.{metric}" if stage else metric
+                regressions.append(
+                    f"{size} records: {name} {old:.3f} -> {new:.3f} "
+                    f"({100 * change:+.1f}%)"
+                )
+    return regressions
+
+
+def print_report(results):
+    for size, metrics in results["sizes"].items():
+        print(f"\n{size} records ({metrics['queries']} queries)")
+        print(
+            f"  index_build   {metrics['index_build']['seconds']:.2f} s "
+            f"({metrics['index_build']['throughput']:.0f} records/s)"
+        )
+        for stage in STAGES + ("end_to_end",):
+            row = metrics[stage]
+            print(
+                f"  {stage:<13} {row['throughput']:>10.1f} ops/s  "
+                f"p50 {row['p50_ms']:.2f} ms  p95 {row['p95_ms']:.2f} ms  "
+                f"p99 {row['p99_ms']:.2f} ms"
+            )
+        print(f"  metrics       {1000 * metrics['metrics']['seconds']:.2f} ms")
+        print(f"  peak RSS      {metrics['peak_rss_mib']:.1f} MiB")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--timeout", type=float, default=3600.0, help="Seconds per corpus size"
+    )
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--save-baseline", help="Write this run as a baseline")
+    args = parser.parse_args()
+
+    run = {
+        "config": {
+            "queries": args.queries,
+            "llm_latency": args.llm_latency,
+            "token_latency": args.token_latency,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "sizes": {},
+    }
+    for size in args.sizes:
+        run["sizes"][str(size)] = run_isolated(
+            size,
+            args.queries,
+            args.llm_latency,
+            args.token_latency,
+            args.seed,
+            timeout=args.timeout,
+        )
+    print_report(run)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(run, file, indent=4)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(run, json.load(file), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
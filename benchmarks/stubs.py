@@ -0,0 +1,96 @@
+"""
+This file contains the offline stand-ins used by the benchmarks: a
+deterministic hashing embedding model and an LLM stub with configurable
+latency
+"""
+
+import re
+import time
+import zlib
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+# Completion returned by the stub LLM, in the interface prompt format
+STUB_COMPLETION = (
+    'Department: ["Engineering", "Mechanical", "Electrical"]\n'
+    'Priority: ["High", "Medium", "Low"]\n'
+    'Description of Issue: ["The system is malfunctioning and requires '
+    'immediate inspection.", "A fault has been reported that needs repair.", '
+    '"Inspection and corrective maintenance are required."]\n'
+    'Requested Actions: ["Inspect the system", "Replace faulty components", '
+    '"Verify operation post-repair"]\n'
+    'Additional Notes: "Generated by the benchmark stub LLM."\n'
+)
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    Embeds text as a hashed bag of words. It is deterministic and needs no
+    network or model download, so benchmark workloads are reproducible.
+
+    Attributes:
+        embed_dim (int): Dimension of the embeddings.
+    """
+
+    embed_dim: int = 384
+
+    @classmethod
+    def class_name(cls):
+        return "HashingEmbedding"
+
+    def _vector(self, text):
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            vector[zlib.crc32(word.encode()) % self.embed_dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query):
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._vector(query)
+
+    def _get_text_embedding(self, text):
+        return self._vector(text)
+
+
+class StubLLM(CustomLLM):
+    """
+    An LLM stand-in that sleeps for a configurable time and returns a fixed,
+    well-formed form completion.
+
+    Attributes:
+        latency (float): Seconds per call before the first token.
+        token_latency (float): Seconds per streamed token.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def metadata(self):
+        return LLMMetadata(model_name="stub")
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        tokens = STUB_COMPLETION.split(" ")
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        return CompletionResponse(text=STUB_COMPLETION)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        def generate():
+            time.sleep(self.latency)
+            text = ""
+            for token in STUB_COMPLETION.split(" "):
+                time.sleep(self.token_latency)
+                delta = token + " "
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return generate()
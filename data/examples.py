@@ -1,806 +1,16 @@
 """
 This file contains the "documents" for the RAG database
+
+The records are stored in the columnar corpus file next to this module (see
+data/corpus.py). `maintenance_requests` is kept for compatibility: it is a
+lazily decoded, memory-mapped sequence of the requests in dictionary form.
 """
 
-maintenance_requests = [
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12350",
-        "Date": "2024-07-21",
-        "Requested By": "David Brown",
-        "Department": "Engineering",
-        "Priority": "High",
-        "Description of Issue": "Hydraulic system pressure fluctuating beyond safe operational limits. Inspect hydraulic lines for potential leaks or blockages. Inspect and replace any worn-out seals and o-rings. Perform system flush to remove contaminants. Verify pressure stability post-repair by conducting a full operational test.",
-        "Additional Notes": "Hydraulic system is critical for multiple ship operations. Prompt action required.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12351",
-        "Date": "2024-07-21",
-        "Requested By": "Linda Turner",
-        "Department": "Mechanical",
-        "Priority": "Medium",
-        "Description of Issue": "Main engine fuel injectors exhibiting inconsistent spray patterns leading to engine misfires. Remove and inspect injectors for clogging or damage. Clean or replace injectors as necessary. Conduct fuel system pressure test post-repair to ensure proper operation.",
-        "Additional Notes": "Engine performance has been suboptimal for the past week.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12352",
-        "Date": "2024-07-21",
-        "Requested By": "Chris Taylor",
-        "Department": "Electrical",
-        "Priority": "High",
-        "Description of Issue": "Primary radar system experiencing intermittent power loss. Conduct a thorough inspection of power supply lines and connections for potential shorts or corrosion. Replace any damaged components. Test radar functionality post-repair to ensure consistent power delivery.",
-        "Additional Notes": "Radar system is crucial for navigation and situational awareness.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12353",
-        "Date": "2024-07-22",
-        "Requested By": "Jessica White",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Life raft automatic release mechanism malfunctioning. Inspect mechanical and electronic components for wear or damage. Repair or replace faulty parts. Conduct a full operational test to ensure proper release functionality in emergency situations.",
-        "Additional Notes": "Critical for crew safety during emergency evacuations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12354",
-        "Date": "2024-07-22",
-        "Requested By": "Michael Green",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Ventilation system in engine room not maintaining proper airflow. Inspect ductwork for blockages or damage. Clean or replace air filters. Verify fan operation and electrical connections. Ensure system is restored to optimal performance levels.",
-        "Additional Notes": "Proper ventilation is essential for safe engine room operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12355",
-        "Date": "2024-07-23",
-        "Requested By": "Sarah Martinez",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Anchor windlass motor overheating during operation. Inspect motor windings for signs of excessive wear or damage. Check lubrication levels and cooling system functionality. Repair or replace components as needed. Test motor under load to confirm proper operation.",
-        "Additional Notes": "Overheating may lead to complete system failure if not addressed promptly.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12356",
-        "Date": "2024-07-23",
-        "Requested By": "Daniel Harris",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Communication system experiencing intermittent signal loss. Inspect antenna connections and cabling for potential damage or corrosion. Replace any faulty components. Conduct system tests to ensure reliable communication channels.",
-        "Additional Notes": "Issue affects ship-to-ship and ship-to-shore communications.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12357",
-        "Date": "2024-07-24",
-        "Requested By": "Laura Clark",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Fire alarm panel showing false alarms in multiple zones. Inspect and test all fire detectors for proper operation. Replace any defective alarms. Verify panel functionality and reset system. Conduct a full system test to ensure reliability.",
-        "Additional Notes": "False alarms lead to unnecessary disruptions and potential safety hazards.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12358",
-        "Date": "2024-07-24",
-        "Requested By": "James Lewis",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Bilge pump operating at reduced capacity. Inspect and clean pump intake for debris. Check and replace worn-out impeller and seals. Test pump performance post-maintenance to ensure proper bilge water removal.",
-        "Additional Notes": "Regular maintenance required to prevent flooding in lower compartments.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12359",
-        "Date": "2024-07-25",
-        "Requested By": "Karen Robinson",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Steering system hydraulic leak detected at rudder actuator. Inspect hydraulic lines and fittings for damage or wear. Replace defective components. Refill hydraulic fluid and bleed system. Verify steering response post-repair.",
-        "Additional Notes": "Steering system integrity is critical for safe navigation.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12360",
-        "Date": "2024-07-25",
-        "Requested By": "Robert Walker",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Internal lighting circuit in crew quarters flickering. Inspect wiring and light fixtures for loose connections or corrosion. Replace any damaged components. Test lighting circuit under load to ensure stability.",
-        "Additional Notes": "Issue affects crew comfort and operational readiness.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12361",
-        "Date": "2024-07-26",
-        "Requested By": "Nancy Hall",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Emergency generator not starting during drills. Inspect fuel system for blockages or contamination. Check battery charge and electrical connections. Repair or replace defective components. Conduct start-up test to ensure generator reliability.",
-        "Additional Notes": "Generator failure impacts emergency power availability.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12362",
-        "Date": "2024-07-26",
-        "Requested By": "William Young",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Seawater cooling system experiencing reduced flow. Inspect intake screens for blockages. Check pump operation and replace any worn-out impellers. Flush system to remove scale and marine growth. Verify flow rate post-maintenance.",
-        "Additional Notes": "System performance is critical for engine cooling.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12363",
-        "Date": "2024-07-27",
-        "Requested By": "Barbara King",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Main propulsion shaft exhibiting excessive vibration. Conduct alignment check and inspect bearings for wear. Replace damaged bearings and re-align shaft. Test propulsion system under load to confirm vibration is within acceptable limits.",
-        "Additional Notes": "Excessive vibration may lead to further mechanical failures.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12364",
-        "Date": "2024-07-27",
-        "Requested By": "Steven Wright",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Battery backup system for critical electronics not holding charge. Inspect and test battery cells. Replace any faulty batteries. Verify charging system functionality. Test backup system under simulated load conditions.",
-        "Additional Notes": "Backup system is essential for maintaining critical systems during power loss.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12365",
-        "Date": "2024-07-28",
-        "Requested By": "Betty Hill",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "CO2 fire suppression system showing low pressure in storage tanks. Inspect tanks for leaks and verify pressure readings. Refill or replace tanks as necessary. Conduct system test to ensure proper activation in case of a fire.",
-        "Additional Notes": "Low pressure could result in system failure during an emergency.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12366",
-        "Date": "2024-07-28",
-        "Requested By": "Ronald Scott",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Fuel transfer pump operating intermittently. Inspect pump motor and electrical connections for faults. Check and clean fuel filters. Replace any worn-out components. Test pump operation under load to ensure reliable fuel transfer.",
-        "Additional Notes": "Consistent fuel supply is essential for engine operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12367",
-        "Date": "2024-07-29",
-        "Requested By": "Dorothy Adams",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Port side stabilizer fin hydraulic actuator leaking oil. Inspect actuator seals and hydraulic lines for damage. Replace defective components. Refill hydraulic fluid and bleed system. Test stabilizer operation to confirm leak is resolved.",
-        "Additional Notes": "Stabilizer malfunction affects ship stability in rough seas.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12368",
-        "Date": "2024-07-29",
-        "Requested By": "Paul Baker",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Internal communication system experiencing static interference. Inspect intercom wiring and connections for damage. Replace any corroded or faulty components. Conduct system tests to ensure clear communication channels.",
-        "Additional Notes": "Interference affects crew coordination and efficiency.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12369",
-        "Date": "2024-07-30",
-        "Requested By": "Margaret Nelson",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Fire main piping showing signs of corrosion and leakage. Inspect entire fire main system for integrity. Repair or replace corroded sections. Pressure test the system to ensure no leaks. Document all repairs and inspections.",
-        "Additional Notes": "Fire main integrity is crucial for onboard firefighting capabilities.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12350",
-        "Date": "2024-07-21",
-        "Requested By": "James Brown",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Main propulsion engine experiencing fuel injection issues. Conduct detailed inspection of fuel injectors and fuel lines. Clean or replace clogged injectors. Check fuel pump operation and calibrate as needed. Verify system performance after repairs.",
-        "Additional Notes": "Engine performance has degraded over the past two weeks.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12351",
-        "Date": "2024-07-21",
-        "Requested By": "Linda Taylor",
-        "Department": "Hull Maintenance",
-        "Priority": "Low",
-        "Description of Issue": "Minor corrosion observed on starboard hull plating near waterline. Sandblast affected area and apply anti-corrosion primer. Follow up with appropriate topcoat. Verify no further corrosion is present.",
-        "Additional Notes": "Routine maintenance to prevent future issues.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12352",
-        "Date": "2024-07-21",
-        "Requested By": "Michael White",
-        "Department": "Electrical",
-        "Priority": "High",
-        "Description of Issue": "Main switchboard experiencing intermittent power losses. Inspect all bus bars, circuit breakers, and wiring for faults. Conduct insulation resistance testing. Replace any defective components. Ensure redundancy systems are operational.",
-        "Additional Notes": "Power losses affecting critical systems during operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12353",
-        "Date": "2024-07-21",
-        "Requested By": "Sarah Clark",
-        "Department": "Communications",
-        "Priority": "Medium",
-        "Description of Issue": "HF radio communication system experiencing static and signal dropouts. Inspect antenna connections and feed lines for damage. Test and recalibrate radio equipment. Replace any faulty components identified during testing.",
-        "Additional Notes": "Communication reliability is essential for mission success.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12354",
-        "Date": "2024-07-21",
-        "Requested By": "David Harris",
-        "Department": "Mechanical",
-        "Priority": "Low",
-        "Description of Issue": "Ventilation system in engine room producing unusual noise. Inspect and lubricate all moving parts. Check for loose fittings or obstructions in ductwork. Replace any worn-out bearings or fans.",
-        "Additional Notes": "Noise has been gradually increasing over the past month.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12355",
-        "Date": "2024-07-21",
-        "Requested By": "Karen Martinez",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Life raft deployment system showing signs of corrosion and wear. Conduct full inspection and perform necessary maintenance. Replace damaged components. Verify proper operation through deployment tests.",
-        "Additional Notes": "Critical for crew safety in emergency situations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12356",
-        "Date": "2024-07-21",
-        "Requested By": "Christopher Jones",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Secondary hydraulic system experiencing pressure drops. Inspect all hydraulic lines and connections for leaks. Test hydraulic pump performance. Replace any faulty hoses or seals. Refill and bleed hydraulic fluid as needed.",
-        "Additional Notes": "System performance is crucial for auxiliary equipment operation.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12357",
-        "Date": "2024-07-21",
-        "Requested By": "Patricia Wilson",
-        "Department": "Electrical",
-        "Priority": "Low",
-        "Description of Issue": "Interior lighting in crew quarters flickering. Inspect and replace faulty light fixtures or bulbs. Check electrical wiring for loose connections or damage. Ensure proper operation post-repair.",
-        "Additional Notes": "Issue reported by multiple crew members.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12358",
-        "Date": "2024-07-21",
-        "Requested By": "Robert Lewis",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Main engine turbocharger exhibiting excessive vibration. Inspect turbocharger and associated components. Balance turbocharger if needed. Replace any worn or damaged bearings. Ensure proper operation after maintenance.",
-        "Additional Notes": "Vibration could lead to further mechanical failures.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12359",
-        "Date": "2024-07-21",
-        "Requested By": "Lisa Walker",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Ballast system control panel showing erratic readings. Inspect electrical connections and control circuitry. Replace faulty sensors or wiring as needed. Test system functionality after repairs.",
-        "Additional Notes": "Accurate ballast control is essential for ship stability.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12360",
-        "Date": "2024-07-21",
-        "Requested By": "Steven Hall",
-        "Department": "Hull Maintenance",
-        "Priority": "Low",
-        "Description of Issue": "Non-skid surface on flight deck worn and peeling. Remove old non-skid material and prepare surface for new application. Apply new non-skid coating and allow proper curing time. Verify uniform application and texture.",
-        "Additional Notes": "Routine maintenance to ensure crew safety during operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12361",
-        "Date": "2024-07-21",
-        "Requested By": "Barbara Allen",
-        "Department": "Communications",
-        "Priority": "High",
-        "Description of Issue": "Satellite communication system failing to establish stable connection. Inspect and test satellite dish and associated hardware. Replace any defective components. Verify full system functionality after repairs.",
-        "Additional Notes": "Issue impacting mission-critical communications.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12362",
-        "Date": "2024-07-21",
-        "Requested By": "Matthew Young",
-        "Department": "Mechanical",
-        "Priority": "Medium",
-        "Description of Issue": "Fuel transfer pump making abnormal noise during operation. Inspect pump and associated piping for blockages or damage. Replace any worn or damaged components. Test pump operation post-repair.",
-        "Additional Notes": "Noise noticed during last refueling operation.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12363",
-        "Date": "2024-07-21",
-        "Requested By": "Elizabeth King",
-        "Department": "Safety",
-        "Priority": "Low",
-        "Description of Issue": "Fire extinguisher mounting brackets in galley area showing signs of rust. Remove rust and apply anti-corrosion treatment. Replace any severely corroded brackets. Ensure all fire extinguishers are securely mounted.",
-        "Additional Notes": "Preventive maintenance to ensure readiness in case of fire.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12364",
-        "Date": "2024-07-21",
-        "Requested By": "Paul Scott",
-        "Department": "Engineering",
-        "Priority": "High",
-        "Description of Issue": "Main generator failing to reach full output capacity. Inspect and clean generator components. Test and recalibrate voltage regulator. Replace any faulty parts. Verify generator output post-repair.",
-        "Additional Notes": "Power generation critical for ship operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12365",
-        "Date": "2024-07-21",
-        "Requested By": "Nancy Green",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Battery backup system not holding charge. Inspect and test all batteries. Replace any defective cells. Check charging system for proper operation. Verify backup system functionality after maintenance.",
-        "Additional Notes": "Backup power essential for emergency situations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12366",
-        "Date": "2024-07-21",
-        "Requested By": "George Adams",
-        "Department": "Mechanical",
-        "Priority": "Low",
-        "Description of Issue": "Anchor windlass motor exhibiting signs of wear. Inspect motor and gearbox for damage. Lubricate moving parts and replace worn components. Test windlass operation post-repair.",
-        "Additional Notes": "Routine maintenance to ensure reliable operation.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12367",
-        "Date": "2024-07-21",
-        "Requested By": "Donna Baker",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Bilge pump system failing to activate automatically. Inspect float switches and control circuitry. Replace any defective components. Test automatic and manual activation of bilge pumps.",
-        "Additional Notes": "Critical for preventing flooding in case of hull breach.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12368",
-        "Date": "2024-07-21",
-        "Requested By": "Kevin Carter",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Heat exchanger for HVAC system clogged. Inspect and clean heat exchanger. Replace any damaged fins or tubing. Test HVAC system performance post-repair.",
-        "Additional Notes": "Ensuring proper climate control for crew comfort.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12369",
-        "Date": "2024-07-21",
-        "Requested By": "Carol Mitchell",
-        "Department": "Communications",
-        "Priority": "Low",
-        "Description of Issue": "Intercom system in common areas producing feedback noise. Inspect and test intercom units and wiring. Replace any faulty components. Verify clear communication after repairs.",
-        "Additional Notes": "Issue reported during routine drills.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12350",
-        "Date": "2024-07-21",
-        "Requested By": "Michael Brown",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Hydraulic system pressure inconsistent. Suspect malfunction in hydraulic pump or seals. Inspect and test pump performance. Replace seals if necessary. Verify system pressure stability post-repair.",
-        "Additional Notes": "System reliability critical for deck operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12351",
-        "Date": "2024-07-21",
-        "Requested By": "Laura Wilson",
-        "Department": "Electrical",
-        "Priority": "Low",
-        "Description of Issue": "Cabin lighting flickering intermittently. Possible loose wiring or faulty light fixtures. Inspect and secure all connections. Replace any defective fixtures. Test lighting system to confirm resolution.",
-        "Additional Notes": "Issue reported by multiple crew members.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12352",
-        "Date": "2024-07-21",
-        "Requested By": "Robert Martinez",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Main engine oil pressure dropping below operational levels. Immediate inspection required to identify source of pressure loss. Check oil pump and pressure sensors. Replace faulty components. Verify oil pressure post-repair.",
-        "Additional Notes": "Critical for engine performance and safety.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12353",
-        "Date": "2024-07-21",
-        "Requested By": "Jessica Taylor",
-        "Department": "Safety",
-        "Priority": "Medium",
-        "Description of Issue": "Life raft deployment mechanism stiff and difficult to operate. Inspect and lubricate all moving parts. Ensure mechanism operates smoothly. Replace any worn or corroded components. Conduct deployment test.",
-        "Additional Notes": "Routine maintenance to ensure readiness in emergency situations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12354",
-        "Date": "2024-07-21",
-        "Requested By": "Daniel Anderson",
-        "Department": "Engineering",
-        "Priority": "Low",
-        "Description of Issue": "Ventilation fan in engine room making excessive noise. Possible bearing wear or imbalance. Inspect and lubricate bearings. Balance fan blades if necessary. Test fan operation post-service.",
-        "Additional Notes": "Noise levels becoming a distraction for engineering crew.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12355",
-        "Date": "2024-07-21",
-        "Requested By": "Patricia Thomas",
-        "Department": "Electrical",
-        "Priority": "High",
-        "Description of Issue": "Radar system intermittently losing signal. Inspect and test radar unit, including antenna and connections. Replace any faulty components. Verify radar performance under various conditions.",
-        "Additional Notes": "Critical for navigation and situational awareness.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12356",
-        "Date": "2024-07-21",
-        "Requested By": "Christopher Jackson",
-        "Department": "Mechanical",
-        "Priority": "Medium",
-        "Description of Issue": "Auxiliary generator difficult to start. Suspect fuel delivery issue or starter motor malfunction. Inspect fuel lines and filters. Test starter motor and replace if necessary. Verify generator starts and runs smoothly.",
-        "Additional Notes": "Generator used for critical power supply during operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12357",
-        "Date": "2024-07-21",
-        "Requested By": "Barbara White",
-        "Department": "Safety",
-        "Priority": "Low",
-        "Description of Issue": "Fire extinguisher in galley area past inspection date. Replace with new certified extinguisher. Update inspection records accordingly.",
-        "Additional Notes": "Routine safety measure to ensure compliance.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12358",
-        "Date": "2024-07-21",
-        "Requested By": "Matthew Harris",
-        "Department": "Engineering",
-        "Priority": "High",
-        "Description of Issue": "Fuel transfer pump not maintaining pressure. Immediate inspection required to diagnose and repair. Check pump seals and pressure relief valve. Replace defective parts. Verify pump operation post-repair.",
-        "Additional Notes": "Critical for fuel management during operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12359",
-        "Date": "2024-07-21",
-        "Requested By": "Elizabeth Clark",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Communication system experiencing static interference. Suspect issues with antenna or signal amplifier. Inspect and test all components. Replace any faulty parts. Verify clear communication channels.",
-        "Additional Notes": "Interference affecting command and control communications.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12360",
-        "Date": "2024-07-21",
-        "Requested By": "Anthony Rodriguez",
-        "Department": "Mechanical",
-        "Priority": "Low",
-        "Description of Issue": "Water heater in crew quarters not reaching set temperature. Inspect heating element and thermostat. Replace any defective components. Verify water heater performance post-repair.",
-        "Additional Notes": "Crew comfort impacted by inconsistent hot water supply.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12361",
-        "Date": "2024-07-21",
-        "Requested By": "Susan Lewis",
-        "Department": "Safety",
-        "Priority": "Medium",
-        "Description of Issue": "Smoke detector in engine room not responding to test. Inspect and replace detector if necessary. Test system to ensure proper operation.",
-        "Additional Notes": "Critical for early fire detection and safety.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12362",
-        "Date": "2024-07-21",
-        "Requested By": "Andrew Walker",
-        "Department": "Engineering",
-        "Priority": "High",
-        "Description of Issue": "Propulsion system experiencing vibration at high speeds. Immediate inspection required to identify source. Check shaft alignment and propeller condition. Replace or repair as necessary. Verify smooth operation post-repair.",
-        "Additional Notes": "Vibration affecting overall ship performance.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12363",
-        "Date": "2024-07-21",
-        "Requested By": "Karen Hall",
-        "Department": "Electrical",
-        "Priority": "Low",
-        "Description of Issue": "Power outlet in officer's quarters non-functional. Inspect wiring and outlet. Replace if necessary. Test outlet to confirm functionality.",
-        "Additional Notes": "Reported by multiple officers.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12364",
-        "Date": "2024-07-21",
-        "Requested By": "Steven Allen",
-        "Department": "Mechanical",
-        "Priority": "Medium",
-        "Description of Issue": "Air conditioning unit in mess hall not cooling adequately. Inspect refrigerant levels and compressor. Clean or replace air filters. Test system performance post-maintenance.",
-        "Additional Notes": "Crew comfort impacted during meal times.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12365",
-        "Date": "2024-07-21",
-        "Requested By": "Donna King",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Emergency exit signs in passageway not illuminating. Inspect and replace bulbs or entire units if necessary. Test to ensure proper illumination.",
-        "Additional Notes": "Critical for safe evacuation during emergencies.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12366",
-        "Date": "2024-07-21",
-        "Requested By": "Paul Wright",
-        "Department": "Engineering",
-        "Priority": "Low",
-        "Description of Issue": "Bilge pump running continuously. Inspect float switch and pump for malfunctions. Replace any faulty components. Verify proper pump operation post-repair.",
-        "Additional Notes": "Regular maintenance to prevent pump burnout.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12367",
-        "Date": "2024-07-21",
-        "Requested By": "Linda Scott",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Intercom system speakers in aft section not functioning. Inspect wiring and speaker units. Replace any defective parts. Test intercom system post-repair.",
-        "Additional Notes": "Affecting communication during operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12368",
-        "Date": "2024-07-21",
-        "Requested By": "Kevin Green",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Steering gear hydraulic leak detected. Immediate inspection and repair required. Check all hydraulic lines and seals. Replace any damaged components. Verify steering system integrity post-repair.",
-        "Additional Notes": "Critical for navigation and maneuvering.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12369",
-        "Date": "2024-07-21",
-        "Requested By": "Sandra Adams",
-        "Department": "Safety",
-        "Priority": "Low",
-        "Description of Issue": "Handrails on main deck corroded. Inspect all handrails for structural integrity. Clean and apply corrosion inhibitor. Replace any severely damaged sections.",
-        "Additional Notes": "Routine maintenance to ensure safety.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12350",
-        "Date": "2024-07-21",
-        "Requested By": "William Brown",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Main propulsion engine vibration detected at high RPMs. Conduct vibration analysis to identify source. Inspect engine mounts, shaft alignment, and coupling. Repair or replace any defective components. Perform post-repair testing to confirm resolution.",
-        "Additional Notes": "Issue noticed during recent sea trials.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12351",
-        "Date": "2024-07-21",
-        "Requested By": "Olivia Wilson",
-        "Department": "Electrical",
-        "Priority": "Low",
-        "Description of Issue": "Galley lighting system experiencing intermittent outages. Crew reports flickering lights. Inspect electrical wiring and fixtures. Repair or replace faulty components. Verify system functionality after repairs.",
-        "Additional Notes": "Issue has been ongoing for two weeks.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12352",
-        "Date": "2024-07-21",
-        "Requested By": "James Martinez",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Hydraulic system losing pressure. Inspect hydraulic lines, fittings, and seals for leaks. Repair or replace any defective parts. Refill hydraulic fluid and bleed system. Test to ensure proper pressure levels are maintained.",
-        "Additional Notes": "System is critical for deck operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12353",
-        "Date": "2024-07-21",
-        "Requested By": "Isabella Rodriguez",
-        "Department": "Safety",
-        "Priority": "Medium",
-        "Description of Issue": "Life raft release mechanism sticking. Inspect and lubricate release mechanism. Test multiple times to ensure smooth operation. Replace any worn or corroded parts. Document all maintenance actions.",
-        "Additional Notes": "Issue identified during routine safety inspection.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12354",
-        "Date": "2024-07-21",
-        "Requested By": "Liam Anderson",
-        "Department": "Engineering",
-        "Priority": "Low",
-        "Description of Issue": "Air conditioning system in crew quarters not cooling effectively. Inspect and clean air filters and coils. Check refrigerant levels and recharge if necessary. Test system functionality after maintenance.",
-        "Additional Notes": "Crew reports discomfort due to inadequate cooling.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12355",
-        "Date": "2024-07-21",
-        "Requested By": "Sophia Clark",
-        "Department": "Electrical",
-        "Priority": "High",
-        "Description of Issue": "Main switchboard experiencing power fluctuations. Conduct thorough inspection of switchboard components. Check for loose connections and signs of overheating. Repair or replace faulty parts. Test system under load to ensure stability.",
-        "Additional Notes": "Power issues causing intermittent outages in critical systems.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12356",
-        "Date": "2024-07-21",
-        "Requested By": "Mason Lewis",
-        "Department": "Mechanical",
-        "Priority": "Medium",
-        "Description of Issue": "Anchor windlass operating slowly. Inspect and lubricate mechanical parts. Check hydraulic system for proper pressure and fluid levels. Repair or replace any worn or damaged components. Test windlass operation post-maintenance.",
-        "Additional Notes": "Issue noted during recent anchoring operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12357",
-        "Date": "2024-07-21",
-        "Requested By": "Mia Walker",
-        "Department": "Safety",
-        "Priority": "High",
-        "Description of Issue": "Fire alarm system showing false alarms. Inspect sensors and control panel for malfunctions. Test each sensor individually to identify faulty units. Repair or replace defective components. Conduct full system test after maintenance.",
-        "Additional Notes": "False alarms causing unnecessary evacuations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12358",
-        "Date": "2024-07-21",
-        "Requested By": "Ethan Harris",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Fuel transfer pump making unusual noise. Inspect pump and associated piping for obstructions or damage. Disassemble pump if necessary and inspect internal components. Repair or replace faulty parts. Test pump operation after reassembly.",
-        "Additional Notes": "Noise noticed during routine fuel transfer operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12359",
-        "Date": "2024-07-21",
-        "Requested By": "Ava Hall",
-        "Department": "Electrical",
-        "Priority": "Low",
-        "Description of Issue": "Communication system experiencing interference. Inspect antennas and cabling for damage. Check grounding connections and integrity of shielding. Repair or replace faulty components. Test system performance post-repair.",
-        "Additional Notes": "Interference noticed during recent operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12360",
-        "Date": "2024-07-21",
-        "Requested By": "Alexander Young",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Steering gear hydraulic leak detected. Inspect hydraulic lines, fittings, and seals. Repair or replace any defective components. Refill hydraulic fluid and bleed system. Test steering gear operation post-repair.",
-        "Additional Notes": "Leak noticed during routine maintenance checks.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12361",
-        "Date": "2024-07-21",
-        "Requested By": "Emily King",
-        "Department": "Safety",
-        "Priority": "Medium",
-        "Description of Issue": "Emergency exit lights not functioning. Inspect electrical connections and bulbs. Replace any defective components. Test lights under emergency power conditions to ensure functionality.",
-        "Additional Notes": "Issue identified during safety drill.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12362",
-        "Date": "2024-07-21",
-        "Requested By": "Michael Wright",
-        "Department": "Engineering",
-        "Priority": "Low",
-        "Description of Issue": "Bilge pump cycling frequently. Inspect float switches and pump for proper operation. Clean bilge area and check for obstructions. Repair or replace faulty components. Test pump operation post-maintenance.",
-        "Additional Notes": "Frequent cycling noticed during routine checks.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12363",
-        "Date": "2024-07-21",
-        "Requested By": "Charlotte Lopez",
-        "Department": "Electrical",
-        "Priority": "Medium",
-        "Description of Issue": "Radar display intermittently losing signal. Inspect radar antenna and cabling for damage. Check connections at display unit. Repair or replace any faulty components. Test radar system under various conditions.",
-        "Additional Notes": "Signal loss noticed during recent navigation.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12364",
-        "Date": "2024-07-21",
-        "Requested By": "Daniel Lee",
-        "Department": "Mechanical",
-        "Priority": "High",
-        "Description of Issue": "Main engine oil pressure dropping at high RPMs. Inspect oil pump, filters, and pressure sensors. Check for leaks in oil lines. Repair or replace any faulty components. Test engine operation post-repair.",
-        "Additional Notes": "Pressure drop noticed during full power test.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12365",
-        "Date": "2024-07-21",
-        "Requested By": "Amelia White",
-        "Department": "Safety",
-        "Priority": "Low",
-        "Description of Issue": "Non-skid surface on flight deck wearing thin. Inspect entire flight deck for worn areas. Apply new non-skid coating to affected areas. Ensure proper curing time before resuming flight operations.",
-        "Additional Notes": "Worn areas noticed during deck inspections.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12366",
-        "Date": "2024-07-21",
-        "Requested By": "David Harris",
-        "Department": "Engineering",
-        "Priority": "Medium",
-        "Description of Issue": "Freshwater generator producing low output. Inspect generator components for wear or damage. Clean and descale if necessary. Repair or replace any defective parts. Test generator output post-maintenance.",
-        "Additional Notes": "Low output noticed during recent operations.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12367",
-        "Date": "2024-07-21",
-        "Requested By": "Harper Adams",
-        "Department": "Electrical",
-        "Priority": "High",
-        "Description of Issue": "Battery backup system not holding charge. Inspect batteries and charging system. Test individual battery cells for voltage and capacity. Replace any defective batteries. Test entire system post-replacement.",
-        "Additional Notes": "Issue affects critical systems during power loss.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12368",
-        "Date": "2024-07-21",
-        "Requested By": "Benjamin Hill",
-        "Department": "Mechanical",
-        "Priority": "Low",
-        "Description of Issue": "Ventilation fans in engine room noisy. Inspect and clean fan blades and housings. Lubricate bearings and check for balance. Repair or replace any worn or damaged components. Test fan operation post-maintenance.",
-        "Additional Notes": "Noise noticed during routine inspections.",
-    },
-    {
-        "Form Type": "2K",
-        "Request ID": "NAV-12369",
-        "Date": "2024-07-21",
-        "Requested By": "Evelyn Scott",
-        "Department": "Safety",
-        "Priority": "Medium",
-        "Description of Issue": "Fire extinguisher brackets loose in crew quarters. Inspect and secure all brackets. Replace any that are damaged. Ensure all fire extinguishers are properly mounted and accessible.",
-        "Additional Notes": "Loose brackets noticed during safety inspection.",
-    },
-]
+import os
+from data.corpus import Corpus
+
+CORPUS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "maintenance_requests.corpus"
+)
+
+maintenance_requests = Corpus(CORPUS_PATH)
@@ -2,7 +2,11 @@
 This file contains the Replicate/OpenAI objects for the different LLM's
 """
 
+import functools
+import os
+import threading
 import replicate
+from llama_index.core.bridge.pydantic import PrivateAttr
 from llama_index.llms.replicate import Replicate
 from llama_index.llms.openai import OpenAI
 from src.prompts import (
@@ -12,6 +16,96 @@ from src.prompts import (
 )
 
 
+# Llama 3 instruct chat template, shared by the Replicate and local backends
+LLAMA3_PROMPT_TEMPLATE = (
+    "<|begin_of_text|><|start_header_id|>system"
+    "<|end_header_id|>\n\n{system_prompt}"
+    "<|eot_id|><|start_header_id|>user<|end_header_id|>\n\n"
+    "{prompt}<|eot_id|><|start_header_id|>assistant"
+    "<|end_header_id|>\n\n"
+)
+LLAMA3_STOP_SEQUENCES = ["<|end_of_text|>", "<|eot_id|>"]
+
+# Quantized GGUF weights used by the local backend
+LOCAL_MODEL_PATH = os.environ.get(
+    "LOCAL_MODEL_PATH", "models/Meta-Llama-3-8B-Instruct.Q4_K_M.gguf"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def local_llm_class():
+    """
+    Returns the llama.cpp LLM class of the local backend. It is imported
+    lazily, so llama-cpp-python is only needed when the backend is used.
+    Calls are serialized, since a llama.cpp context is not thread-safe;
+    each call still runs on `n_threads` CPU threads.
+
+    Args:
+        None.
+
+    Returns:
+        type: A thread-safe subclass of `LlamaCPP`.
+    """
+    from llama_index.llms.llama_cpp import LlamaCPP
+
+    class LocalLlamaCPP(LlamaCPP):
+        constrained: bool = False
+        _lock = PrivateAttr(default_factory=threading.Lock)
+
+        @classmethod
+        def class_name(cls):
+            return "LocalLlamaCPP"
+
+        def _constrain(self, prompt):
+            # Called under the lock, so the grammar applies to this call only
+            if self.constrained:
+                from src.grammar import grammar_for_prompt
+
+                self.generate_kwargs["grammar"] = grammar_for_prompt(prompt)
+
+        def complete(self, prompt, formatted=False, **kwargs):
+            with self._lock:
+                self._constrain(prompt)
+                return super().complete(prompt, formatted, **kwargs)
+
+        def stream_complete(self, prompt, formatted=False, **kwargs):
+            def generate():
+                with self._lock:
+                    self._constrain(prompt)
+                    yield from super(LocalLlamaCPP, self).stream_complete(
+                        prompt, formatted, **kwargs
+                    )
+
+            return generate()
+
+    return LocalLlamaCPP
+
+
+def load_gguf(model_path, n_threads=None, n_ctx=8192, n_batch=512):
+    """
+    Loads GGUF weights with llama.cpp for in-process CPU inference.
+
+    Args:
+        model_path (str): Path to the .gguf file.
+        n_threads (int, optional): CPU threads per call, defaults to
+                                   llama.cpp's choice.
+        n_ctx (int, optional): Context window in tokens.
+        n_batch (int, optional): Maximum tokens evaluated per decode call.
+
+    Returns:
+        Llama: The loaded model.
+    """
+    from llama_cpp import Llama
+
+    return Llama(
+        model_path=model_path,
+        n_threads=n_threads,
+        n_ctx=n_ctx,
+        n_batch=n_batch,
+        verbose=False,
+    )
+
+
 # Class to build Replicate object given a model path
 class Model:
     """
@@ -23,7 +117,14 @@ class Model:
         temperature (float): Temperature for controlling randomness of the
                              model.
         system_prompt (str): Default prompt used in model interactions.
-        llm (Replicate): An object to handle model inference through Replicate.
+        backend (str): "replicate" (remote API) or "local" (in-process CPU
+                       inference of quantized GGUF weights).
+        n_threads (int): CPU threads used by the local backend.
+        parallel (int): Requests the local backend decodes together.
+        constrained (bool): Whether the local backend decodes with the form
+                            grammar (see `src/grammar.py`).
+        llm (Replicate | LlamaCPP | BatchedLocalLLM): An object to handle
+                                                     model inference.
     """
 
     def __init__(
@@ -32,6 +133,11 @@ class Model:
         additional_args,
         temperature=0.1,
         system_prompt=form_completion_prompt,
+        backend="replicate",
+        n_threads=None,
+        context_window=8192,
+        parallel=1,
+        constrained=False,
     ):
         """
         Initializes the Model class with the given parameters.
@@ -42,12 +148,34 @@ class Model:
             temperature (float, optional): Randomness control, default is 0.1.
             system_prompt (str, optional): System prompt for model guidance.
                 Defaults to `form_completion_prompt`.
+            backend (str, optional): "replicate" (default) or "local", in
+                which case `model_path` is a .gguf file.
+            n_threads (int, optional): CPU threads for the local backend.
+            context_window (int, optional): Context window of the local
+                backend in tokens, per request.
+            parallel (int, optional): Above 1, concurrent requests to the
+                local backend are continuously batched, up to this many at
+                a time (see `src/batching.py`).
+            constrained (bool, optional): Whether the local backend only
+                generates outputs that follow the form grammar of the
+                fields each prompt asks for. Use it with
+                `interface_form_completion_prompt`.
         """
         self.model_path = model_path
         self.temperature = temperature
         self.additional_args = additional_args
         self.system_prompt = system_prompt
-        self.llm = self.create_replicate_object()
+        self.backend = backend
+        self.n_threads = n_threads
+        self.context_window = context_window
+        self.parallel = parallel
+        self.constrained = constrained
+        if backend == "replicate":
+            self.llm = self.create_replicate_object()
+        elif backend == "local":
+            self.llm = self.create_local_object()
+        else:
+            raise ValueError(f"Unknown model backend: {backend}")
 
     def create_replicate_object(self):
         """
@@ -67,21 +195,89 @@ class Model:
             system_prompt=self.system_prompt,
         )
 
+    def create_local_object(self):
+        """
+        Creates and returns a llama.cpp LLM that runs the quantized model
+        in-process on CPU, with the same system prompt and streaming
+        interface as the Replicate object.
+
+        Args:
+            None.
+
+        Returns:
+            LlamaCPP | BatchedLocalLLM: An LLM initialized with the local
+                weights, temperature, and additional arguments.
+        """
+        generate_kwargs = dict(self.additional_args)
+        max_new_tokens = generate_kwargs.pop("max_new_tokens", 500)
+        generate_kwargs.setdefault("stop", LLAMA3_STOP_SEQUENCES)
+        if self.parallel > 1:
+            from src.batching import BatchedLocalLLM, ContinuousBatchingScheduler
+
+            # The KV cache is shared by the sequences decoded together
+            llama = load_gguf(
+                self.model_path,
+                self.n_threads,
+                self.context_window * self.parallel,
+            )
+            return BatchedLocalLLM(
+                ContinuousBatchingScheduler(llama, max_sequences=self.parallel),
+                context_window=self.context_window,
+                num_output=max_new_tokens,
+                temperature=self.temperature,
+                stop=generate_kwargs["stop"],
+                constrained=self.constrained,
+                model_name=self.model_path,
+                completion_to_prompt=self.format_prompt,
+            )
+        return local_llm_class()(
+            model_path=self.model_path,
+            temperature=self.temperature,
+            max_new_tokens=max_new_tokens,
+            context_window=self.context_window,
+            generate_kwargs=generate_kwargs,
+            model_kwargs={"n_threads": self.n_threads},
+            completion_to_prompt=self.format_prompt,
+            verbose=False,
+            constrained=self.constrained,
+        )
+
+    def format_prompt(self, prompt):
+        """
+        Applies the Llama 3 chat template and system prompt for the local
+        backend.
+
+        Args:
+            prompt (str): The user prompt.
+
+        Returns:
+            str: The formatted prompt.
+        """
+        return LLAMA3_PROMPT_TEMPLATE.format(
+            system_prompt=self.system_prompt, prompt=prompt
+        )
+
 
 class FeedbackModel:
     """
-    A class to represent a feedback model using Replicate API.
+    A class to represent a feedback model using Replicate API, or a local
+    quantized model.
 
     Attributes:
-        model_path (str): Path to the model on Replicate.
+        model_path (str): Path to the model on Replicate (or .gguf file).
         temperature (float): Temperature for controlling randomness of the
                              model.
+        backend (str): "replicate" or "local".
+        n_threads (int): CPU threads used by the local backend.
     """
 
     def __init__(
         self,
         model_path="meta/meta-llama-3-8b-instruct",
         temperature=0.7,
+        backend="replicate",
+        n_threads=None,
+        context_window=8192,
     ):
         """
         Initializes the FeedbackModel class with the given model path and
@@ -91,14 +287,25 @@ class FeedbackModel:
             model_path (str, optional): The path to the model on Replicate.
                 Defaults to "meta/meta-llama-3-8b-instruct".
             temperature (float, optional): Randomness control, default is 0.7.
+            backend (str, optional): "replicate" (default) or "local".
+            n_threads (int, optional): CPU threads for the local backend.
+            context_window (int, optional): Context window of the local
+                backend in tokens.
         """
+        if backend not in ("replicate", "local"):
+            raise ValueError(f"Unknown model backend: {backend}")
         self.model_path = model_path
         self.temperature = temperature
+        self.backend = backend
+        self.n_threads = n_threads
+        self.context_window = context_window
+        self._local = None
+        self._lock = threading.Lock()
 
     def run_model(self, system_prompt, prompt):
         """
-        Runs the feedback model on Replicate with the given system prompt and
-        user prompt.
+        Runs the feedback model on Replicate (or locally) with the given
+        system prompt and user prompt.
 
         Args:
             system_prompt (str): The system prompt to guide the model's
@@ -108,6 +315,8 @@ class FeedbackModel:
         Returns:
             str: The output generated by the model after processing the input.
         """
+        if self.backend == "local":
+            return self.run_local_model(system_prompt, prompt)
         output = ""
         for event in replicate.stream(
             self.model_path,
@@ -117,20 +326,46 @@ class FeedbackModel:
                 "system_prompt": system_prompt,
                 "length_penalty": 1,
                 "max_new_tokens": 2500,
-                "stop_sequences": "<|end_of_text|>,<|eot_id|>",
-                "prompt_template": (
-                    "<|begin_of_text|><|start_header_id|>system"
-                    "<|end_header_id|>\n\n{system_prompt}"
-                    "<|eot_id|><|start_header_id|>user<|end_header_id|>\n\n"
-                    "{prompt}<|eot_id|><|start_header_id|>assistant"
-                    "<|end_header_id|>\n\n"
-                ),
+                "stop_sequences": ",".join(LLAMA3_STOP_SEQUENCES),
+                "prompt_template": LLAMA3_PROMPT_TEMPLATE,
                 "presence_penalty": 0,
             },
         ):
             output += str(event)
         return output
 
+    def run_local_model(self, system_prompt, prompt):
+        """
+        Runs the feedback model in-process on CPU, streaming the tokens of
+        the same Llama 3 prompt the Replicate backend uses. The weights are
+        loaded on the first call.
+
+        Args:
+            system_prompt (str): The system prompt to guide the model's
+                                 behavior.
+            prompt (str): The user prompt to generate a response for.
+
+        Returns:
+            str: The output generated by the model after processing the input.
+        """
+        output = ""
+        with self._lock:
+            if self._local is None:
+                self._local = load_gguf(
+                    self.model_path, self.n_threads, self.context_window
+                )
+            for chunk in self._local.create_completion(
+                LLAMA3_PROMPT_TEMPLATE.format(
+                    system_prompt=system_prompt, prompt=prompt
+                ),
+                max_tokens=2500,
+                temperature=self.temperature,
+                stop=LLAMA3_STOP_SEQUENCES,
+                stream=True,
+            ):
+                output += chunk["choices"][0]["text"]
+        return output
+
 
 # Wrapper class to make OpenAI class function correctly
 class CustomOpenAI(OpenAI):
@@ -0,0 +1,216 @@
+"""
+This file contains the admission queue in front of the form completion
+engine
+
+Requests are admitted by Priority first ("High" before "Medium" before
+"Low"). Within a priority, departments share the engine by weighted fair
+queueing, so one department's backlog cannot starve the others. Every
+request has a deadline after which it is dropped instead of served, and
+when the queue is full the least urgent request is shed.
+"""
+
+import asyncio
+import itertools
+
+
+PRIORITY_ORDER = ("High", "Medium", "Low")
+
+# Seconds a request may wait for a slot, by priority
+DEFAULT_DEADLINES = {"High": 30.0, "Medium": 120.0, "Low": 600.0}
+
+
+class Rejected(Exception):
+    """
+    Raised when a request is not admitted.
+
+    Attributes:
+        reason (str): "shed" when the queue was full, "deadline" when the
+                      request waited past its deadline.
+    """
+
+    def __init__(self, reason):
+        super().__init__(f"request rejected: {reason}")
+        self.reason = reason
+
+
+class _Entry:
+    __slots__ = ("rank", "start", "sequence", "department", "deadline", "future")
+
+    def __init__(self, rank, start, sequence, department, deadline, future):
+        self.rank = rank
+        self.start = start
+        self.sequence = sequence
+        self.department = department
+        self.deadline = deadline
+        self.future = future
+
+    def key(self):
+        return (self.rank, self.start, self.sequence)
+
+
+class AdmissionQueue:
+    """
+    Admits at most `max_concurrency` requests at a time and queues up to
+    `capacity` more, ordered by priority, then by weighted fair share
+    across departments.
+
+    Attributes:
+        max_concurrency (int): Requests served at a time.
+        capacity (int): Requests allowed to wait.
+        department_weights (dict): Share of each department within a
+                                   priority (1.0 when not listed).
+        deadlines (dict): Default wait deadline in seconds per priority.
+        admitted (int): Requests admitted so far.
+        shed (int): Requests rejected because the queue was full.
+        expired (int): Requests dropped after their deadline.
+    """
+
+    def __init__(self, max_concurrency=8, capacity=64, department_weights=None,
+                 deadlines=None):
+        """
+        Initializes the AdmissionQueue class.
+
+        Args:
+            max_concurrency (int, optional): Requests served at a time.
+            capacity (int, optional): Requests allowed to wait.
+            department_weights (dict, optional): Weight of each department.
+            deadlines (dict, optional): Default deadline per priority.
+        """
+        self.max_concurrency = max_concurrency
+        self.capacity = capacity
+        self.department_weights = department_weights or {}
+        self.deadlines = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        self.admitted = 0
+        self.shed = 0
+        self.expired = 0
+        self._active = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._virtual_time = {}
+        self._finish_tags = {}
+
+    def __len__(self):
+        return len(self._queue)
+
+    @staticmethod
+    def rank(priority):
+        if priority in PRIORITY_ORDER:
+            return PRIORITY_ORDER.index(priority)
+        return PRIORITY_ORDER.index("Medium")
+
+    def _start_tag(self, rank, department):
+        # Start-time fair queueing: a department's next request starts when
+        # its previous one finishes in virtual time, or now if it was idle
+        key = (rank, department)
+        start = max(
+            self._virtual_time.get(rank, 0.0), self._finish_tags.get(key, 0.0)
+        )
+        weight = self.department_weights.get(department, 1.0)
+        self._finish_tags[key] = start + 1.0 / weight
+        return start
+
+    async def acquire(self, priority="Medium", department=None, deadline=None):
+        """
+        Waits until the request is admitted.
+
+        Args:
+            priority (str, optional): "High", "Medium" or "Low".
+            department (str, optional): Department used for fair sharing.
+            deadline (float, optional): Seconds the request may wait,
+                                        defaults to the priority's deadline.
+
+        Returns:
+            None.
+
+        Raises:
+            Rejected: If the request was shed or its deadline passed.
+        """
+        loop = asyncio.get_running_loop()
+        rank = self.rank(priority)
+        if deadline is None:
+            deadline = self.deadlines[PRIORITY_ORDER[rank]]
+        if self._active < self.max_concurrency and not self._queue:
+            self._active += 1
+            self.admitted += 1
+            return
+
+        entry = _Entry(
+            rank,
+            self._start_tag(rank, department),
+            next(self._sequence),
+            department,
+            loop.time() + deadline,
+            loop.create_future(),
+        )
+        self._queue.append(entry)
+        if len(self._queue) > self.capacity:
+            # Sheds the least urgent request, which may be this one
+            victim = max(self._queue, key=_Entry.key)
+            self._queue.remove(victim)
+            self.shed += 1
+            victim.future.set_exception(Rejected("shed"))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(entry.future), deadline)
+        except asyncio.TimeoutError:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                self.expired += 1
+                raise Rejected("deadline") from None
+            # Admitted just as the deadline passed
+            await entry.future
+        except asyncio.CancelledError:
+            if entry in self._queue:
+                self._queue.remove(entry)
+            elif entry.future.done() and not entry.future.exception():
+                self.release()
+            raise
+
+    def would_wait(self):
+        """
+        Tells whether a request arriving now would be queued, so that its
+        priority decides when it runs.
+
+        Args:
+            None.
+
+        Returns:
+            bool: True if every slot is taken or requests are waiting.
+        """
+        return self._active >= self.max_concurrency or bool(self._queue)
+
+    def is_full(self):
+        return len(self._queue) >= self.capacity
+
+    def release(self):
+        """
+        Frees the slot of a finished request and admits the next one.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self._active -= 1
+        now = asyncio.get_running_loop().time()
+        while self._queue and self._active < self.max_concurrency:
+            entry = min(self._queue, key=_Entry.key)
+            self._queue.remove(entry)
+            if entry.deadline <= now:
+                self.expired += 1
+                entry.future.set_exception(Rejected("deadline"))
+                continue
+            self._virtual_time[entry.rank] = entry.start
+            self._active += 1
+            self.admitted += 1
+            entry.future.set_result(None)
+
+    def stats(self):
+        return {
+            "active": self._active,
+            "queued": len(self._queue),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "expired": self.expired,
+        }
@@ -0,0 +1,335 @@
+"""
+This file contains the offline batch form completion command
+
+Usage:
+    python -m src.batch summaries.txt -o forms.jsonl
+    cat summaries.jsonl | python -m src.batch - -o forms.jsonl
+
+Input is either plain text (one summary per line) or JSONL with a
+"summary" (or "description") field and an optional "id". Completed forms
+are appended to the output as JSONL as they finish; re-running the same
+command skips the entries already completed in the output (same id and
+summary), so the output doubles as the checkpoint.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llama_index.core import Settings
+from data.examples import maintenance_requests
+from src.engine import (
+    build_completion_prompt,
+    create_engine,
+    direct_parse_response,
+    model_version,
+)
+from models.models import llama3_8b_interface
+from src.embedding_cache import use_embedding_cache
+from src.jsonl import truncate_torn_line
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket that caps the number of LLM calls per
+    minute.
+
+    Attributes:
+        rate (float): Tokens added to the bucket per second.
+        capacity (float): Maximum number of tokens held by the bucket.
+    """
+
+    def __init__(self, requests_per_minute):
+        """
+        Initializes the RateLimiter class.
+
+        Args:
+            requests_per_minute (int): Sustained request rate.
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            wait_for = -self._tokens / self.rate if self._tokens < 0 else 0
+        # Sleeping outside the lock lets the other threads queue behind
+        if wait_for:
+            time.sleep(wait_for)
+
+
+def cache_key(summary, version=""):
+    """
+    Returns the cache key of a summary, ignoring case and whitespace.
+
+    Args:
+        summary (str): The summary of the problem.
+        version (str, optional): Model and prompt identity (see
+                                 `model_version`).
+
+    Returns:
+        str: Hex digest of the version and normalized summary.
+    """
+    normalized = " ".join(summary.lower().split())
+    return hashlib.sha256(f"{version}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+def read_summaries(source):
+    """
+    Reads (id, summary, error) tuples from a text or JSONL file, or stdin
+    for "-".
+
+    Args:
+        source (str): Input path, or "-" for stdin.
+
+    Returns:
+        generator: (id, summary, error) tuples. Lines without an id are
+                   numbered by their position in the input. Malformed JSON
+                   lines and entries without a summary have no summary and
+                   an error message instead, so they are reported as
+                   failures rather than stopping the batch.
+    """
+    file = sys.stdin if source == "-" else open(source)
+    try:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as error:
+                    yield str(number), None, f"Invalid JSON: {error}"
+                    continue
+                identifier = str(entry.get("id", number))
+                summary = entry.get("summary") or entry.get("description")
+                if isinstance(summary, str) and summary.strip():
+                    yield identifier, summary, None
+                else:
+                    yield identifier, None, "No summary or description"
+            else:
+                yield str(number), line, None
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def read_jsonl(path):
+    """
+    Streams the well-formed lines of a JSONL file, skipping a torn final
+    line left by an interrupted run.
+
+    Args:
+        path (str): Path to the JSONL file (may not exist).
+
+    Returns:
+        generator: The decoded lines.
+    """
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def complete_summary(engine, summary, limiter, retries=3):
+    """
+    Completes one form, retrying failed LLM calls with exponential backoff.
+
+    Args:
+        engine (QueryEngine): RAG based query engine.
+        summary (str): The summary of the problem.
+        limiter (RateLimiter): Shared LLM call rate limiter.
+        retries (int, optional): Attempts before giving up.
+
+    Returns:
+        dict: The completed form.
+    """
+    for attempt in range(retries):
+        limiter.acquire()
+        try:
+            response_text = engine.query(build_completion_prompt(summary)).response
+            return direct_parse_response(response_text)
+        except Exception:
+            if attempt == retries - 1:
+                raise
+            time.sleep(2**attempt + random.random())
+
+
+def run_batch(
+    engine,
+    summaries,
+    output_path,
+    cache_path=None,
+    llm=None,
+    concurrency=8,
+    requests_per_minute=120,
+    retries=3,
+):
+    """
+    Completes forms for many summaries with bounded concurrency. Results are
+    appended to `output_path` as they finish; entries completed there with
+    the same id and summary are skipped and summaries already in the cache
+    are not sent to the LLM.
+
+    Args:
+        engine (QueryEngine): RAG based query engine.
+        summaries (iterable): (id, summary, error) tuples (see
+                              `read_summaries`); those with an error are
+                              recorded as failed.
+        output_path (str): JSONL output (and checkpoint) file.
+        cache_path (str, optional): JSONL cache of completed forms keyed by
+                                    normalized summary, model and prompt,
+                                    shared across runs.
+        llm (LLM, optional): The LLM behind the engine, part of the cache
+                             key, defaults to `Settings.llm`.
+        concurrency (int, optional): LLM calls in flight.
+        requests_per_minute (int, optional): LLM call rate limit.
+        retries (int, optional): Attempts per summary.
+
+    Returns:
+        dict: Counts of completed, cached, failed and skipped summaries,
+              elapsed seconds and throughput.
+    """
+    # Appends must not be glued to a line torn by an interrupted run
+    truncate_torn_line(output_path)
+    if cache_path:
+        truncate_torn_line(cache_path)
+
+    # Only successful entries are checkpointed, so failures are retried.
+    # Plain-text ids are line numbers, so the summary is part of the key
+    done = {
+        (result["id"], cache_key(result["summary"]))
+        for result in read_jsonl(output_path)
+        if "form" in result
+    }
+    version = model_version(llm or Settings.llm)
+    cache = {}
+    if cache_path:
+        for entry in read_jsonl(cache_path):
+            cache[entry["key"]] = entry["form"]
+    limiter = RateLimiter(requests_per_minute)
+    stats = {"completed": 0, "cached": 0, "failed": 0, "skipped": 0}
+    lock = threading.Lock()
+    start = time.monotonic()
+
+    output = open(output_path, "a")
+    cache_file = open(cache_path, "a") if cache_path else None
+
+    def record(result, key=None):
+        # Writes are serialized so lines never interleave
+        with lock:
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            if key is not None and cache_file is not None:
+                entry = {"key": key, "form": result["form"]}
+                cache_file.write(json.dumps(entry) + "\n")
+                cache_file.flush()
+
+    def process(identifier, summary):
+        key = cache_key(summary, version)
+        try:
+            form = complete_summary(engine, summary, limiter, retries)
+        except Exception as error:
+            record({"id": identifier, "summary": summary, "error": repr(error)})
+            return "failed"
+        cache[key] = form
+        record({"id": identifier, "summary": summary, "form": form}, key)
+        return "completed"
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            for identifier, summary, error in summaries:
+                if summary is not None and (identifier, cache_key(summary)) in done:
+                    stats["skipped"] += 1
+                    continue
+                if error is not None:
+                    record({"id": identifier, "summary": summary, "error": error})
+                    stats["failed"] += 1
+                    continue
+                form = cache.get(cache_key(summary, version))
+                if form is not None:
+                    record({"id": identifier, "summary": summary, "form": form})
+                    stats["cached"] += 1
+                    continue
+
+                # Bounds the number of queued summaries to keep memory flat
+                if len(pending) >= 2 * concurrency:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        stats[future.result()] += 1
+                pending.add(executor.submit(process, identifier, summary))
+            for future in pending:
+                stats[future.result()] += 1
+    finally:
+        output.close()
+        if cache_file is not None:
+            cache_file.close()
+
+    stats["seconds"] = time.monotonic() - start
+    processed = stats["completed"] + stats["cached"] + stats["failed"]
+    stats["forms_per_second"] = processed / stats["seconds"] if processed else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Complete maintenance request forms in bulk."
+    )
+    parser.add_argument("input", help="Text or JSONL summaries, or - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="JSONL output")
+    parser.add_argument("--cache", default="model_results/batch_cache.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=120)
+    parser.add_argument("--retries", type=int, default=3)
+    args = parser.parse_args()
+
+    # Setting up RAG system
+    Settings.llm = llama3_8b_interface.llm
+    use_embedding_cache()
+    query_engine, _ = create_engine(Settings.llm, maintenance_requests)
+
+    run_stats = run_batch(
+        query_engine,
+        read_summaries(args.input),
+        args.output,
+        cache_path=args.cache,
+        llm=Settings.llm,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        retries=args.retries,
+    )
+    print(
+        f"Completed: {run_stats['completed']}, cached: {run_stats['cached']}, "
+        f"failed: {run_stats['failed']}, skipped: {run_stats['skipped']}\n"
+        f"Elapsed: {run_stats['seconds']:.1f}s, "
+        f"throughput: {run_stats['forms_per_second']:.2f} forms/s",
+        file=sys.stderr,
+    )
@@ -0,0 +1,593 @@
+"""
+This file contains the continuous batching scheduler of the local inference
+backend
+
+Concurrent generations share one llama.cpp context: every decode step
+evaluates one new token of each running sequence together with chunks of
+the prompts of newly admitted ones, in a single `llama_decode` call, and new
+requests are admitted between steps. Each sequence owns a KV cache sequence
+id that is released as soon as it finishes.
+"""
+
+import codecs
+import ctypes
+import queue
+import threading
+import time
+from collections import deque
+
+import llama_cpp
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+# Finished requests whose latencies `report` summarizes
+LATENCY_WINDOW = 10000
+
+
+class Generation:
+    """
+    One generation request, streamed back to its caller. Iterating over it
+    blocks until each piece of text is generated.
+
+    Attributes:
+        prompt_tokens (list): Tokens of the prompt.
+        max_tokens (int): Maximum number of generated tokens.
+        temperature (float): Sampling temperature, 0 for greedy decoding.
+        stop (list): Strings that end the generation.
+        tokens (list): Generated tokens.
+        text (str): Generated text.
+        submitted (float): Time the request was submitted.
+        first_token (float): Time the first token was generated.
+        finished (float): Time the generation finished.
+    """
+
+    __slots__ = (
+        "prompt_tokens",
+        "max_tokens",
+        "temperature",
+        "stop",
+        "tokens",
+        "text",
+        "submitted",
+        "first_token",
+        "finished",
+        "error",
+        "_grammar",
+        "_slot",
+        "_prefilled",
+        "_pieces",
+        "_decoder",
+    )
+
+    def __init__(self, prompt_tokens, max_tokens, temperature, stop):
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = stop
+        self.tokens = []
+        self.text = ""
+        self.submitted = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.error = None
+        self._grammar = None
+        self._slot = None
+        self._prefilled = 0
+        self._pieces = queue.Queue()
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def __iter__(self):
+        while True:
+            piece = self._pieces.get()
+            if piece is None:
+                break
+            yield piece
+        if self.error is not None:
+            raise self.error
+
+    def result(self):
+        """
+        Waits for the generation to finish.
+
+        Args:
+            None.
+
+        Returns:
+            str: The generated text.
+        """
+        for _ in self:
+            pass
+        return self.text
+
+    @property
+    def kv_tokens(self):
+        return len(self.prompt_tokens) + self.max_tokens
+
+
+class ContinuousBatchingScheduler:
+    """
+    Merges in-flight generation requests into shared decode steps on one
+    llama.cpp model (continuous batching).
+
+    Attributes:
+        llama (Llama): The loaded model, see `models.models.load_gguf`.
+        max_sequences (int): Maximum sequences decoded together.
+        n_batch (int): Maximum tokens evaluated per decode step.
+        n_ctx (int): KV cache size shared by all sequences, in tokens.
+    """
+
+    def __init__(self, llama, max_sequences=8, seed=0):
+        """
+        Initializes the ContinuousBatchingScheduler class and starts its
+        decode loop.
+
+        Args:
+            llama (Llama): The loaded model. Its context must be large
+                           enough for the prompts and outputs of
+                           `max_sequences` requests at once.
+            max_sequences (int, optional): Maximum sequences decoded
+                                           together, default is 8.
+            seed (int, optional): Sampling seed.
+        """
+        self.llama = llama
+        self.max_sequences = max_sequences
+        self.n_batch = llama.n_batch
+        self.n_ctx = llama.n_ctx()
+        self._ctx = llama.ctx
+        self._model = llama.model
+        self._n_vocab = llama.n_vocab()
+        self._rng = np.random.default_rng(seed)
+        self._token_ids = np.arange(self._n_vocab, dtype=np.intc)
+        self._candidates_data = np.recarray(
+            (self._n_vocab,),
+            dtype=np.dtype(
+                [("id", np.intc), ("logit", np.single), ("p", np.single)],
+                align=True,
+            ),
+        )
+        self._candidates = llama_cpp.llama_token_data_array(
+            data=self._candidates_data.ctypes.data_as(llama_cpp.llama_token_data_p),
+            size=self._n_vocab,
+            sorted=False,
+        )
+        self._waiting = queue.Queue()
+        self._running = []
+        self._free_slots = list(range(max_sequences))
+        self._stats_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._dead = False
+        self._requests = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._steps = 0
+        self._batched_sequences = 0
+        self._generated_tokens = 0
+        self._busy_seconds = 0.0
+        self._stop = threading.Event()
+
+        llama_cpp.llama_kv_cache_clear(self._ctx)
+        self._batch = llama_cpp.llama_batch_init(self.n_batch, 0, 1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._waiting.put(None)
+        self._thread.join()
+        llama_cpp.llama_batch_free(self._batch)
+
+    def submit(self, prompt, max_tokens=500, temperature=0.1, stop=(),
+               grammar=None):
+        """
+        Queues a generation request. It is admitted at the next decode step
+        with a free sequence and enough KV cache.
+
+        Args:
+            prompt (str): The fully formatted prompt, including the
+                          begin-of-text token.
+            max_tokens (int, optional): Maximum number of generated tokens.
+            temperature (float, optional): Sampling temperature.
+            stop (iterable, optional): Strings that end the generation.
+            grammar (LlamaGrammar, optional): Grammar the output must follow
+                                              (see `src/grammar.py`).
+
+        Returns:
+            Generation: The request, to iterate over or wait on.
+        """
+        tokens = self.llama.tokenize(
+            prompt.encode("utf-8"), add_bos=False, special=True
+        )
+        generation = Generation(tokens, max_tokens, temperature, list(stop))
+        if generation.kv_tokens > self.n_ctx:
+            raise ValueError(
+                f"Prompt and output ({generation.kv_tokens} tokens) exceed the "
+                f"context window of {self.n_ctx} tokens"
+            )
+        with self._submit_lock:
+            # The decode loop fails the waiting requests when it exits, so
+            # nothing may be queued after that
+            if self._dead:
+                raise RuntimeError("The batching scheduler is not running")
+            if grammar is not None:
+                # Each sequence advances its own copy of the grammar state
+                generation._grammar = llama_cpp.llama_grammar_copy(grammar.grammar)
+            self._waiting.put(generation)
+        return generation
+
+    def stream(self, prompt, **kwargs):
+        """
+        Generates text for a prompt, yielding it as it is decoded.
+
+        Args:
+            prompt (str): The fully formatted prompt.
+            **kwargs: Arguments of `submit`.
+
+        Returns:
+            generator: Pieces of the generated text.
+        """
+        yield from self.submit(prompt, **kwargs)
+
+    def report(self):
+        """
+        Reports the throughput and the latency of the finished requests.
+
+        Args:
+            None.
+
+        Returns:
+            dict: Aggregate generated tokens per second, the mean number of
+                  sequences per decode step, and p50/p95 time to first token
+                  and total latency in seconds over the last
+                  `LATENCY_WINDOW` requests.
+        """
+        with self._stats_lock:
+            requests = self._requests
+            latencies = list(self._latencies)
+            steps = self._steps
+            batched = self._batched_sequences
+            tokens = self._generated_tokens
+            busy = self._busy_seconds
+
+        def percentiles(values):
+            if not values:
+                return {"p50": None, "p95": None}
+            ordered = sorted(values)
+            return {
+                "p50": ordered[int(0.50 * (len(ordered) - 1))],
+                "p95": ordered[int(0.95 * (len(ordered) - 1))],
+            }
+
+        return {
+            "requests": requests,
+            "generated_tokens": tokens,
+            "tokens_per_second": tokens / busy if busy else 0.0,
+            "mean_batch_sequences": batched / steps if steps else 0.0,
+            "time_to_first_token": percentiles(
+                [first for first, _ in latencies if first is not None]
+            ),
+            "latency": percentiles([total for _, total in latencies]),
+        }
+
+    def _kv_in_use(self):
+        return sum(generation.kv_tokens for generation in self._running)
+
+    def _admit(self):
+        # Blocks only while nothing is running
+        while self._free_slots:
+            try:
+                generation = self._waiting.get(block=not self._running)
+            except queue.Empty:
+                return
+            if generation is None:
+                return
+            if self._running and (
+                self._kv_in_use() + generation.kv_tokens > self.n_ctx
+            ):
+                # Not enough KV cache yet; retried after the next step
+                self._requeue(generation)
+                return
+            generation._slot = self._free_slots.pop()
+            self._running.append(generation)
+
+    def _requeue(self, generation):
+        pending = [generation]
+        while True:
+            try:
+                pending.append(self._waiting.get_nowait())
+            except queue.Empty:
+                break
+        for item in pending:
+            self._waiting.put(item)
+
+    def _fill_batch(self):
+        batch = self._batch
+        entries = []
+
+        def add(token, position, slot, logits):
+            i = len(entries)
+            batch.token[i] = token
+            batch.pos[i] = position
+            batch.n_seq_id[i] = 1
+            batch.seq_id[i][0] = slot
+            batch.logits[i] = logits
+            entries.append(logits)
+
+        # One new token for every decoding sequence, then prompt chunks
+        sampling = []
+        for generation in self._running:
+            if generation.tokens:
+                position = len(generation.prompt_tokens) + len(generation.tokens) - 1
+                sampling.append((len(entries), generation))
+                add(generation.tokens[-1], position, generation._slot, True)
+        for generation in self._running:
+            remaining = len(generation.prompt_tokens) - generation._prefilled
+            budget = self.n_batch - len(entries)
+            if generation.tokens or remaining == 0 or budget == 0:
+                continue
+            chunk = min(remaining, budget)
+            start = generation._prefilled
+            for position in range(start, start + chunk):
+                last = position == len(generation.prompt_tokens) - 1
+                if last:
+                    sampling.append((len(entries), generation))
+                add(generation.prompt_tokens[position], position,
+                    generation._slot, last)
+            generation._prefilled += chunk
+        batch.n_tokens = len(entries)
+        return sampling
+
+    def _sample(self, index, generation):
+        logits = np.ctypeslib.as_array(
+            llama_cpp.llama_get_logits_ith(self._ctx, index),
+            shape=(self._n_vocab,),
+        )
+        if generation._grammar is not None:
+            # Masks the tokens the grammar does not allow next
+            data = self._candidates_data
+            data.id[:] = self._token_ids
+            data.logit[:] = logits
+            data.p[:] = 0.0
+            self._candidates.size = self._n_vocab
+            self._candidates.sorted = False
+            llama_cpp.llama_sample_grammar(
+                self._ctx, ctypes.byref(self._candidates), generation._grammar
+            )
+            logits = data.logit
+        temperature = generation.temperature
+        if temperature <= 0:
+            return int(np.argmax(logits))
+        candidates = np.argpartition(logits, -40)[-40:]
+        candidates = candidates[np.isfinite(logits[candidates])]
+        scaled = logits[candidates] / temperature
+        probabilities = np.exp(scaled - scaled.max())
+        probabilities /= probabilities.sum()
+        return int(self._rng.choice(candidates, p=probabilities))
+
+    def _emit(self, generation, token):
+        now = time.perf_counter()
+        if generation.first_token is None:
+            generation.first_token = now
+        generation.tokens.append(token)
+        if llama_cpp.llama_token_is_eog(self._model, token):
+            return True
+        if generation._grammar is not None:
+            llama_cpp.llama_grammar_accept_token(
+                generation._grammar, self._ctx, token
+            )
+        piece = generation._decoder.decode(self.llama.detokenize([token]))
+        text = generation.text + piece
+        for stop in generation.stop:
+            cut = text.find(stop)
+            if cut != -1:
+                piece = piece[: max(0, cut - len(generation.text))]
+                generation.text = text[:cut]
+                if piece:
+                    generation._pieces.put(piece)
+                return True
+        generation.text = text
+        if piece:
+            generation._pieces.put(piece)
+        return len(generation.tokens) >= generation.max_tokens
+
+    def _finish(self, generation, error=None):
+        generation.finished = time.perf_counter()
+        generation.error = error
+        try:
+            if generation._slot is not None:
+                llama_cpp.llama_kv_cache_seq_rm(
+                    self._ctx, generation._slot, -1, -1
+                )
+            if generation._grammar is not None:
+                llama_cpp.llama_grammar_free(generation._grammar)
+                generation._grammar = None
+        finally:
+            # The caller is woken up even if releasing the sequence failed
+            if generation in self._running:
+                self._free_slots.append(generation._slot)
+                self._running.remove(generation)
+            generation._pieces.put(None)
+            with self._stats_lock:
+                self._requests += 1
+                self._latencies.append(
+                    (
+                        generation.first_token - generation.submitted
+                        if generation.first_token is not None
+                        else None,
+                        generation.finished - generation.submitted,
+                    )
+                )
+                self._generated_tokens += len(generation.tokens)
+
+    def _step(self):
+        self._admit()
+        if not self._running:
+            return
+
+        start = time.perf_counter()
+        sampling = self._fill_batch()
+        status = llama_cpp.llama_decode(self._ctx, self._batch)
+        if status != 0:
+            raise RuntimeError(f"llama_decode failed with status {status}")
+        for index, generation in sampling:
+            token = self._sample(index, generation)
+            if self._emit(generation, token):
+                self._finish(generation)
+
+        with self._stats_lock:
+            self._steps += 1
+            self._batched_sequences += len(sampling)
+            self._busy_seconds += time.perf_counter() - start
+
+    def _fail_all(self, error):
+        for generation in list(self._running):
+            try:
+                self._finish(generation, error)
+            except Exception:
+                pass
+
+    def _run(self):
+        error = RuntimeError("The batching scheduler was closed")
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._step()
+                except Exception as step_error:
+                    # Fails the sequences of the broken step and keeps
+                    # serving the next requests
+                    self._fail_all(step_error)
+        except BaseException as fatal:
+            error = RuntimeError(f"The batching scheduler stopped: {fatal!r}")
+            raise
+        finally:
+            self._fail_all(error)
+            with self._submit_lock:
+                self._dead = True
+                while True:
+                    try:
+                        generation = self._waiting.get_nowait()
+                    except queue.Empty:
+                        break
+                    if generation is not None:
+                        self._finish(generation, error)
+
+
+class BatchedLocalLLM(CustomLLM):
+    """
+    A llama_index LLM that generates through a `ContinuousBatchingScheduler`,
+    so concurrent `generate_form_completion` calls share decode steps.
+
+    Attributes:
+        context_window (int): Context window of one request, in tokens.
+        num_output (int): Maximum generated tokens per request.
+        temperature (float): Sampling temperature.
+        stop (list): Strings that end a generation.
+        constrained (bool): Whether outputs must follow the grammar of the
+                            fields each prompt asks for (see
+                            `src/grammar.py`).
+        model_name (str): Path of the model weights.
+    """
+
+    context_window: int = Field(default=8192)
+    num_output: int = Field(default=500)
+    temperature: float = Field(default=0.1)
+    stop: list = Field(default_factory=list)
+    constrained: bool = Field(default=False)
+    model_name: str = Field(default="local")
+    _scheduler = PrivateAttr()
+
+    def __init__(self, scheduler, **kwargs):
+        """
+        Initializes the BatchedLocalLLM class.
+
+        Args:
+            scheduler (ContinuousBatchingScheduler): The shared scheduler.
+            **kwargs: Values for the fields listed above, and
+                      `completion_to_prompt` to apply the chat template.
+        """
+        super().__init__(**kwargs)
+        self._scheduler = scheduler
+
+    @classmethod
+    def class_name(cls):
+        return "BatchedLocalLLM"
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def metadata(self):
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.num_output,
+            model_name=self.model_name,
+        )
+
+    def _submit(self, prompt, formatted):
+        grammar = None
+        if self.constrained:
+            from src.grammar import grammar_for_prompt
+
+            grammar = grammar_for_prompt(prompt)
+        if not formatted:
+            prompt = self.completion_to_prompt(prompt)
+        return self._scheduler.submit(
+            prompt,
+            max_tokens=self.num_output,
+            temperature=self.temperature,
+            stop=self.stop,
+            grammar=grammar,
+        )
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        return CompletionResponse(text=self._submit(prompt, formatted).result())
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        generation = self._submit(prompt, formatted)
+
+        def generate():
+            text = ""
+            for piece in generation:
+                text += piece
+                yield CompletionResponse(text=text, delta=piece)
+
+        return generate()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    from data.examples import maintenance_requests
+    from models.models import LOCAL_MODEL_PATH, Model
+    from src.engine import build_completion_prompt
+    from src.prompts import interface_form_completion_prompt
+
+    parser = argparse.ArgumentParser(
+        description="Measure continuous batching on the local backend."
+    )
+    parser.add_argument("model_path", nargs="?", default=LOCAL_MODEL_PATH)
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--parallel", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    model = Model(
+        args.model_path,
+        {"max_new_tokens": 500},
+        system_prompt=interface_form_completion_prompt,
+        backend="local",
+        n_threads=args.threads,
+        parallel=args.parallel,
+    )
+    prompts = [
+        build_completion_prompt(record["Description of Issue"])
+        for record, _ in zip(maintenance_requests, range(args.requests))
+    ]
+    with ThreadPoolExecutor(args.requests) as pool:
+        list(pool.map(lambda prompt: model.llm.complete(prompt), prompts))
+    print(json.dumps(model.llm.scheduler.report(), indent=4))
@@ -0,0 +1,201 @@
+"""
+This file contains the local classifier that predicts the Department and
+Priority fields without an LLM call
+"""
+
+import time
+from collections import defaultdict
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from sklearn.linear_model import LogisticRegression
+from data.examples import maintenance_requests
+from src.engine import CLASSIFIED_FIELDS
+from src.vectors import top_k_indices
+
+
+class FieldClassifier:
+    """
+    Predicts ranked Department and Priority lists from a summary using
+    local sentence embeddings of the historical "Description of Issue"
+    texts, either by similarity-weighted k nearest neighbours or by a
+    logistic regression per field.
+
+    Evaluated records are always held out: "knn" skips the record itself
+    (leave-one-out), and "logistic" also fits one regression per fold
+    without that fold's records (k-fold cross-fitting).
+
+    Attributes:
+        method (str): "knn" or "logistic".
+        k (int): Number of neighbours for the "knn" method.
+        folds (int): Number of cross-fitting folds for the "logistic"
+                     method.
+        protocol (str): How evaluated records are held out.
+        model (SentenceTransformer): Local sentence embedding model.
+        embeddings (np.ndarray): Normalized embeddings of the training
+                                 descriptions.
+        labels (dict): Training labels per field.
+        classes (dict): Sorted distinct labels per field.
+    """
+
+    def __init__(self, records=maintenance_requests, method="knn", k=7,
+                 model_name="all-MiniLM-L6-v2", folds=5):
+        """
+        Initializes the FieldClassifier class and trains it.
+
+        Args:
+            records (Corpus | list, optional): Maintenance requests to train
+                                               on.
+            method (str, optional): "knn" (default) or "logistic".
+            k (int, optional): Neighbours for "knn", default is 7.
+            model_name (str, optional): Sentence transformer model name.
+            folds (int, optional): Cross-fitting folds for "logistic",
+                                   default is 5.
+        """
+        if method not in ("knn", "logistic"):
+            raise ValueError(f"Unknown classifier method: {method}")
+        self.method = method
+        self.k = k
+        self.folds = folds
+        self.model = SentenceTransformer(model_name)
+
+        descriptions = []
+        self.labels = {field: [] for field in CLASSIFIED_FIELDS}
+        for record in records:
+            descriptions.append(record["Description of Issue"])
+            for field in CLASSIFIED_FIELDS:
+                self.labels[field].append(record[field])
+        self.embeddings = self.embed(descriptions)
+        self.classes = {
+            field: sorted(set(labels)) for field, labels in self.labels.items()
+        }
+        self._codes = {
+            field: np.array(
+                [self.classes[field].index(label) for label in labels]
+            )
+            for field, labels in self.labels.items()
+        }
+
+        self._regressions = {}
+        self._fold_regressions = []
+        if method == "knn":
+            self.protocol = "leave-one-out"
+        else:
+            self.protocol = f"{folds}-fold cross-fitting"
+            self._regressions = self.fit(np.ones(len(descriptions), dtype=bool))
+            # Record i is evaluated by the regressions fit without fold i % folds
+            self._folds = np.arange(len(descriptions)) % folds
+            self._fold_regressions = [
+                self.fit(self._folds != fold) for fold in range(folds)
+            ]
+
+    def fit(self, mask):
+        """
+        Fits one logistic regression per field on a subset of the training
+        records.
+
+        Args:
+            mask (np.ndarray): Boolean mask of the records to train on.
+
+        Returns:
+            dict: Maps each field to its fitted regression.
+        """
+        return {
+            field: LogisticRegression(max_iter=1000).fit(
+                self.embeddings[mask], self._codes[field][mask]
+            )
+            for field in CLASSIFIED_FIELDS
+        }
+
+    def embed(self, texts):
+        """
+        Embeds texts with the local sentence embedding model.
+
+        Args:
+            texts (list): Texts to embed.
+
+        Returns:
+            np.ndarray: Normalized embeddings, one row per text.
+        """
+        return self.model.encode(
+            texts, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
+    def probabilities(self, vector, exclude=None):
+        """
+        Computes the probability of every label of every field.
+
+        Args:
+            vector (np.ndarray): Normalized summary embedding.
+            exclude (int, optional): Training record to hold out, for
+                                     evaluation (see `protocol`).
+
+        Returns:
+            dict: Maps each field to {label: probability}.
+        """
+        if self.method == "logistic":
+            regressions = self._regressions
+            if exclude is not None:
+                regressions = self._fold_regressions[self._folds[exclude]]
+            probabilities = {}
+            for field, regression in regressions.items():
+                # A fold may lack rare labels, which then get probability 0
+                probabilities[field] = dict.fromkeys(self.classes[field], 0.0)
+                probabilities[field].update(
+                    zip(
+                        [self.classes[field][code] for code in regression.classes_],
+                        regression.predict_proba(vector[None, :])[0],
+                    )
+                )
+            return probabilities
+
+        scores = self.embeddings @ vector
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        neighbours = top_k_indices(scores, self.k)
+        weights = np.maximum(scores[neighbours], 0.0) + 1e-6
+        probabilities = {}
+        for field in CLASSIFIED_FIELDS:
+            votes = defaultdict(float)
+            for neighbour, weight in zip(neighbours, weights):
+                votes[self.labels[field][neighbour]] += weight
+            total = sum(votes.values())
+            probabilities[field] = {
+                label: votes.get(label, 0.0) / total
+                for label in self.classes[field]
+            }
+        return probabilities
+
+    def classify(self, summary, exclude=None):
+        """
+        Predicts the ranked Department and Priority lists for a summary, in
+        the same format the LLM returns them.
+
+        Args:
+            summary (str): The summary of the problem.
+            exclude (int, optional): Training record to hold out.
+
+        Returns:
+            dict: Maps "Department" and "Priority" to their labels sorted in
+                  decreasing order of probability.
+        """
+        vector = self.embed([summary])[0]
+        return {
+            field: sorted(labels, key=labels.get, reverse=True)
+            for field, labels in self.probabilities(vector, exclude).items()
+        }
+
+    def timed_classify(self, summary, exclude=None):
+        """
+        Classifies a summary and measures the latency.
+
+        Args:
+            summary (str): The summary of the problem.
+            exclude (int, optional): Training record to hold out.
+
+        Returns:
+            tuple: The ranked fields and the elapsed seconds.
+        """
+        start = time.perf_counter()
+        fields = self.classify(summary, exclude)
+        return fields, time.perf_counter() - start
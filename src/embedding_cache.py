@@ -0,0 +1,216 @@
+"""
+This file contains the embedding cache shared by the Streamlit app, the
+evaluation harness and the batch jobs
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+
+DEFAULT_CACHE_PATH = "cache/embeddings.sqlite3"
+
+
+def normalize_text(text):
+    """
+    Normalizes text before it is embedded, so retries that differ only in
+    whitespace or Unicode form share one cache entry.
+
+    Args:
+        text (str): Text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model with an in-memory LRU cache backed by an
+    SQLite file. Keys combine the embedding model's identity and version,
+    whether the text is a query or a document, and the normalized text, so
+    upgrading the model never serves stale vectors.
+
+    Attributes:
+        model_version (str): Identity of the wrapped model used in the keys.
+        max_entries (int): Capacity of the in-memory LRU.
+        hits (int): Lookups served from the cache.
+        misses (int): Lookups sent to the wrapped model.
+    """
+
+    model_version: str = ""
+    max_entries: int = 4096
+    hits: int = 0
+    misses: int = 0
+    _model = PrivateAttr()
+    _path = PrivateAttr()
+    _version = PrivateAttr()
+    _lru = PrivateAttr()
+    _lock = PrivateAttr()
+    _db = PrivateAttr()
+
+    def __init__(self, model, path=DEFAULT_CACHE_PATH, version=None,
+                 max_entries=4096):
+        """
+        Initializes the CachedEmbedding class.
+
+        Args:
+            model (BaseEmbedding): The embedding model to wrap.
+            path (str, optional): SQLite cache file, or None for memory only.
+            version (str, optional): Extra version tag for the model, e.g.
+                                     a checkpoint date, appended to its
+                                     class and model name.
+            max_entries (int, optional): Capacity of the in-memory LRU.
+        """
+        model_version = f"{type(model).__name__}:{model.model_name}"
+        if version:
+            model_version += f":{version}"
+        super().__init__(
+            model_name=model.model_name,
+            embed_batch_size=model.embed_batch_size,
+            model_version=model_version,
+            max_entries=max_entries,
+        )
+        self._model = model
+        self._path = path
+        self._version = version
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    def __reduce__(self):
+        # Reopens the cache file when unpickled, e.g. in a worker process,
+        # since the connection and lock cannot be pickled
+        return (
+            type(self),
+            (self._model, self._path, self._version, self.max_entries),
+        )
+
+    def _key(self, kind, text):
+        digest = hashlib.sha256(
+            f"{self.model_version}\0{kind}\0{text}".encode("utf-8")
+        )
+        return digest.hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+            missing = [key for key in keys if key not in found]
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start : start + 500]
+                    rows = self._db.execute(
+                        "SELECT key, vector FROM embeddings WHERE key IN "
+                        f"({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+        return found
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _store(self, entries):
+        with self._lock:
+            for key, vector in entries:
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                    [
+                        (key, np.asarray(vector, dtype=np.float32).tobytes())
+                        for key, vector in entries
+                    ],
+                )
+                self._db.commit()
+
+    def _cached(self, kind, texts, compute):
+        texts = [normalize_text(text) for text in texts]
+        keys = [self._key(kind, text) for text in texts]
+        found = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = compute(list(missing.values()))
+            entries = list(zip(missing, vectors))
+            self._store(entries)
+            found.update(entries)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query):
+        return self._cached(
+            "query",
+            [query],
+            lambda texts: [self._model.get_query_embedding(texts[0])],
+        )[0]
+
+    async def _aget_query_embedding(self, query):
+        # Off the event loop, since the lookup reads SQLite and the wrapped
+        # model may embed synchronously
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._cached(
+            "text", texts, self._model.get_text_embedding_batch
+        )
+
+
+def use_embedding_cache(path=DEFAULT_CACHE_PATH, version=None):
+    """
+    Wraps `Settings.embed_model` with a `CachedEmbedding` (once), so every
+    index, retriever and job in the process shares the cache.
+
+    Args:
+        path (str, optional): SQLite cache file.
+        version (str, optional): Extra version tag for the model.
+
+    Returns:
+        CachedEmbedding: The cached embedding model now in `Settings`.
+    """
+    if not isinstance(Settings.embed_model, CachedEmbedding):
+        Settings.embed_model = CachedEmbedding(
+            Settings.embed_model, path=path, version=version
+        )
+    return Settings.embed_model
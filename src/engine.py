@@ -2,15 +2,23 @@
 This file creates the pipeline for form completion
 """
 
-import replicate
 import ast
+import hashlib
+import json
+import os
+import re
 from data.examples import maintenance_requests
+from data.corpus import MaintenanceRecord
 from src.prompts import (
     form_completion_prompt,
     interface_form_completion_prompt,
     feedback_prompt,
 )
 from llama_index.core import VectorStoreIndex, Document, Settings
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import MetadataMode, QueryBundle
+from src.postprocessors import AdaptiveTopKPostprocessor, DiversityPostprocessor
+from src.profiling import profiled
 from models.models import (
     llama3_8b,
     mixtral_7b,
@@ -19,6 +27,34 @@ from models.models import (
 )
 
 
+# Fields of a completed form, in output order
+FORM_FIELDS = (
+    "Department",
+    "Priority",
+    "Description of Issue",
+    "Requested Actions",
+    "Additional Notes",
+)
+
+# Fields that `FieldClassifier` can fill without the LLM
+CLASSIFIED_FIELDS = ("Department", "Priority")
+
+# Similarity above which the nearest record is returned without an LLM call,
+# used until the evaluation harness has calibrated a threshold
+DEFAULT_ESCALATION_THRESHOLD = 0.92
+ESCALATION_CONFIG = "model_results/escalation.json"
+
+# Descriptions of Issue the interface prompt asks the LLM for
+N_DESCRIPTIONS = 3
+
+# Sentence boundaries: end punctuation followed by a capitalized word, so
+# lowercase abbreviations such as "vlv." or "approx." do not split
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+
+# Calibrated thresholds by path, reloaded when the file changes
+_escalation_thresholds = {}
+
+
 def direct_parse_response(response_text):
     """
     Converts the string output into a dictionary for future function calls
@@ -53,31 +89,82 @@ def create_document(entry):
     Creates document objects from the RAG documents in dictionary form
 
     Args:
-        entry (dict): Dictionary that respresents the contents of the
-                            document.
+        entry (MaintenanceRecord | dict): The contents of the document, as a
+                                          record or a dictionary.
 
     Returns:
         Document: A Document object containing the form information.
     """
 
-    document = Document(
-        text="",
-        metadata={
-            "Form Type": entry["Form Type"],
-            "Request ID": entry["Request ID"],
-            "Date": entry["Date"],
-            "Requested By": entry["Requested By"],
-            "Department": entry["Department"],
-            "Priority": entry["Priority"],
-            "Description of Issue": entry["Description of Issue"],
-            "Additional Notes": entry["Additional Notes"],
-        },
-    )
+    # The metadata is a new dictionary, but its values are the record's
+    # strings, so every Document shares one interned Form Type, Department
+    # and Priority string per distinct value
+    if not isinstance(entry, MaintenanceRecord):
+        entry = MaintenanceRecord.from_dict(entry)
+    document = Document(text="", metadata=entry.to_dict())
 
     return document
 
 
-def create_engine(llm_config, requests):
+def iter_batches(entries, batch_size):
+    """
+    Groups an iterable into lists of at most `batch_size` items.
+
+    Args:
+        entries (iterable): Items to group.
+        batch_size (int): Maximum size of each group.
+
+    Returns:
+        generator: Lists of consecutive items.
+    """
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_index(requests, batch_size=1024, embed_model=None):
+    """
+    Embeds the maintenance requests into a vector store index.
+
+    Args:
+        requests (iterable): Maintanence request forms, e.g. a list or a
+                             lazily decoded `data.corpus.Corpus`.
+        batch_size (int, optional): Number of documents created and embedded
+                                    at a time, default is 1024.
+        embed_model (BaseEmbedding, optional): Embedding model, defaults to
+                                               `Settings.embed_model`.
+
+    Returns:
+        tuple: The index and the number of documents in it.
+    """
+
+    # Creates an empty index, then streams the documents into it in batches,
+    # so only one batch of Documents is built at a time. The in-memory index
+    # still keeps every node in its docstore; corpora that must stay on disk
+    # use `src.shared_index` instead.
+    index = VectorStoreIndex(nodes=[], embed_model=embed_model)
+    count = 0
+    for batch in iter_batches(requests, batch_size):
+        index.insert_nodes([create_document(entry) for entry in batch])
+        count += len(batch)
+    return index, count
+
+
+@profiled
+def create_engine(
+    llm_config,
+    requests,
+    batch_size=1024,
+    streaming=False,
+    diversify=False,
+    token_budget=None,
+    adaptive_top_k=False,
+):
     """
     Creates query engine for the RAG system based on the passed in
     LLM configuration and documents (requests)
@@ -85,44 +172,96 @@ def create_engine(llm_config, requests):
     Args:
         llm_config (Replicate): Replicate (API) object that represents
                                 a large language model (LLM).
-        requests (list): A list of maintanence request forms (represented as
-                         as dictionaries).
+        requests (iterable): Maintanence request forms (represented as
+                             as dictionaries), e.g. a list or a lazily
+                             decoded `data.corpus.Corpus`.
+        batch_size (int, optional): Number of documents created and embedded
+                                    at a time, default is 1024.
+        streaming (bool, optional): Whether the query engine streams the
+                                    LLM response, default is False.
+        diversify (bool, optional): Whether to retrieve a wider candidate
+                                    set and keep the 5 most relevant,
+                                    non-redundant documents (MMR).
+        token_budget (int, optional): Maximum tokens of document context
+                                      when diversifying.
+        adaptive_top_k (bool | AdaptiveTopKPostprocessor, optional): Whether
+            to keep between 1 and 5 documents depending on their score
+            distribution, or the postprocessor to do it with (e.g. with a
+            `log_path` for tuning).
 
     Returns:
-        tuple: Tuple containing the query engine and documents for future
-               use.
+        tuple: Tuple containing the query engine and the number of indexed
+               documents.
     """
 
-    # Creates list of document objects
-    documents = [create_document(entry) for entry in requests]
-
-    # Creates index for document storages
-    index = VectorStoreIndex.from_documents(
-        documents,
-        llm=llm_config,
-    )
+    index, count = build_index(requests, batch_size)
 
     # Retriever to fetch the top 5 most similar documents
-    retriever = index.as_retriever(search_type="similarity", top_k=5)
+    node_postprocessors = []
+    if diversify:
+        # Over-fetches candidates, then clusters near-duplicates and
+        # diversifies down to 5 (reusing the stored embeddings)
+        retriever = index.as_retriever(similarity_top_k=20)
+        node_postprocessors.append(
+            DiversityPostprocessor(
+                embedding_lookup=index.vector_store.get,
+                top_k=5,
+                token_budget=token_budget,
+            )
+        )
+    else:
+        retriever = index.as_retriever(similarity_top_k=5)
+    if adaptive_top_k:
+        # Cuts the (diversified) documents where their scores fall off
+        if not isinstance(adaptive_top_k, AdaptiveTopKPostprocessor):
+            adaptive_top_k = AdaptiveTopKPostprocessor(max_k=5)
+        node_postprocessors.append(adaptive_top_k)
 
     # creates the query engine and returns the document object for future calls
-    query_engine = index.as_query_engine(retriever=retriever, llm=llm_config)
-    return query_engine, documents
+    query_engine = create_query_engine(
+        retriever,
+        llm_config,
+        streaming=streaming,
+        node_postprocessors=node_postprocessors,
+    )
+    return query_engine, count
 
 
-# Pipeline that generates the form completion and outputs info to dictionary
-def generate_form_completion(engine, description):
+def create_query_engine(retriever, llm_config, **kwargs):
     """
-    Pipeline that generates the form completion and outputs the information
-    into a dictionary.
+    Creates a query engine over a retriever and keeps its LLM in
+    `query_engine.llm`, so the direct completion path runs on the same
+    model as `engine.query`.
+
+    Args:
+        retriever (BaseRetriever): Retriever of the engine.
+        llm_config (LLM): LLM of the engine, defaults to `Settings.llm`
+                          when None.
+        **kwargs: Further arguments of `RetrieverQueryEngine.from_args`.
+
+    Returns:
+        RetrieverQueryEngine: The query engine.
+    """
+    llm = llm_config or Settings.llm
+    query_engine = RetrieverQueryEngine.from_args(retriever, llm=llm, **kwargs)
+    query_engine.llm = llm
+    return query_engine
+
+
+def build_completion_prompt(description, fields=FORM_FIELDS, context=None):
+    """
+    Builds the query sent to the form completion engine for a description.
 
     Args:
-        engine (QueryEngine): RAG based query engine
         description (str): A description of the problem that will be used to
                            autocomplete the rest of the form.
+        fields (tuple, optional): Fields the model is asked to fill out,
+                                  defaults to all of them.
+        context (str, optional): Retrieved records to include in the prompt
+                                 (see `format_context`), for the direct path.
 
     Returns:
-        dict: A dictionary containing the completed form fields.
+        str: The full query, including the system prompt.
     """
 
     # Constructs the prompt using the description
@@ -131,23 +270,269 @@ def generate_form_completion(engine, description):
         f"the description, according to prompt details stated and the format "
         f"below:\nSummary of problem: '{description}'\n"
         f"Fill out the fields in the following format:\n"
-        f"Department: <Department>\n"
-        f"Priority: <Priority>\n"
-        f"Description of Issue: <Description of Issue>\n"
-        f"Requested Actions: <Requested Actions>\n"
-        f"Additional Notes: <Additional Notes>\n"
     )
+    prompt += "".join(f"{field}: <{field}>\n" for field in fields)
+    if context:
+        prompt = (
+            f"Here are past maintenance requests similar to this one:\n"
+            f"{context}\n" + prompt
+        )
+    return interface_form_completion_prompt + "\n" + prompt
+
+
+def model_version(llm):
+    """
+    Returns the identity of an LLM and of the completion prompt, so cached
+    forms are not reused across models or prompt changes.
+
+    Args:
+        llm (LLM): The LLM behind the query engine.
+
+    Returns:
+        str: The LLM class and model name, and a hash of the prompt.
+    """
+    prompt = hashlib.sha256(build_completion_prompt("").encode("utf-8"))
+    return f"{type(llm).__name__}:{llm.metadata.model_name}:{prompt.hexdigest()}"
+
+
+def format_context(nodes):
+    """
+    Formats retrieved records for the direct completion prompt.
+
+    Args:
+        nodes (list): Retrieved NodeWithScore objects.
+
+    Returns:
+        str: One numbered block of "Field: value" lines per record.
+    """
+    return "\n".join(
+        f"Record {number}:\n"
+        + node.node.get_content(metadata_mode=MetadataMode.LLM).strip()
+        + "\n"
+        for number, node in enumerate(nodes, 1)
+    )
+
+
+def engine_llm(engine):
+    """
+    Returns the LLM a query engine synthesizes its responses with.
+
+    Args:
+        engine (RetrieverQueryEngine): Engine returned by `create_engine` or
+                                       `create_query_engine`.
+
+    Returns:
+        LLM: The engine's LLM.
+    """
+    llm = getattr(engine, "llm", None)
+    if llm is None:
+        raise ValueError(
+            "The query engine has no LLM; create it with `create_query_engine`"
+        )
+    return llm
+
+
+def stream_direct_completion(engine, description, fields=FORM_FIELDS):
+    """
+    Completes a form with the engine's retriever and exactly one streaming
+    LLM call, bypassing the llama_index response synthesizer (its templates
+    and any refine calls).
+
+    Args:
+        engine (RetrieverQueryEngine): Engine returned by `create_engine`.
+        description (str): A description of the problem.
+        fields (tuple, optional): Fields the model is asked to fill out.
+
+    Returns:
+        generator: Pieces of the response text as they are generated.
+    """
+
+    # Retrieves with the same query as `engine.query`, so both paths see the
+    # same records
+    query = build_completion_prompt(description, fields)
+    nodes = engine.retrieve(QueryBundle(query))
+    prompt = build_completion_prompt(description, fields, format_context(nodes))
+    for chunk in engine_llm(engine).stream_complete(prompt):
+        yield chunk.delta or ""
+
+
+# Pipeline that generates the form completion and outputs info to dictionary
+@profiled
+def generate_form_completion(engine, description, classifier=None,
+                             request_id=None, direct=False):
+    """
+    Pipeline that generates the form completion and outputs the information
+    into a dictionary.
+
+    Args:
+        engine (QueryEngine): RAG based query engine
+        description (str): A description of the problem that will be used to
+                           autocomplete the rest of the form.
+        classifier (FieldClassifier, optional): Local classifier that fills
+                                                the Department and Priority
+                                                fields, leaving only the
+                                                free-text fields to the LLM.
+        request_id (str, optional): Names the profile files of this call
+                                    when profiling is enabled
+                                    (see `src/profiling.py`).
+        direct (bool, optional): Whether to skip the llama_index response
+                                 synthesizer and make exactly one streaming
+                                 LLM call with our own prompt (see
+                                 `stream_direct_completion`).
+
+    Returns:
+        dict: A dictionary containing the completed form fields.
+    """
+    fields = FORM_FIELDS
+    if classifier is not None:
+        fields = tuple(
+            field for field in FORM_FIELDS if field not in CLASSIFIED_FIELDS
+        )
 
     # Inputs prompt, system prompt, and description into form completion engine
-    response = engine.query(interface_form_completion_prompt + "\n" + prompt)
-    response_text = response.response
+    if direct:
+        response_text = "".join(
+            stream_direct_completion(engine, description, fields)
+        )
+    else:
+        response = engine.query(build_completion_prompt(description, fields))
+        response_text = response.response
 
     # Directly parse the response into a dictionary
     response_dict = direct_parse_response(response_text)
+    if classifier is not None:
+        response_dict.update(classifier.classify(description))
     return response_dict
 
 
-def generate_feedback(input, model_path):
+def load_escalation_threshold(path=ESCALATION_CONFIG):
+    """
+    Loads the similarity threshold calibrated by the evaluation harness
+    (see `testing.calibrate_escalation_threshold`).
+
+    Args:
+        path (str, optional): Path to the calibration file.
+
+    Returns:
+        float: The calibrated threshold, or the default when the harness
+               has not been run.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return DEFAULT_ESCALATION_THRESHOLD
+    cached = _escalation_thresholds.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path) as file:
+            threshold = json.load(file)["threshold"]
+    except (OSError, KeyError, ValueError):
+        threshold = DEFAULT_ESCALATION_THRESHOLD
+    _escalation_thresholds[path] = (mtime, threshold)
+    return threshold
+
+
+def nearest_records(engine, description, exclude_description=None):
+    """
+    Retrieves the historical records most similar to a description. The
+    description alone is embedded, without the completion prompt.
+
+    Args:
+        engine (QueryEngine): RAG based query engine.
+        description (str): A description of the problem.
+        exclude_description (str, optional): "Description of Issue" of a
+                                             record to leave out, for
+                                             leave-one-out calibration.
+
+    Returns:
+        list: NodeWithScore objects, most similar first.
+    """
+    nodes = engine.retrieve(QueryBundle(description))
+    if exclude_description is not None:
+        nodes = [
+            node
+            for node in nodes
+            if node.node.metadata["Description of Issue"] != exclude_description
+        ]
+    return sorted(nodes, key=lambda node: node.score or 0.0, reverse=True)
+
+
+def adapt_record_to_form(nodes):
+    """
+    Builds a completed form from the nearest historical records, in the
+    same format as the LLM output. The descriptions of the nearest distinct
+    records stand in for the LLM's alternative descriptions. Historical
+    records have no "Requested Actions", so they are taken from the action
+    sentences that follow the problem statement in the description.
+
+    Args:
+        nodes (list): Retrieved records, most similar first.
+
+    Returns:
+        dict: A dictionary containing the completed form fields, or None
+              when there are too few distinct records and the request
+              should be escalated to the LLM.
+    """
+    descriptions = []
+    for node in nodes:
+        description = node.node.metadata["Description of Issue"]
+        if description not in descriptions:
+            descriptions.append(description)
+    if len(descriptions) < N_DESCRIPTIONS:
+        return None
+    nearest = nodes[0].node.metadata
+    sentences = [
+        sentence.strip().rstrip(".")
+        for sentence in SENTENCE_BOUNDARY.split(nearest["Description of Issue"])
+        if sentence.strip(" .")
+    ]
+
+    # Ranks labels by the order they appear among the neighbours
+    def ranked(field):
+        labels = []
+        for node in nodes:
+            label = node.node.metadata[field]
+            if label not in labels:
+                labels.append(label)
+        return labels
+
+    return {
+        "Department": ranked("Department"),
+        "Priority": ranked("Priority"),
+        "Description of Issue": descriptions[:N_DESCRIPTIONS],
+        "Requested Actions": sentences[1:] or sentences,
+        "Additional Notes": nearest["Additional Notes"],
+    }
+
+
+def generate_gated_form_completion(engine, description, threshold=None):
+    """
+    Answers from the nearest historical record when it is similar enough,
+    and escalates to the full RAG generation otherwise.
+
+    Args:
+        engine (QueryEngine): RAG based query engine.
+        description (str): A description of the problem that will be used to
+                           autocomplete the rest of the form.
+        threshold (float, optional): Similarity at or above which no LLM
+                                     call is made. Defaults to the value
+                                     calibrated by the evaluation harness.
+
+    Returns:
+        tuple: The completed form and whether it came from the LLM.
+    """
+    if threshold is None:
+        threshold = load_escalation_threshold()
+    nodes = nearest_records(engine, description)
+    if nodes and (nodes[0].score or 0.0) >= threshold:
+        form = adapt_record_to_form(nodes)
+        if form is not None:
+            return form, False
+    return generate_form_completion(engine, description), True
+
+
+def generate_feedback(input, feedback_model=llama3_8b_feedback):
     """
     Takes in initial form completion and makes adjustments according to
     user feedback.
@@ -155,6 +540,9 @@ def generate_feedback(input, model_path):
     Args:
         input (str): User description of what needs to be changed to
                      improve form completion.
+        feedback_model (FeedbackModel, optional): Model that regenerates
+                                                  the fields, on Replicate
+                                                  or local.
 
     Returns:
         dict: A dictionary containing the regenerated fields according
@@ -178,27 +566,7 @@ def generate_feedback(input, model_path):
     )
 
     # System to regenerate form based on user feedback
-    output = ""
-    for event in replicate.stream(
-        model_path,
-        input={
-            "prompt": prompt,
-            "temperature": 0.7,
-            "system_prompt": feedback_prompt,
-            "length_penalty": 1,
-            "max_new_tokens": 2500,
-            "stop_sequences": "<|end_of_text|>,<|eot_id|>",
-            "prompt_template": (
-                "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n"
-                "{system_prompt}"
-                "<|eot_id|><|start_header_id|>user<|end_header_id|>\n\n"
-                "{prompt}"
-                "<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
-            ),
-            "presence_penalty": 0,
-        },
-    ):
-        output += str(event)
+    output = feedback_model.run_model(feedback_prompt, prompt)
 
     # Parses llm output into dictionary format
     response_dict = direct_parse_response(output)
@@ -209,7 +577,7 @@ if __name__ == "__main__":
 
     # Setting up RAG system
     Settings.llm = llama3_8b_interface.llm
-    query_engine, documents = create_engine(Settings.llm, maintenance_requests)
+    query_engine, _ = create_engine(Settings.llm, maintenance_requests)
 
     print(
         generate_form_completion(
@@ -0,0 +1,398 @@
+"""
+This file contains the concurrent pipeline for generating synthetic
+maintenance request forms at scale
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import os
+import random
+import time
+
+import numpy as np
+import openai
+from sentence_transformers import SentenceTransformer
+from src.prompts import data_generation_prompt, synthetic_prompt
+
+
+# Fields every generated maintenance request must contain
+REQUIRED_FIELDS = (
+    "Form Type",
+    "Request ID",
+    "Date",
+    "Requested By",
+    "Department",
+    "Priority",
+    "Description of Issue",
+    "Additional Notes",
+)
+
+VALID_PRIORITIES = ("Low", "Medium", "High")
+
+
+class RateLimiter:
+    """
+    An asyncio token bucket that caps the number of API requests per minute.
+
+    Attributes:
+        rate (float): Tokens added to the bucket per second.
+        capacity (float): Maximum number of tokens held by the bucket.
+        tokens (float): Tokens currently available.
+        updated (float): Monotonic time of the last refill.
+    """
+
+    def __init__(self, requests_per_minute, burst=None):
+        """
+        Initializes the RateLimiter class.
+
+        Args:
+            requests_per_minute (int): Sustained request rate.
+            burst (int, optional): Bucket size, defaults to one second of
+                                   requests (at least 1).
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(self.rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until a request may be sent.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_samples(response_text):
+    """
+    Parses the raw model output into a list of dictionaries. The model is
+    asked for a bare Python list, but code fences and surrounding prose are
+    tolerated.
+
+    Args:
+        response_text (str): Raw text returned by the model.
+
+    Returns:
+        list: The parsed samples, or an empty list if the text could not be
+              parsed.
+    """
+    start = response_text.find("[")
+    end = response_text.rfind("]")
+    if start == -1 or end <= start:
+        return []
+    try:
+        samples = ast.literal_eval(response_text[start : end + 1])
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return []
+    if not isinstance(samples, list):
+        return []
+    return [sample for sample in samples if isinstance(sample, dict)]
+
+
+def validate_sample(sample):
+    """
+    Checks that a generated sample follows the maintenance request schema.
+
+    Args:
+        sample (dict): A single generated maintenance request.
+
+    Returns:
+        dict: The sample restricted to the schema fields with whitespace
+              stripped, or None if the sample is invalid.
+    """
+    record = {}
+    for field in REQUIRED_FIELDS:
+        value = sample.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        record[field] = value.strip()
+    if record["Priority"] not in VALID_PRIORITIES:
+        return None
+    return record
+
+
+class Deduplicator:
+    """
+    Drops samples whose "Description of Issue" is a near-duplicate of an
+    already accepted sample, using cosine similarity of sentence embeddings.
+
+    Attributes:
+        model (SentenceTransformer): Model used to embed the descriptions.
+        threshold (float): Similarity at or above which a sample is dropped.
+        embeddings (np.ndarray): Normalized embeddings of accepted samples.
+        size (int): Number of accepted samples.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", threshold=0.9):
+        """
+        Initializes the Deduplicator class.
+
+        Args:
+            model_name (str, optional): Sentence transformer model name.
+            threshold (float, optional): Cosine similarity cut-off, default
+                                         is 0.9.
+        """
+        self.model = SentenceTransformer(model_name)
+        self.threshold = threshold
+        dim = self.model.get_sentence_embedding_dimension()
+        self.embeddings = np.empty((1024, dim), dtype=np.float32)
+        self.size = 0
+
+    def _append(self, vector):
+        # Grows the buffer geometrically so appends stay amortized O(1)
+        if self.size == len(self.embeddings):
+            grown = np.empty(
+                (2 * len(self.embeddings), self.embeddings.shape[1]),
+                dtype=np.float32,
+            )
+            grown[: self.size] = self.embeddings[: self.size]
+            self.embeddings = grown
+        self.embeddings[self.size] = vector
+        self.size += 1
+
+    def filter(self, samples):
+        """
+        Returns the samples that are not near-duplicates of previously
+        accepted samples (or of each other) and records them as accepted.
+
+        Args:
+            samples (list): Validated samples in dictionary form.
+
+        Returns:
+            list: The accepted samples, in their original order.
+        """
+        if not samples:
+            return []
+        vectors = self.model.encode(
+            [sample["Description of Issue"] for sample in samples],
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).astype(np.float32)
+
+        accepted = []
+        for sample, vector in zip(samples, vectors):
+            if self.size:
+                similarity = self.embeddings[: self.size] @ vector
+                if similarity.max() >= self.threshold:
+                    continue
+            self._append(vector)
+            accepted.append(sample)
+        return accepted
+
+
+async def request_samples(client, limiter, system_prompt, max_tokens,
+                          temperature, max_retries=5):
+    """
+    Sends one generation request, retrying with exponential backoff on
+    rate limit and transient API errors.
+
+    Args:
+        client (openai.AsyncOpenAI): Async OpenAI client.
+        limiter (RateLimiter): Shared request rate limiter.
+        system_prompt (str): System prompt for the generation.
+        max_tokens (int): Token limit for the response.
+        temperature (float): Sampling temperature.
+        max_retries (int, optional): Attempts before giving up, default is 5.
+
+    Returns:
+        str: The raw model output, or an empty string if every attempt
+             failed.
+    """
+    for attempt in range(max_retries):
+        await limiter.acquire()
+        try:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": synthetic_prompt},
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            return response.choices[0].message.content.strip()
+        except (openai.RateLimitError, openai.APIConnectionError,
+                openai.APITimeoutError, openai.InternalServerError):
+            await asyncio.sleep(2**attempt + random.random())
+    return ""
+
+
+def load_existing(output_path):
+    """
+    Loads the records already written by a previous (interrupted) run, and
+    truncates the file after the last complete record, so a torn final line
+    from a crash is regenerated instead of having new records glued to it.
+
+    Args:
+        output_path (str): Path to the JSONL output file.
+
+    Returns:
+        list: Previously accepted records.
+    """
+    if not os.path.exists(output_path):
+        return []
+    records = []
+    end = 0
+    with open(output_path, "rb+") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+            end += len(line)
+        file.truncate(end)
+    return records
+
+
+async def generate_corpus(
+    output_path,
+    n_records,
+    system_prompt=data_generation_prompt,
+    concurrency=16,
+    requests_per_minute=500,
+    similarity_threshold=0.9,
+    max_tokens=2500,
+    temperature=0.7,
+    first_request_id=12345,
+    max_requests=None,
+    max_consecutive_failures=50,
+):
+    """
+    Generates synthetic maintenance requests with many concurrent GPT-4o
+    calls. Samples are parsed, validated and deduplicated as each response
+    arrives, and accepted records are appended to a JSONL file immediately,
+    so an interrupted run can be resumed by calling this again.
+
+    Args:
+        output_path (str): Path to the JSONL output file.
+        n_records (int): Number of accepted records to produce in total.
+        system_prompt (str, optional): System prompt for the generation.
+        concurrency (int, optional): Number of requests in flight.
+        requests_per_minute (int, optional): Request rate limit.
+        similarity_threshold (float, optional): Near-duplicate cut-off.
+        max_tokens (int, optional): Token limit per response.
+        temperature (float, optional): Sampling temperature.
+        first_request_id (int, optional): Number used for the first
+                                          "Request ID" ("NAV-<number>").
+        max_requests (int, optional): Requests sent before giving up,
+                                      defaults to 10 per missing record.
+        max_consecutive_failures (int, optional): Requests in a row that
+                                                  may fail or add no record
+                                                  before giving up.
+
+    Returns:
+        dict: Statistics about the run, with the number of records still
+              missing as "shortfall" when it gave up.
+    """
+    client = openai.AsyncOpenAI()
+    limiter = RateLimiter(requests_per_minute)
+    deduplicator = Deduplicator(threshold=similarity_threshold)
+    accept_lock = asyncio.Lock()
+    stats = {"requests": 0, "parsed": 0, "valid": 0, "accepted": 0}
+
+    # Seeds the deduplicator with the records from a previous run
+    existing = load_existing(output_path)
+    deduplicator.filter(existing)
+    stats["accepted"] = len(existing)
+    if max_requests is None:
+        max_requests = 10 * max(0, n_records - len(existing))
+    sent = 0
+    failures = 0
+    start = time.monotonic()
+
+    with open(output_path, "a") as file:
+
+        async def worker():
+            nonlocal sent, failures
+            while stats["accepted"] < n_records:
+                # Gives up instead of spinning when requests keep failing or
+                # every sample is rejected
+                if sent >= max_requests or failures >= max_consecutive_failures:
+                    return
+                sent += 1
+                text = await request_samples(
+                    client, limiter, system_prompt, max_tokens, temperature
+                )
+                stats["requests"] += 1
+                samples = parse_samples(text)
+                stats["parsed"] += len(samples)
+                samples = [
+                    record
+                    for record in map(validate_sample, samples)
+                    if record is not None
+                ]
+                stats["valid"] += len(samples)
+
+                # Deduplication and writing happen one batch at a time so the
+                # accepted set stays consistent across workers
+                async with accept_lock:
+                    remaining = n_records - stats["accepted"]
+                    if remaining <= 0:
+                        return
+                    accepted = await asyncio.to_thread(
+                        deduplicator.filter, samples
+                    )
+                    for record in accepted[:remaining]:
+                        record["Request ID"] = (
+                            f"NAV-{first_request_id + stats['accepted']}"
+                        )
+                        file.write(json.dumps(record) + "\n")
+                        stats["accepted"] += 1
+                    file.flush()
+                    failures = 0 if accepted else failures + 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    stats["seconds"] = time.monotonic() - start
+    if stats["accepted"] < n_records:
+        stats["shortfall"] = n_records - stats["accepted"]
+    return stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic maintenance requests as JSONL."
+    )
+    parser.add_argument("output", help="Path to the JSONL output file")
+    parser.add_argument("-n", "--n-records", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rpm", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    args = parser.parse_args()
+
+    run_stats = asyncio.run(
+        generate_corpus(
+            args.output,
+            args.n_records,
+            concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            similarity_threshold=args.threshold,
+        )
+    )
+    print(run_stats)
+    if "shortfall" in run_stats:
+        print(
+            f"Gave up {run_stats['shortfall']} records short of {args.n_records}"
+        )
@@ -0,0 +1,174 @@
+"""
+This file contains the grammar that constrains local decoding to the form
+schema
+
+The grammar (GBNF, as understood by llama.cpp) only admits the completed
+form fields, one per line and in order: Department and Priority as lists of
+known labels, exactly three Description of Issue strings, a list of
+Requested Actions and an Additional Notes string. Every output it admits is
+parsed by `direct_parse_response`, and generation ends after the last field.
+"""
+
+import functools
+import json
+
+from data.examples import maintenance_requests
+from src.engine import FORM_FIELDS
+
+
+PRIORITIES = ("High", "Medium", "Low")
+
+# Rules shared by every field
+STRING_RULES = r"""
+string ::= "\"" char* "\""
+char ::= [^"\\\n] | "\\" ["\\nt]
+strings ::= string (", " string)*
+"""
+
+
+def known_departments(records=maintenance_requests):
+    """
+    Returns the distinct departments of the maintenance requests.
+
+    Args:
+        records (Corpus | list, optional): Maintenance requests.
+
+    Returns:
+        list: Sorted department names.
+    """
+    if hasattr(records, "column"):
+        return sorted(set(records.column("Department")))
+    return sorted({record["Department"] for record in records})
+
+
+def literal(text):
+    """
+    Quotes text as a GBNF string literal.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The literal.
+    """
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def label_list(rule, labels, max_items=None):
+    """
+    Builds the rules of a list of labels, in the format the interface prompt
+    returns them (e.g. ["High", "Medium"]).
+
+    Args:
+        rule (str): Name of the list rule.
+        labels (iterable): Allowed labels.
+        max_items (int, optional): Maximum number of labels, unbounded by
+                                   default.
+
+    Returns:
+        str: The GBNF rules.
+    """
+    item = f"{rule}-label"
+    choices = " | ".join(
+        literal(json.dumps(label, ensure_ascii=False)) for label in labels
+    )
+    if max_items is None:
+        rest = f'(", " {item})*'
+    else:
+        rest = " ".join(f'(", " {item})?' for _ in range(max_items - 1))
+    return f'{rule} ::= "[" {item} {rest} "]"\n{item} ::= {choices}\n'
+
+
+def form_grammar(fields=FORM_FIELDS, departments=None):
+    """
+    Builds the grammar of a completed form.
+
+    Args:
+        fields (tuple, optional): Fields to generate, in order, defaults to
+                                  all of them.
+        departments (list, optional): Allowed departments, defaults to the
+                                      ones in `maintenance_requests`.
+
+    Returns:
+        str: The GBNF grammar.
+    """
+    if departments is None:
+        departments = known_departments()
+    values = {
+        "Department": "department-list",
+        "Priority": "priority-list",
+        "Description of Issue": 'string ", " string ", " string',
+        "Requested Actions": "string-list",
+        "Additional Notes": "string",
+    }
+    lines = [f"field-{i}" for i in range(len(fields))]
+    grammar = f"root ::= {' '.join(lines)}\n"
+    for line, field in zip(lines, fields):
+        value = values[field]
+        if field == "Description of Issue":
+            value = f'"[" {value} "]"'
+        grammar += f'{line} ::= {literal(field + ": ")} {value} "\\n"\n'
+    grammar += label_list("department-list", departments)
+    grammar += label_list("priority-list", PRIORITIES, max_items=len(PRIORITIES))
+    grammar += 'string-list ::= "[" strings "]"\n'
+    return grammar + STRING_RULES.lstrip()
+
+
+def requested_fields(prompt):
+    """
+    Returns the fields a completion prompt asks for, from the
+    "<field>: <<field>>" lines written by `build_completion_prompt`.
+
+    Args:
+        prompt (str): The completion prompt.
+
+    Returns:
+        tuple: The requested fields in form order, all of them when the
+               prompt names none.
+    """
+    fields = tuple(field for field in FORM_FIELDS if f"{field}: <{field}>" in prompt)
+    return fields or FORM_FIELDS
+
+
+@functools.lru_cache(maxsize=None)
+def fields_grammar(fields):
+    """
+    Compiles the form grammar of some fields (once per field tuple).
+
+    Args:
+        fields (tuple): Fields to generate, in order.
+
+    Returns:
+        LlamaGrammar: The compiled grammar.
+    """
+    return load_grammar(form_grammar(fields))
+
+
+def grammar_for_prompt(prompt):
+    """
+    Returns the compiled grammar of the fields a prompt asks for, e.g. only
+    the free-text fields when the classifier fills Department and Priority.
+
+    Args:
+        prompt (str): The completion prompt.
+
+    Returns:
+        LlamaGrammar: The compiled grammar.
+    """
+    return fields_grammar(requested_fields(prompt))
+
+
+@functools.lru_cache(maxsize=None)
+def load_grammar(grammar):
+    """
+    Compiles a GBNF grammar for llama.cpp (once per grammar).
+
+    Args:
+        grammar (str): The GBNF grammar.
+
+    Returns:
+        LlamaGrammar: The compiled grammar.
+    """
+    from llama_cpp import LlamaGrammar
+
+    return LlamaGrammar.from_string(grammar, verbose=False)
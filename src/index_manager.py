@@ -0,0 +1,344 @@
+"""
+This file contains the versioned index manager, which rebuilds the index
+without taking the engine down
+
+Query engines are created once around a `SwappableRetriever`. A rebuild
+(new corpus or new embedding model) embeds the records into a new index in a
+background thread while the current version keeps serving, checks it with a
+smoke query set, then swaps it in with one reference assignment: retrievals
+already running finish on the old version, the next ones use the new one.
+Previous versions are kept so a bad rebuild can be rolled back.
+"""
+
+import collections
+import concurrent.futures
+import random
+import threading
+import time
+
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, QueryBundle
+from src.engine import build_index, create_query_engine
+from src.postprocessors import DiversityPostprocessor
+
+
+class IndexValidationError(Exception):
+    """
+    Raised when a rebuilt index fails its smoke queries; the serving version
+    is left in place.
+    """
+
+
+class IndexVersion:
+    """
+    One built index.
+
+    Attributes:
+        version (int): Increasing version number.
+        index (VectorStoreIndex): The index.
+        retriever (BaseRetriever): Retriever over the index.
+        embed_model (BaseEmbedding): Model the index was embedded with.
+        info (dict): Record count, build time and smoke query results.
+    """
+
+    def __init__(self, version, index, retriever, embed_model, info):
+        self.version = version
+        self.index = index
+        self.retriever = retriever
+        self.embed_model = embed_model
+        self.info = info
+
+
+class SwappableRetriever(BaseRetriever):
+    """
+    A retriever that delegates to the current index version. Each retrieval
+    reads the version once, so a swap never mixes two versions within one
+    query.
+
+    Attributes:
+        current (IndexVersion): The version serving retrievals.
+        query_embed_model (BaseEmbedding): Model callers may have embedded
+                                           queries with (e.g. the server's
+                                           retrieval batcher); precomputed
+                                           embeddings are dropped when the
+                                           current version uses another one.
+                                           Defaults to `Settings.embed_model`
+                                           at query time.
+    """
+
+    def __init__(self, query_embed_model=None, **kwargs):
+        self.current = None
+        self._query_embed_model = query_embed_model
+        super().__init__(**kwargs)
+
+    @property
+    def query_embed_model(self):
+        # Resolved on use, since `use_embedding_cache` may replace
+        # `Settings.embed_model` after the manager is created
+        return self._query_embed_model or Settings.embed_model
+
+    def _retrieve(self, query_bundle):
+        version = self.current
+        if version is None:
+            raise RuntimeError("No index version has been built yet")
+        if (
+            query_bundle.embedding is not None
+            and version.embed_model is not self.query_embed_model
+        ):
+            query_bundle = QueryBundle(
+                query_bundle.query_str,
+                custom_embedding_strs=query_bundle.custom_embedding_strs,
+            )
+        return version.retriever.retrieve(query_bundle)
+
+
+class IndexManager:
+    """
+    Builds, validates, swaps and rolls back index versions behind one
+    `SwappableRetriever`.
+
+    Attributes:
+        retriever (SwappableRetriever): Retriever to create engines with.
+        similarity_top_k (int): Records retrieved per query.
+        candidate_top_k (int): Records retrieved before diversifying, or
+                               None to not diversify.
+        smoke_queries (list): Queries every new version must answer.
+        smoke_sample (int): Records sampled from the new corpus to check
+                            that each retrieves itself.
+        min_self_recall (float): Share of sampled records that must retrieve
+                                 themselves.
+        keep (int): Versions kept, including the current one.
+    """
+
+    def __init__(self, similarity_top_k=5, diversify=False, token_budget=None,
+                 smoke_queries=(), smoke_sample=20, min_self_recall=0.8,
+                 keep=2, query_embed_model=None):
+        """
+        Initializes the IndexManager class.
+
+        Args:
+            similarity_top_k (int, optional): Records retrieved per query.
+            diversify (bool, optional): Whether engines over-fetch and
+                                        diversify, as in `create_engine`.
+            token_budget (int, optional): Maximum tokens of document context
+                                          when diversifying.
+            smoke_queries (iterable, optional): Descriptions every version
+                                                must retrieve records for.
+            smoke_sample (int, optional): Records checked for
+                                          self-retrieval.
+            min_self_recall (float, optional): Required self-retrieval rate.
+            keep (int, optional): Versions kept for rollback, at least 2.
+            query_embed_model (BaseEmbedding, optional): See
+                                                         `SwappableRetriever`.
+        """
+        self.retriever = SwappableRetriever(query_embed_model)
+        self.similarity_top_k = similarity_top_k
+        self.candidate_top_k = 20 if diversify else None
+        self.token_budget = token_budget
+        self.smoke_queries = list(smoke_queries)
+        self.smoke_sample = smoke_sample
+        self.min_self_recall = min_self_recall
+        self.keep = max(2, keep)
+        self._versions = collections.deque()
+        self._next_version = 1
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="index-build"
+        )
+
+    @property
+    def current(self):
+        return self.retriever.current
+
+    def create_engine(self, llm_config, streaming=False):
+        """
+        Creates a query engine that always retrieves from the current
+        version.
+
+        Args:
+            llm_config (Replicate): LLM of the engine.
+            streaming (bool, optional): Whether to stream the LLM response.
+
+        Returns:
+            RetrieverQueryEngine: The query engine.
+        """
+        node_postprocessors = []
+        if self.candidate_top_k is not None:
+            node_postprocessors.append(
+                DiversityPostprocessor(
+                    embedding_lookup=self.embedding_lookup,
+                    top_k=self.similarity_top_k,
+                    token_budget=self.token_budget,
+                )
+            )
+        return create_query_engine(
+            self.retriever,
+            llm_config,
+            streaming=streaming,
+            node_postprocessors=node_postprocessors,
+        )
+
+    def embedding_lookup(self, node_id):
+        # Nodes retrieved just before a swap belong to the previous version
+        for version in reversed(self._versions):
+            try:
+                return version.index.vector_store.get(node_id)
+            except KeyError:
+                continue
+        raise KeyError(node_id)
+
+    def build(self, requests, embed_model=None, batch_size=1024):
+        """
+        Builds and validates a new version without serving it.
+
+        Args:
+            requests (iterable): Maintenance requests to index.
+            embed_model (BaseEmbedding, optional): Embedding model, defaults
+                                                   to `Settings.embed_model`.
+            batch_size (int, optional): Records embedded per call.
+
+        Returns:
+            IndexVersion: The new version.
+
+        Raises:
+            IndexValidationError: If the version fails its smoke queries.
+        """
+        embed_model = embed_model or Settings.embed_model
+        with self._lock:
+            number = self._next_version
+            self._next_version += 1
+
+        start = time.perf_counter()
+        index, count = build_index(requests, batch_size, embed_model)
+        retriever = index.as_retriever(
+            similarity_top_k=self.candidate_top_k or self.similarity_top_k
+        )
+        info = {
+            "records": count,
+            "embed_model": embed_model.model_name,
+            "build_seconds": time.perf_counter() - start,
+            "built_at": time.time(),
+        }
+        version = IndexVersion(number, index, retriever, embed_model, info)
+        info["smoke"] = self.validate(version)
+        return version
+
+    def validate(self, version):
+        """
+        Runs the smoke queries against a version: every configured query
+        must retrieve records, and sampled records queried with their own
+        embedded text must retrieve themselves.
+
+        Args:
+            version (IndexVersion): The version to check.
+
+        Returns:
+            dict: The smoke query results.
+
+        Raises:
+            IndexValidationError: If a check fails.
+        """
+        node_ids = list(version.index.index_struct.nodes_dict)
+        if not node_ids:
+            raise IndexValidationError(f"Version {version.version} is empty")
+        for query in self.smoke_queries:
+            if not version.retriever.retrieve(query):
+                raise IndexValidationError(
+                    f"Version {version.version} retrieved nothing for {query!r}"
+                )
+
+        sample = random.Random(version.version).sample(
+            node_ids, min(self.smoke_sample, len(node_ids))
+        )
+        hits = 0
+        for node_id in sample:
+            document = version.index.docstore.get_node(node_id)
+            nodes = version.retriever.retrieve(
+                document.get_content(metadata_mode=MetadataMode.EMBED)
+            )
+            hits += any(node.node.metadata == document.metadata for node in nodes)
+        self_recall = hits / len(sample)
+        if self_recall < self.min_self_recall:
+            raise IndexValidationError(
+                f"Version {version.version} self-recall {self_recall:.2f} is "
+                f"below {self.min_self_recall:.2f}"
+            )
+        return {"queries": len(self.smoke_queries), "self_recall": self_recall}
+
+    def swap(self, version):
+        """
+        Serves a built version from the next retrieval on.
+
+        Args:
+            version (IndexVersion): The version to serve.
+
+        Returns:
+            IndexVersion: The version it replaced, or None.
+        """
+        with self._lock:
+            previous = self.retriever.current
+            if version in self._versions:
+                self._versions.remove(version)
+            self._versions.append(version)
+            while len(self._versions) > self.keep:
+                self._versions.popleft()
+            self.retriever.current = version
+        return previous
+
+    def rebuild(self, requests, embed_model=None, batch_size=1024,
+                background=True):
+        """
+        Builds, validates and swaps in a new version. Rebuilds run one at a
+        time; the current version serves until the swap.
+
+        Args:
+            requests (iterable): Maintenance requests to index.
+            embed_model (BaseEmbedding, optional): Embedding model.
+            batch_size (int, optional): Records embedded per call.
+            background (bool, optional): Whether to return immediately.
+
+        Returns:
+            Future | IndexVersion: A future of the new version when in the
+                                   background, else the new version.
+        """
+        def run():
+            version = self.build(requests, embed_model, batch_size)
+            self.swap(version)
+            return version
+
+        future = self._executor.submit(run)
+        return future if background else future.result()
+
+    def rollback(self):
+        """
+        Serves the previous version again and discards the current one.
+
+        Args:
+            None.
+
+        Returns:
+            IndexVersion: The version now serving.
+
+        Raises:
+            RuntimeError: If there is no previous version.
+        """
+        with self._lock:
+            if len(self._versions) < 2:
+                raise RuntimeError("No previous index version to roll back to")
+            self._versions.pop()
+            self.retriever.current = self._versions[-1]
+            return self.retriever.current
+
+    def status(self):
+        current = self.retriever.current
+        return {
+            "current": current.version if current else None,
+            "versions": [
+                dict(version.info, version=version.version)
+                for version in self._versions
+            ],
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
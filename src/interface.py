@@ -4,8 +4,28 @@ from src.engine import create_engine, generate_form_completion
 from data.examples import maintenance_requests
 from llama_index.core import Settings
 from models.models import llama3_8b_interface
+from src.embedding_cache import use_embedding_cache
 import os
 
+
+@st.cache_resource
+def load_engine():
+    """
+    Builds the RAG engine once per Streamlit server instead of on every
+    rerun. Document and query embeddings go through the shared embedding
+    cache, so rebuilds and repeated summaries skip the embedding calls.
+
+    Args:
+        None.
+
+    Returns:
+        RetrieverQueryEngine: The form completion engine.
+    """
+    use_embedding_cache()
+    query_engine, _ = create_engine(Settings.llm, maintenance_requests)
+    return query_engine
+
+
 if __name__ == "__main__":
 
     # Add this check to ensure the script runs as a Streamlit app
@@ -13,7 +33,7 @@ if __name__ == "__main__":
         os.system("streamlit run " + __file__)
     else:
         Settings.llm = llama3_8b_interface.llm
-        query_engine, documents = create_engine(Settings.llm, maintenance_requests)
+        query_engine = load_engine()
 
         # Streamlit application
         st.title("Interactive Form Completion")
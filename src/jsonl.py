@@ -0,0 +1,36 @@
+"""
+This file contains the JSONL helpers shared by the checkpointed evaluation
+and batch jobs
+"""
+
+import os
+
+
+def truncate_torn_line(path):
+    """
+    Drops a partially written final line left behind by a crash, so lines
+    appended by the next run are not glued to it. The file is read
+    backwards from the end in blocks.
+
+    Args:
+        path (str): Path to the JSONL file (may not exist).
+
+    Returns:
+        None.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as file:
+        size = file.seek(0, os.SEEK_END)
+        position = size
+        while position > 0:
+            start = max(0, position - 4096)
+            file.seek(start)
+            block = file.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != size:
+            file.truncate(position)
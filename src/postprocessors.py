@@ -0,0 +1,247 @@
+"""
+This file contains the node postprocessors applied to retrieved documents
+before they are put in the prompt
+"""
+
+import json
+import threading
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode
+from llama_index.core.utils import get_tokenizer
+from src.vectors import normalize
+
+
+class DiversityPostprocessor(BaseNodePostprocessor):
+    """
+    Removes redundant context from the retrieved documents. Candidates that
+    are near-duplicates of a better-scoring candidate are clustered with it
+    and dropped, then the remaining candidates are picked by maximal
+    marginal relevance (MMR) until `top_k` documents or the token budget is
+    reached.
+
+    Attributes:
+        top_k (int): Maximum number of documents to keep.
+        lambda_mult (float): MMR trade-off, 1.0 is pure relevance and 0.0
+                             pure diversity.
+        duplicate_threshold (float): Cosine similarity at or above which two
+                                     candidates are near-duplicates.
+        token_budget (int): Maximum tokens of document context, or None.
+    """
+
+    top_k: int = Field(default=5)
+    lambda_mult: float = Field(default=0.7)
+    duplicate_threshold: float = Field(default=0.95)
+    token_budget: int = Field(default=None)
+    _embed_model = PrivateAttr()
+    _embedding_lookup = PrivateAttr()
+    _tokenizer = PrivateAttr()
+
+    def __init__(self, embed_model=None, embedding_lookup=None, **kwargs):
+        """
+        Initializes the DiversityPostprocessor class.
+
+        Args:
+            embed_model (BaseEmbedding, optional): Model used to embed
+                candidates (and the query) when no stored embedding is
+                available. Defaults to `Settings.embed_model`.
+            embedding_lookup (callable, optional): Returns the stored
+                embedding of a node id, e.g. `index.vector_store.get`, so
+                candidates do not have to be embedded again.
+            **kwargs: Values for the fields listed above.
+        """
+        super().__init__(**kwargs)
+        self._embed_model = embed_model or Settings.embed_model
+        self._embedding_lookup = embedding_lookup
+        self._tokenizer = get_tokenizer()
+
+    @classmethod
+    def class_name(cls):
+        return "DiversityPostprocessor"
+
+    def _candidate_embeddings(self, nodes):
+        vectors = [None] * len(nodes)
+        missing = []
+        for i, node in enumerate(nodes):
+            if node.node.embedding is not None:
+                vectors[i] = node.node.embedding
+            elif self._embedding_lookup is not None:
+                try:
+                    vectors[i] = self._embedding_lookup(node.node.node_id)
+                except (KeyError, IndexError, ValueError):
+                    missing.append(i)
+            else:
+                missing.append(i)
+        if missing:
+            embedded = self._embed_model.get_text_embedding_batch(
+                [
+                    nodes[i].node.get_content(metadata_mode=MetadataMode.EMBED)
+                    for i in missing
+                ]
+            )
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        return normalize(vectors)
+
+    def _query_embedding(self, query_bundle):
+        if query_bundle is not None and query_bundle.embedding is not None:
+            return normalize(query_bundle.embedding)
+        if query_bundle is not None:
+            return normalize(
+                self._embed_model.get_agg_embedding_from_queries(
+                    query_bundle.embedding_strs
+                )
+            )
+        return None
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if len(nodes) <= 1:
+            return nodes[: self.top_k]
+
+        # Relevance falls back to the retriever's scores without a query
+        nodes = sorted(nodes, key=lambda node: node.score or 0.0, reverse=True)
+        vectors = self._candidate_embeddings(nodes)
+        query = self._query_embedding(query_bundle)
+        if query is not None:
+            relevance = vectors @ query
+        else:
+            relevance = np.array([node.score or 0.0 for node in nodes])
+        similarity = vectors @ vectors.T
+
+        # Clusters near-duplicates onto their best-scoring member
+        representatives = []
+        for i in range(len(nodes)):
+            if all(
+                similarity[i, j] < self.duplicate_threshold
+                for j in representatives
+            ):
+                representatives.append(i)
+
+        # Maximal marginal relevance selection within the token budget
+        selected = []
+        tokens = 0
+        candidates = list(representatives)
+        while candidates and len(selected) < self.top_k:
+            best = max(
+                candidates,
+                key=lambda i: self.lambda_mult * relevance[i]
+                - (1 - self.lambda_mult)
+                * max((similarity[i, j] for j in selected), default=0.0),
+            )
+            candidates.remove(best)
+            if self.token_budget is not None:
+                cost = len(
+                    self._tokenizer(
+                        nodes[best].node.get_content(
+                            metadata_mode=MetadataMode.LLM
+                        )
+                    )
+                )
+                # Always keeps the best document, then only what fits
+                if selected and tokens + cost > self.token_budget:
+                    continue
+                tokens += cost
+            selected.append(best)
+        return [nodes[i] for i in selected]
+
+
+class AdaptiveTopKPostprocessor(BaseNodePostprocessor):
+    """
+    Keeps a variable number of the retrieved documents, depending on how
+    their scores are distributed. Documents are dropped below
+    `score_threshold` or more than `max_drop` below the best score, and the
+    list is cut at its largest score gap when that gap is at least
+    `min_gap`. Between `min_k` and `max_k` documents are always kept, so
+    clear-cut queries get one or two documents and ambiguous ones more.
+
+    Attributes:
+        min_k (int): Minimum number of documents to keep.
+        max_k (int): Maximum number of documents to keep.
+        score_threshold (float): Absolute score below which documents are
+                                 dropped, or None.
+        max_drop (float): Score difference to the best document beyond which
+                          documents are dropped, or None.
+        min_gap (float): Smallest score gap the list is cut at, or None.
+        log_path (str): JSON lines file the chosen k of every query is
+                        appended to, or None.
+    """
+
+    min_k: int = Field(default=1)
+    max_k: int = Field(default=5)
+    score_threshold: Optional[float] = Field(default=None)
+    max_drop: Optional[float] = Field(default=0.1)
+    min_gap: Optional[float] = Field(default=0.05)
+    log_path: Optional[str] = Field(default=None)
+    _counts = PrivateAttr(default_factory=Counter)
+    _lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls):
+        return "AdaptiveTopKPostprocessor"
+
+    def choose_k(self, scores):
+        """
+        Chooses how many documents to keep.
+
+        Args:
+            scores (list): Document scores, best first.
+
+        Returns:
+            int: The number of documents to keep.
+        """
+        upper = min(self.max_k, len(scores))
+        lower = min(self.min_k, upper)
+        k = upper
+        for i in range(1, upper):
+            below_threshold = (
+                self.score_threshold is not None
+                and scores[i] < self.score_threshold
+            )
+            too_far = (
+                self.max_drop is not None and scores[0] - scores[i] > self.max_drop
+            )
+            if below_threshold or too_far:
+                k = i
+                break
+
+        # Cuts at the largest gap that is wide enough; gaps[j] is the drop
+        # after keeping `first + j` documents
+        first = max(lower, 1)
+        if self.min_gap is not None and k > first:
+            gaps = [scores[i - 1] - scores[i] for i in range(first, k)]
+            if max(gaps) >= self.min_gap:
+                k = first + int(np.argmax(gaps))
+        return max(lower, k)
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if not nodes:
+            return nodes
+        nodes = sorted(nodes, key=lambda node: node.score or 0.0, reverse=True)
+        scores = [node.score or 0.0 for node in nodes]
+        k = self.choose_k(scores)
+        with self._lock:
+            self._counts[k] += 1
+            if self.log_path is not None:
+                query = query_bundle.query_str if query_bundle else None
+                entry = {"query": query, "k": k, "scores": scores}
+                with open(self.log_path, "a") as file:
+                    file.write(json.dumps(entry) + "\n")
+        return nodes[:k]
+
+    def k_counts(self):
+        """
+        Returns how often each k was chosen, for tuning the thresholds.
+
+        Args:
+            None.
+
+        Returns:
+            dict: Number of queries per chosen k.
+        """
+        with self._lock:
+            return dict(sorted(self._counts.items()))
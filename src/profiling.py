@@ -0,0 +1,281 @@
+"""
+This file contains the opt-in profiling hooks for form completions and
+engine builds
+
+Profiling is off unless `enable_profiling` is called or the FORM_PROFILE_DIR
+environment variable is set (FORM_PROFILE_EVERY=N profiles one call in N).
+While it is off, a profiled function costs one global lookup per call.
+
+For every profiled call the following files are written, named after the
+request ID (with characters other than letters, digits, ".", "-" and "_"
+replaced):
+
+    <request_id>.folded      Sampled CPU stacks in collapsed format, for
+                             flamegraph.pl, speedscope or inferno.
+    <request_id>.tracemalloc Allocation snapshot, readable with
+                             `tracemalloc.Snapshot.load`.
+
+and one summary line is appended to `profiles.jsonl`.
+"""
+
+import functools
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+
+logger = logging.getLogger(__name__)
+
+
+def profile_name(request_id):
+    """
+    Turns a request ID into a safe file name, so client supplied IDs cannot
+    escape the profile directory.
+
+    Args:
+        request_id (str): Identifier of the profiled call.
+
+    Returns:
+        str: The file name, without extension.
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", str(request_id))[:128].lstrip(".")
+    return name or "request"
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval from a
+    background thread and counts the collapsed stacks.
+
+    Attributes:
+        thread_id (int): Identifier of the sampled thread.
+        interval (float): Seconds between samples.
+        stacks (Counter): Number of samples per collapsed stack.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        """
+        Initializes the StackSampler class.
+
+        Args:
+            thread_id (int): Identifier of the thread to sample.
+            interval (float, optional): Seconds between samples.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        """
+        Writes the samples in collapsed ("folded") stack format.
+
+        Args:
+            path (str): Output file.
+
+        Returns:
+            None.
+        """
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Profiles one call in every `every` calls of each profiled function.
+    Only one call is profiled at a time; calls that overlap a profiled call
+    run unprofiled, since allocation tracing is process-wide.
+
+    Attributes:
+        directory (str): Directory the profiles are written to.
+        every (int): Profile one call in this many, per function.
+        interval (float): Seconds between CPU samples.
+        trace_allocations (bool): Whether to take tracemalloc snapshots.
+        frames (int): Frames kept per traced allocation.
+    """
+
+    def __init__(self, directory, every=1, interval=0.005,
+                 trace_allocations=True, frames=25):
+        """
+        Initializes the Profiler class.
+
+        Args:
+            directory (str): Directory the profiles are written to.
+            every (int, optional): Profile one call in this many.
+            interval (float, optional): Seconds between CPU samples.
+            trace_allocations (bool, optional): Whether to trace allocations.
+            frames (int, optional): Frames kept per traced allocation.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.every = max(1, every)
+        self.interval = interval
+        self.trace_allocations = trace_allocations
+        self.frames = frames
+        self._counters = {}
+        self._busy = threading.Lock()
+
+    def should_profile(self, name):
+        counter = self._counters.setdefault(name, itertools.count())
+        return next(counter) % self.every == 0
+
+    def run(self, name, request_id, function, args, kwargs):
+        """
+        Calls a function while profiling it.
+
+        Args:
+            name (str): Name of the profiled function.
+            request_id (str): Identifier used to name the profile files.
+            function (callable): The function.
+            args (tuple): Positional arguments of the function.
+            kwargs (dict): Keyword arguments of the function.
+
+        Returns:
+            object: The return value of the function.
+        """
+        if not self._busy.acquire(blocking=False):
+            return function(*args, **kwargs)
+        try:
+            return self._profile(name, request_id, function, args, kwargs)
+        finally:
+            self._busy.release()
+
+    def _profile(self, name, request_id, function, args, kwargs):
+        started_tracing = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                started_tracing = True
+            tracemalloc.reset_peak()
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            sampler.stop()
+            snapshot = peak = None
+            if self.trace_allocations:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+            # A failed write must not replace the result or the exception of
+            # the profiled call
+            try:
+                self._write(name, request_id, seconds, sampler, snapshot, peak)
+            except Exception:
+                logger.exception("Could not write the profile of %s", request_id)
+
+    def _write(self, name, request_id, seconds, sampler, snapshot, peak):
+        base = os.path.join(self.directory, profile_name(request_id))
+        sampler.write(base + ".folded")
+        summary = {
+            "request_id": str(request_id),
+            "function": name,
+            "seconds": seconds,
+            "samples": sum(sampler.stacks.values()),
+            "cpu_profile": base + ".folded",
+        }
+        if snapshot is not None:
+            snapshot.dump(base + ".tracemalloc")
+            summary["peak_traced_bytes"] = peak
+            summary["allocation_snapshot"] = base + ".tracemalloc"
+        with open(os.path.join(self.directory, "profiles.jsonl"), "a") as file:
+            file.write(json.dumps(summary) + "\n")
+
+
+# Active profiler, None while profiling is disabled
+_profiler = None
+
+
+def enable_profiling(directory="profiles", every=1, interval=0.005,
+                     trace_allocations=True):
+    """
+    Turns on profiling of the functions decorated with `profiled`.
+
+    Args:
+        directory (str, optional): Directory the profiles are written to.
+        every (int, optional): Profile one call in this many, per function.
+        interval (float, optional): Seconds between CPU samples.
+        trace_allocations (bool, optional): Whether to take tracemalloc
+                                            snapshots.
+
+    Returns:
+        Profiler: The active profiler.
+    """
+    global _profiler
+    _profiler = Profiler(directory, every, interval, trace_allocations)
+    return _profiler
+
+
+def disable_profiling():
+    global _profiler
+    _profiler = None
+
+
+def profiled(function):
+    """
+    Decorator that profiles calls of a function while profiling is enabled.
+    A `request_id` keyword argument, when passed to the function, names the
+    profile files; otherwise the function name and call number are used.
+
+    Args:
+        function (callable): The function to profile.
+
+    Returns:
+        callable: The wrapped function.
+    """
+    name = function.__name__
+    sequence = itertools.count(1)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profiler = _profiler
+        if profiler is None:
+            return function(*args, **kwargs)
+        number = next(sequence)
+        if not profiler.should_profile(name):
+            return function(*args, **kwargs)
+        request_id = kwargs.get("request_id") or f"{name}-{number:06d}"
+        return profiler.run(name, request_id, function, args, kwargs)
+
+    return wrapper
+
+
+if os.environ.get("FORM_PROFILE_DIR"):
+    enable_profiling(
+        os.environ["FORM_PROFILE_DIR"],
+        every=int(os.environ.get("FORM_PROFILE_EVERY", "1")),
+    )
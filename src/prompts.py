@@ -3,6 +3,7 @@ Defines system and user prompts
 """
 
 import openai
+import re
 
 
 # System prompt for generating synthetic 2k forms
@@ -267,6 +268,10 @@ Justification for Output 2: The Department, Priority, Requested Actions, and Add
 synthetic_prompt = "Generate 20 NEW maintenance request samples following the system prompt rules. Each sample should be in dictionary format and included in a single list please. The output should be a singular list, with no extra words before or after it. I know a well-traned large language model like yourself can handle this task."
 
 
+# User prompt for rephrasing a single description
+augmented_prompt_template = "Original Paragraph: {description}\n\nOutput:"
+
+
 def generate_data(
     system_prompt,
     description=None,
@@ -275,20 +280,31 @@ def generate_data(
     augmented=False,
     max_tokens=2500,
     temperature=0.7,
+    model="gpt-4o",
 ):
     """
     Uses gpt-4o to generate synthetic data representing various
     maintanence request forms.
 
     Args:
+        system_prompt (str): System prompt for the generation.
+        description (str, optional): Description to rephrase when
+                                     `augmented` is True.
+        prompt (str, optional): User prompt for the generation.
+        n_samples (int, optional): Number of completions to request in a
+                                   single call, default is 1.
+        augmented (bool, optional): Whether to rephrase `description`.
+        max_tokens (int, optional): Token limit per completion.
+        temperature (float, optional): Sampling temperature.
+        model (str, optional): OpenAI model, default is gpt-4o.
 
     Returns:
-        str: A synthetic maintanence form in string format.
+        list: The `n_samples` completions, each in string format.
     """
     if augmented:
-        prompt = f"Original Paragraph: {description}\n\nOutput:"
+        prompt = augmented_prompt_template.format(description=description)
     response = openai.chat.completions.create(
-        model="gpt-4o",
+        model=model,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt},
@@ -297,13 +313,57 @@ def generate_data(
         temperature=temperature,
         n=n_samples,
     )
-    return response.choices[0].message.content.strip()
+    return [choice.message.content.strip() for choice in response.choices]
+
+
+def batch_augmented_prompt(descriptions):
+    """
+    Builds a single user prompt that asks for a rephrased summary of every
+    description, so many descriptions can be rephrased in one call.
+
+    Args:
+        descriptions (list): Descriptions of problems to rephrase.
+
+    Returns:
+        str: The user prompt.
+    """
+    paragraphs = "\n\n".join(
+        f"Original Paragraph {i + 1}: {description}"
+        for i, description in enumerate(descriptions)
+    )
+    return (
+        f"{paragraphs}\n\n"
+        f"Rephrase each of the {len(descriptions)} paragraphs above "
+        f"separately. Return exactly one line per paragraph, in the format "
+        f"'Output <number>: <summary>', with no extra words before or after."
+    )
+
+
+def parse_batched_outputs(response_text, count):
+    """
+    Splits the response to `batch_augmented_prompt` into one summary per
+    description.
+
+    Args:
+        response_text (str): Raw text returned by the model.
+        count (int): Number of descriptions in the batch.
+
+    Returns:
+        list: The summaries in description order, with None for any
+              description the model skipped.
+    """
+    outputs = [None] * count
+    for match in re.finditer(r"^Output (\d+):\s*(.+)$", response_text, re.M):
+        position = int(match.group(1)) - 1
+        if 0 <= position < count and outputs[position] is None:
+            outputs[position] = match.group(2).strip()
+    return outputs
 
 
 if __name__ == "__main__":
 
     # Generate synthetic data
-    generated_samples = generate_data(system_prompt=data_generation_prompt)
+    generated_samples = generate_data(system_prompt=data_generation_prompt)[0]
 
     # Write the generated samples to a Python file
     with open("new_examples.py", "w") as file:
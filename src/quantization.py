@@ -0,0 +1,425 @@
+"""
+This file contains compressed embedding storage for the retrievers
+
+Two quantizers shrink the normalized float32 embeddings:
+
+    ScalarQuantizer   one uint8 code per dimension (4x smaller)
+    ProductQuantizer  one uint8 centroid id per subspace of the vector
+                      (e.g. 384 dimensions in 48 subspaces: 32x smaller)
+
+Queries stay in full precision and are scored directly against the codes
+(asymmetric distance computation), so the float vectors never have to be
+decoded. `QuantizedRetriever` can re-rank the best candidates with the exact
+vectors, read from a memory-mapped file that does not need to fit in RAM.
+
+Usage:
+    python -m src.quantization <published index directory>
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from src.retrieval import MatrixRetriever
+from src.vectors import kmeans, nearest_centers, normalize, top_k_indices
+
+
+# Rows scored or encoded at a time, bounding temporary memory
+CHUNK_ROWS = 65536
+
+
+class ScalarQuantizer:
+    """
+    Quantizes every dimension to 256 levels between its minimum and maximum.
+
+    Attributes:
+        offset (np.ndarray): Minimum of every dimension.
+        scale (np.ndarray): Width of one level in every dimension.
+    """
+
+    kind = "int8"
+
+    def __init__(self, offset=None, scale=None):
+        self.offset = offset
+        self.scale = scale
+
+    def fit(self, embeddings):
+        """
+        Learns the range of every dimension.
+
+        Args:
+            embeddings (np.ndarray): Training vectors, one per row.
+
+        Returns:
+            ScalarQuantizer: The quantizer itself.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        low = embeddings.min(axis=0)
+        high = embeddings.max(axis=0)
+        self.offset = low
+        self.scale = np.maximum(high - low, 1e-12) / 255.0
+        return self
+
+    def encode(self, embeddings):
+        """
+        Compresses vectors to codes.
+
+        Args:
+            embeddings (np.ndarray): Vectors, one per row.
+
+        Returns:
+            np.ndarray: uint8 codes, one row per vector.
+        """
+        codes = np.empty(embeddings.shape, dtype=np.uint8)
+        for start in range(0, len(embeddings), CHUNK_ROWS):
+            chunk = np.asarray(embeddings[start : start + CHUNK_ROWS], np.float32)
+            levels = np.rint((chunk - self.offset) / self.scale)
+            codes[start : start + len(chunk)] = np.clip(levels, 0, 255)
+        return codes
+
+    def decode(self, codes):
+        return self.offset + codes.astype(np.float32) * self.scale
+
+    def score(self, codes, query):
+        """
+        Approximates the dot product of a query with every coded vector.
+
+        Args:
+            codes (np.ndarray): Codes from `encode`.
+            query (np.ndarray): Normalized query embedding.
+
+        Returns:
+            np.ndarray: One score per coded vector.
+        """
+        weights = (query * self.scale).astype(np.float32)
+        bias = float(query @ self.offset)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), CHUNK_ROWS):
+            chunk = codes[start : start + CHUNK_ROWS]
+            scores[start : start + len(chunk)] = chunk.astype(np.float32) @ weights
+        return scores + bias
+
+    def state(self):
+        return {"offset": self.offset, "scale": self.scale}
+
+    def nbytes(self):
+        return self.offset.nbytes + self.scale.nbytes
+
+
+class ProductQuantizer:
+    """
+    Splits vectors into subspaces and replaces each subvector by the id of
+    its nearest k-means centroid.
+
+    Attributes:
+        n_subspaces (int): Number of subspaces; must divide the dimension.
+                           Defaults to one per 8 dimensions.
+        n_centroids (int): Centroids per subspace, at most 256.
+        centroids (np.ndarray): Centroids, shaped (n_subspaces, n_centroids,
+                                subspace dimension).
+    """
+
+    kind = "pq"
+
+    def __init__(self, n_subspaces=None, n_centroids=256, iterations=20,
+                 sample_size=65536, seed=0, centroids=None):
+        """
+        Initializes the ProductQuantizer class.
+
+        Args:
+            n_subspaces (int, optional): Number of subspaces, defaults to
+                                         one per 8 dimensions.
+            n_centroids (int, optional): Centroids per subspace, at most 256.
+            iterations (int, optional): k-means iterations.
+            sample_size (int, optional): Vectors sampled for training.
+            seed (int, optional): Random seed.
+            centroids (np.ndarray, optional): Trained centroids, when loading.
+        """
+        if n_centroids > 256:
+            raise ValueError("Product quantization codes are uint8")
+        self.n_subspaces = n_subspaces
+        self.n_centroids = n_centroids
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = centroids
+
+    def _split(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.reshape(len(vectors), self.n_subspaces, -1)
+
+    def fit(self, embeddings):
+        """
+        Trains the centroids of every subspace with k-means.
+
+        Args:
+            embeddings (np.ndarray): Training vectors, one per row.
+
+        Returns:
+            ProductQuantizer: The quantizer itself.
+        """
+        if self.n_subspaces is None:
+            self.n_subspaces = max(1, embeddings.shape[1] // 8)
+        if embeddings.shape[1] % self.n_subspaces:
+            raise ValueError(
+                f"{self.n_subspaces} subspaces do not divide "
+                f"{embeddings.shape[1]} dimensions"
+            )
+        rng = np.random.default_rng(self.seed)
+        size = min(self.sample_size, len(embeddings))
+        rows = np.sort(rng.choice(len(embeddings), size, replace=False))
+        sample = self._split(embeddings[rows])
+        k = min(self.n_centroids, size)
+        self.centroids = np.stack(
+            [
+                kmeans(sample[:, j], k, self.iterations, rng)
+                for j in range(self.n_subspaces)
+            ]
+        )
+        return self
+
+    def encode(self, embeddings):
+        """
+        Compresses vectors to centroid ids.
+
+        Args:
+            embeddings (np.ndarray): Vectors, one per row.
+
+        Returns:
+            np.ndarray: uint8 codes, one row of `n_subspaces` per vector.
+        """
+        codes = np.empty((len(embeddings), self.n_subspaces), dtype=np.uint8)
+        for start in range(0, len(embeddings), CHUNK_ROWS):
+            chunk = self._split(embeddings[start : start + CHUNK_ROWS])
+            for j in range(self.n_subspaces):
+                codes[start : start + len(chunk), j] = nearest_centers(
+                    chunk[:, j], self.centroids[j]
+                )
+        return codes
+
+    def decode(self, codes):
+        parts = [self.centroids[j][codes[:, j]] for j in range(self.n_subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def score(self, codes, query):
+        """
+        Approximates the dot product of a query with every coded vector from
+        a table of the query's dot products with every centroid.
+
+        Args:
+            codes (np.ndarray): Codes from `encode`.
+            query (np.ndarray): Normalized query embedding.
+
+        Returns:
+            np.ndarray: One score per coded vector.
+        """
+        subqueries = self._split(query[None, :])[0]
+        table = np.einsum("jkd,jd->jk", self.centroids, subqueries)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), CHUNK_ROWS):
+            chunk = codes[start : start + CHUNK_ROWS]
+            total = np.zeros(len(chunk), dtype=np.float32)
+            for j in range(self.n_subspaces):
+                total += table[j][chunk[:, j]]
+            scores[start : start + len(chunk)] = total
+        return scores
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+    def nbytes(self):
+        return self.centroids.nbytes
+
+
+QUANTIZERS = {ScalarQuantizer.kind: ScalarQuantizer, ProductQuantizer.kind: ProductQuantizer}
+
+
+def save_quantizer(quantizer, path):
+    """
+    Saves a trained quantizer.
+
+    Args:
+        quantizer (ScalarQuantizer | ProductQuantizer): The quantizer.
+        path (str): Output .npz file.
+
+    Returns:
+        None.
+    """
+    np.savez(path, kind=quantizer.kind, **quantizer.state())
+
+
+def load_quantizer(path):
+    """
+    Loads a quantizer saved by `save_quantizer`.
+
+    Args:
+        path (str): The .npz file.
+
+    Returns:
+        ScalarQuantizer | ProductQuantizer: The quantizer.
+    """
+    with np.load(path) as saved:
+        kind = str(saved["kind"])
+        state = {key: saved[key] for key in saved.files if key != "kind"}
+    if kind == ProductQuantizer.kind:
+        centroids = state["centroids"]
+        return ProductQuantizer(
+            n_subspaces=centroids.shape[0],
+            n_centroids=centroids.shape[1],
+            centroids=centroids,
+        )
+    return QUANTIZERS[kind](**state)
+
+
+class QuantizedRetriever(MatrixRetriever):
+    """
+    A retriever that scores queries against quantized embeddings, then
+    optionally re-ranks the best `rerank_k` candidates with the exact
+    vectors.
+
+    Attributes:
+        codes (np.ndarray): Quantized embeddings, one row per record.
+        quantizer (ScalarQuantizer | ProductQuantizer): Their quantizer.
+        embeddings (np.ndarray): Exact normalized embeddings for re-ranking
+                                 (typically a memory map), or None.
+        rerank_k (int): Candidates re-ranked with the exact embeddings.
+    """
+
+    def __init__(self, codes, quantizer, records, embeddings=None,
+                 rerank_k=50, **kwargs):
+        """
+        Initializes the QuantizedRetriever class.
+
+        Args:
+            codes (np.ndarray): Quantized embeddings, one row per record.
+            quantizer (ScalarQuantizer | ProductQuantizer): Their quantizer.
+            records (Corpus | list): The maintenance requests, in row order.
+            embeddings (np.ndarray, optional): Exact embeddings to re-rank
+                                               with, skipped when None.
+            rerank_k (int, optional): Candidates to re-rank, default is 50.
+            **kwargs: Arguments of `MatrixRetriever`.
+        """
+        self.codes = codes
+        self.quantizer = quantizer
+        self.rerank_k = rerank_k
+        super().__init__(embeddings, records, **kwargs)
+
+    def score(self, query_vector):
+        return self.quantizer.score(self.codes, query_vector)
+
+    def _retrieve(self, query_bundle):
+        query = self.query_embedding(query_bundle)
+        scores = self.score(query)
+        if self.embeddings is None or self.rerank_k <= self.similarity_top_k:
+            indices = top_k_indices(scores, self.similarity_top_k)
+            return self.make_nodes(indices, scores[indices])
+
+        # Reads the candidates' exact vectors in file order
+        candidates = np.sort(top_k_indices(scores, self.rerank_k))
+        exact = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query
+        best = top_k_indices(exact, self.similarity_top_k)
+        return self.make_nodes(candidates[best], exact[best])
+
+
+def quantization_report(embeddings, n_queries=200, k=5, rerank_k=50,
+                        quantizers=None, seed=0):
+    """
+    Compares quantized and exact search: memory, recall@k of the exact top
+    k without and with re-ranking, and query latency. Queries are perturbed
+    copies of sampled embeddings.
+
+    Args:
+        embeddings (np.ndarray): Exact normalized embeddings.
+        n_queries (int, optional): Number of queries.
+        k (int, optional): Results per query.
+        rerank_k (int, optional): Candidates re-ranked with exact vectors.
+        quantizers (list, optional): Quantizers to compare, defaults to
+                                     int8 and product quantization.
+        seed (int, optional): Random seed.
+
+    Returns:
+        list: One dictionary of metrics per storage method.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+    queries = normalize(
+        np.asarray(embeddings[np.sort(rows)], dtype=np.float32)
+        + rng.normal(0, 0.05, (len(rows), embeddings.shape[1]))
+    )
+    if quantizers is None:
+        dimension = embeddings.shape[1]
+        quantizers = [ScalarQuantizer()]
+        if dimension % 8 == 0:
+            quantizers.append(ProductQuantizer())
+
+    start = time.perf_counter()
+    exact = [set(top_k_indices(embeddings @ query, k)) for query in queries]
+    float_ms = 1000 * (time.perf_counter() - start) / len(queries)
+    report = [
+        {
+            "method": "float32",
+            "bytes": embeddings.nbytes,
+            "compression": 1.0,
+            "recall": 1.0,
+            "recall_reranked": 1.0,
+            "query_ms": float_ms,
+        }
+    ]
+    for quantizer in quantizers:
+        quantizer.fit(embeddings)
+        codes = quantizer.encode(embeddings)
+        size = codes.nbytes + quantizer.nbytes()
+        hits = reranked_hits = 0
+        start = time.perf_counter()
+        for query, truth in zip(queries, exact):
+            scores = quantizer.score(codes, query)
+            hits += len(truth & set(top_k_indices(scores, k)))
+            candidates = np.sort(top_k_indices(scores, rerank_k))
+            rescored = np.asarray(embeddings[candidates]) @ query
+            reranked_hits += len(
+                truth & set(candidates[top_k_indices(rescored, k)])
+            )
+        report.append(
+            {
+                "method": quantizer.kind,
+                "bytes": size,
+                "compression": embeddings.nbytes / size,
+                "recall": hits / (k * len(queries)),
+                "recall_reranked": reranked_hits / (k * len(queries)),
+                "query_ms": 1000 * (time.perf_counter() - start) / len(queries),
+            }
+        )
+    return report
+
+
+if __name__ == "__main__":
+    from src.shared_index import EMBEDDINGS_FILE
+    import os
+
+    parser = argparse.ArgumentParser(
+        description="Report recall and memory of quantized embeddings."
+    )
+    parser.add_argument("directory", help="Index published by src.shared_index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--rerank-k", type=int, default=50)
+    args = parser.parse_args()
+
+    embeddings = np.load(
+        os.path.join(args.directory, EMBEDDINGS_FILE), mmap_mode="r"
+    )
+    report = quantization_report(
+        embeddings, args.queries, args.k, args.rerank_k
+    )
+    print(
+        f"{'method':<10}{'MiB':>10}{'ratio':>8}{'recall@' + str(args.k):>11}"
+        f"{'reranked':>10}{'ms/query':>10}"
+    )
+    for row in report:
+        print(
+            f"{row['method']:<10}{row['bytes'] / (1 << 20):>10.2f}"
+            f"{row['compression']:>8.1f}{row['recall']:>11.3f}"
+            f"{row['recall_reranked']:>10.3f}{row['query_ms']:>10.2f}"
+        )
+    print(json.dumps(report))
@@ -0,0 +1,253 @@
+"""
+This file contains retrievers that search a plain embedding matrix instead
+of a llama_index vector store
+"""
+
+import time
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+from src.engine import create_document
+from src.vectors import kmeans, nearest_centers, normalize, top_k_indices
+
+
+# Rows assigned to clusters at a time
+CHUNK_ROWS = 65536
+
+
+class MatrixRetriever(BaseRetriever):
+    """
+    A cosine similarity retriever over a matrix of normalized embeddings,
+    one row per maintenance request. The matrix can be any array-like,
+    including a read-only memory map, so many processes can search the same
+    pages without copying them.
+
+    Attributes:
+        embeddings (np.ndarray): Normalized embeddings, one row per record.
+        records (Corpus | list): The maintenance requests, in row order.
+        embed_model (BaseEmbedding): Model used to embed queries.
+        similarity_top_k (int): Number of records to retrieve.
+    """
+
+    def __init__(self, embeddings, records, embed_model=None,
+                 similarity_top_k=5, **kwargs):
+        """
+        Initializes the MatrixRetriever class.
+
+        Args:
+            embeddings (np.ndarray): Normalized embeddings, one row per
+                                     record.
+            records (Corpus | list): The maintenance requests, in row order.
+            embed_model (BaseEmbedding, optional): Query embedding model,
+                                                   defaults to
+                                                   `Settings.embed_model`.
+            similarity_top_k (int, optional): Records to retrieve, default
+                                              is 5.
+        """
+        self.embeddings = embeddings
+        self.records = records
+        self.embed_model = embed_model or Settings.embed_model
+        self.similarity_top_k = similarity_top_k
+        super().__init__(**kwargs)
+
+    def query_embedding(self, query_bundle):
+        """
+        Returns the normalized embedding of a query, reusing the one carried
+        by the query bundle when present.
+
+        Args:
+            query_bundle (QueryBundle): The query.
+
+        Returns:
+            np.ndarray: The normalized query embedding.
+        """
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return normalize(query_bundle.embedding)
+
+    def score(self, query_vector):
+        """
+        Computes the cosine similarity of the query to every record.
+
+        Args:
+            query_vector (np.ndarray): Normalized query embedding.
+
+        Returns:
+            np.ndarray: One similarity per record.
+        """
+        return self.embeddings @ query_vector
+
+    def make_nodes(self, indices, scores):
+        """
+        Wraps records as scored nodes. The node ids are the record positions,
+        so results from different retrievers over the same corpus agree.
+
+        Args:
+            indices (iterable): Record positions.
+            scores (iterable): The matching similarities.
+
+        Returns:
+            list: NodeWithScore objects in the given order.
+        """
+        nodes = []
+        for index, score in zip(indices, scores):
+            document = create_document(self.records[int(index)])
+            document.id_ = str(int(index))
+            nodes.append(NodeWithScore(node=document, score=float(score)))
+        return nodes
+
+    def _retrieve(self, query_bundle):
+        scores = self.score(self.query_embedding(query_bundle))
+        indices = top_k_indices(scores, self.similarity_top_k)
+        return self.make_nodes(indices, scores[indices])
+
+
+class ClusteredRetriever(MatrixRetriever):
+    """
+    A two-stage retriever: it ranks cluster centroids first, then searches
+    only the members of the `n_probe` best clusters. Clusters are either
+    the values of a record field (e.g. Department) or k-means clusters of
+    the embeddings. Larger `n_probe` trades speed for recall; `recall`
+    measures it against the exact search.
+
+    Attributes:
+        centroids (np.ndarray): Normalized centroid of every cluster.
+        labels (list): Name of every cluster (field value or number).
+        members (list): Sorted record positions of every cluster.
+        n_probe (int): Clusters searched per query.
+    """
+
+    def __init__(self, embeddings, records, clusters="Department", n_probe=2,
+                 iterations=20, sample_size=65536, seed=0, **kwargs):
+        """
+        Initializes the ClusteredRetriever class.
+
+        Args:
+            embeddings (np.ndarray): Normalized embeddings, one row per
+                                     record.
+            records (Corpus | list): The maintenance requests, in row order.
+            clusters (str | int, optional): Field to cluster by, or number
+                                            of k-means clusters.
+            n_probe (int, optional): Clusters searched per query.
+            iterations (int, optional): k-means iterations.
+            sample_size (int, optional): Embeddings k-means is trained on.
+            seed (int, optional): Random seed of k-means.
+            **kwargs: Arguments of `MatrixRetriever`.
+        """
+        super().__init__(embeddings, records, **kwargs)
+        self.n_probe = n_probe
+        if isinstance(clusters, str):
+            if hasattr(records, "column"):
+                values = list(records.column(clusters))
+            else:
+                values = [record[clusters] for record in records]
+            self.labels, assignment = np.unique(
+                np.asarray(values, dtype=object), return_inverse=True
+            )
+            self.labels = list(self.labels)
+        else:
+            rng = np.random.default_rng(seed)
+            size = min(sample_size, len(embeddings))
+            rows = np.sort(rng.choice(len(embeddings), size, replace=False))
+            centers = kmeans(embeddings[rows], min(clusters, size), iterations, rng)
+            assignment = np.concatenate(
+                [
+                    nearest_centers(
+                        np.asarray(embeddings[start : start + CHUNK_ROWS]),
+                        centers,
+                    )
+                    for start in range(0, len(embeddings), CHUNK_ROWS)
+                ]
+            )
+            self.labels = list(range(len(centers)))
+
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(len(self.labels) + 1))
+        self.members = [
+            order[bounds[c] : bounds[c + 1]] for c in range(len(self.labels))
+        ]
+        self.centroids = normalize(
+            [
+                np.asarray(embeddings[members], dtype=np.float32).sum(axis=0)
+                for members in self.members
+            ]
+        )
+
+    def candidates(self, query_vector, n_probe=None):
+        """
+        Returns the record positions in the clusters closest to a query.
+
+        Args:
+            query_vector (np.ndarray): Normalized query embedding.
+            n_probe (int, optional): Clusters to search, defaults to
+                                     `n_probe`.
+
+        Returns:
+            np.ndarray: Sorted record positions.
+        """
+        probes = top_k_indices(self.centroids @ query_vector, n_probe or self.n_probe)
+        return np.sort(np.concatenate([self.members[c] for c in probes]))
+
+    def search(self, query_vector, n_probe=None):
+        rows = self.candidates(query_vector, n_probe)
+        scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ query_vector
+        best = top_k_indices(scores, self.similarity_top_k)
+        return rows[best], scores[best]
+
+    def _retrieve(self, query_bundle):
+        rows, scores = self.search(self.query_embedding(query_bundle))
+        return self.make_nodes(rows, scores)
+
+    def recall(self, query_vectors, n_probes=None):
+        """
+        Measures recall@k of the exact search's top k, the share of the
+        corpus scanned and query time for several probe counts.
+
+        Args:
+            query_vectors (np.ndarray): Normalized query embeddings.
+            n_probes (iterable, optional): Probe counts, defaults to 1 up to
+                                           the number of clusters.
+
+        Returns:
+            list: One dictionary of metrics per probe count, including the
+                  exact search as "n_probe": "exact".
+        """
+        query_vectors = normalize(query_vectors)
+        k = self.similarity_top_k
+        if n_probes is None:
+            n_probes = range(1, len(self.labels) + 1)
+
+        start = time.perf_counter()
+        exact = [set(top_k_indices(self.score(query), k)) for query in query_vectors]
+        report = [
+            {
+                "n_probe": "exact",
+                "recall": 1.0,
+                "scanned": 1.0,
+                "query_ms": 1000 * (time.perf_counter() - start) / len(query_vectors),
+            }
+        ]
+        for n_probe in n_probes:
+            start = time.perf_counter()
+            results = [self.search(query, n_probe)[0] for query in query_vectors]
+            seconds = time.perf_counter() - start
+            hits = sum(
+                len(truth & set(rows.tolist()))
+                for rows, truth in zip(results, exact)
+            )
+            scanned = sum(
+                len(self.candidates(query, n_probe)) for query in query_vectors
+            )
+            report.append(
+                {
+                    "n_probe": n_probe,
+                    "recall": hits / sum(len(truth) for truth in exact),
+                    "scanned": scanned / (len(query_vectors) * len(self.embeddings)),
+                    "query_ms": 1000 * seconds / len(query_vectors),
+                }
+            )
+        return report
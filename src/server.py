@@ -0,0 +1,550 @@
+"""
+This file contains the HTTP (ASGI) service for the form completion engine
+
+Run it with any ASGI server, e.g. `uvicorn src.server:app`. One warm engine
+is shared by every client:
+
+    POST /complete   {"description": "...", "priority": "High",
+                      "department": "Safety", "deadline": 30}
+        Streams the completed form as newline-delimited JSON, one
+        {"field": ..., "value": ...} object per field as soon as the model
+        has produced it, followed by {"done": true}. "priority",
+        "department" and "deadline" (seconds the request may wait) are
+        optional scheduling hints.
+    POST /feedback   {"form": {...}, "fields_to_regenerate": {...}}
+        Regenerates the requested fields and returns the form as JSON.
+    GET  /health
+
+Given an `IndexManager`, the service serves its current index version and
+keeps serving while the manager rebuilds and swaps in a new one.
+"""
+
+import asyncio
+import json
+import time
+
+from llama_index.core import Settings
+from llama_index.core.schema import QueryBundle
+from data.examples import maintenance_requests
+from src.engine import (
+    build_completion_prompt,
+    create_engine,
+    direct_parse_response,
+    engine_llm,
+    format_context,
+    generate_feedback,
+)
+from models.models import llama3_8b_interface, llama3_8b_feedback
+from src.embedding_cache import use_embedding_cache
+from src.admission import PRIORITY_ORDER, AdmissionQueue, Rejected
+
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class RetrievalBatcher:
+    """
+    Micro-batches concurrent retrievals. Queries that arrive within
+    `max_wait` seconds of each other are embedded together, with query
+    embeddings as in `engine.query`, then retrieved with the precomputed
+    embeddings in one worker thread.
+
+    Attributes:
+        query_engine (RetrieverQueryEngine): Engine whose retriever (and node
+                                             postprocessors) are used.
+        embed_model (BaseEmbedding): Model used to embed the queries.
+        max_batch (int): Maximum number of queries per batch.
+        max_wait (float): Seconds to wait for a batch to fill.
+    """
+
+    def __init__(self, query_engine, embed_model=None, max_batch=32,
+                 max_wait=0.005):
+        """
+        Initializes the RetrievalBatcher class.
+
+        Args:
+            query_engine (RetrieverQueryEngine): Engine to retrieve with.
+            embed_model (BaseEmbedding, optional): Embedding model, defaults
+                                                   to `Settings.embed_model`.
+            max_batch (int, optional): Maximum queries per batch.
+            max_wait (float, optional): Seconds to wait for a batch to fill.
+        """
+        self.query_engine = query_engine
+        self.embed_model = embed_model or Settings.embed_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def retrieve(self, query_str):
+        """
+        Retrieves the nodes for a query as part of the next batch.
+
+        Args:
+            query_str (str): The query.
+
+        Returns:
+            tuple: The QueryBundle (with its embedding) and the retrieved
+                   nodes.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query_str, future))
+        return await future
+
+    def _retrieve_batch(self, queries, embeddings):
+        results = []
+        for query_str, embedding in zip(queries, embeddings):
+            bundle = QueryBundle(query_str, embedding=embedding)
+            results.append((bundle, self.query_engine.retrieve(bundle)))
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            queries = [query_str for query_str, _ in batch]
+            try:
+                # Query (not document) embeddings, which asymmetric models
+                # and the embedding cache tell apart
+                embeddings = await asyncio.gather(
+                    *(
+                        self.embed_model.aget_query_embedding(query_str)
+                        for query_str in queries
+                    )
+                )
+                results = await asyncio.to_thread(
+                    self._retrieve_batch, queries, embeddings
+                )
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def iter_form_fields(chunks):
+    """
+    Turns streamed response text into form fields, yielding each field as
+    soon as its line is complete.
+
+    Args:
+        chunks (iterable): Pieces of the response text.
+
+    Returns:
+        generator: Dictionaries with the field name and its parsed value
+                   (or the raw text under "raw" if it could not be parsed).
+    """
+
+    def parse(line):
+        try:
+            return [
+                {"field": key, "value": value}
+                for key, value in direct_parse_response(line).items()
+            ]
+        except (ValueError, SyntaxError):
+            key, value = line.split(": ", 1)
+            return [{"field": key.strip(), "raw": value.strip()}]
+
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if ": " in line:
+                yield from parse(line)
+    if ": " in buffer:
+        yield from parse(buffer)
+
+
+class FormCompletionService:
+    """
+    An ASGI application serving form completions and feedback over one
+    shared engine.
+
+    Backpressure: at most `max_concurrency` requests are processed at a
+    time and at most `max_queue` more may wait in an `AdmissionQueue`,
+    ordered by Priority and fairly shared across departments. When the
+    queue is full the least urgent request is rejected with 503, and a
+    request that waits past its deadline is rejected with 504, both with a
+    Retry-After header. Priority and department come from the client's
+    hints, or else from the local classifier when one is given. The
+    classifier only runs while requests are queued (otherwise the request
+    is admitted at once and its priority does not matter), not while the
+    queue is shedding, and on at most `classify_concurrency` requests at a
+    time; other requests are queued as "Medium".
+
+    Attributes:
+        query_engine (RetrieverQueryEngine): Streaming form completion engine.
+        feedback_model (FeedbackModel): Model that regenerates fields.
+        max_concurrency (int): Requests processed at a time.
+        max_queue (int): Requests allowed to wait for a slot.
+        direct (bool): Whether completions bypass the response synthesizer.
+        classifier (FieldClassifier): Pre-classifies requests without
+                                      hints, or None.
+        admission (AdmissionQueue): Queue that admits requests.
+        index_manager (IndexManager): Versioned index behind the engine, or
+                                      None.
+    """
+
+    def __init__(
+        self,
+        query_engine=None,
+        feedback_model=llama3_8b_feedback,
+        max_concurrency=8,
+        max_queue=64,
+        max_batch=32,
+        max_wait=0.005,
+        direct=False,
+        classifier=None,
+        classify_concurrency=2,
+        department_weights=None,
+        index_manager=None,
+    ):
+        """
+        Initializes the FormCompletionService class.
+
+        Args:
+            query_engine (RetrieverQueryEngine, optional): Engine created with
+                `streaming=True`. Built at startup when not given.
+            feedback_model (FeedbackModel, optional): Feedback model, on
+                Replicate or local.
+            max_concurrency (int, optional): Requests processed at a time.
+            max_queue (int, optional): Requests allowed to wait.
+            max_batch (int, optional): Maximum retrievals per micro-batch.
+            max_wait (float, optional): Seconds to wait for a batch to fill.
+            direct (bool, optional): Whether to stream one LLM call with our
+                                     own prompt instead of going through the
+                                     llama_index response synthesizer.
+            classifier (FieldClassifier, optional): Sets the priority and
+                department of requests that do not give them.
+            classify_concurrency (int, optional): Requests classified at
+                a time, before they are admitted.
+            department_weights (dict, optional): Share of each department
+                within a priority, 1.0 when not listed.
+            index_manager (IndexManager, optional): Builds the engine's
+                index (once at startup if it has no version yet) and swaps
+                rebuilt versions in without a restart.
+        """
+        self.query_engine = query_engine
+        self.direct = direct
+        self.feedback_model = feedback_model
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.classifier = classifier
+        self._classify_slots = asyncio.Semaphore(classify_concurrency)
+        self.index_manager = index_manager
+        self.admission = AdmissionQueue(
+            max_concurrency, max_queue, department_weights
+        )
+        self._batch_args = {"max_batch": max_batch, "max_wait": max_wait}
+        self._batcher = None
+
+    async def startup(self):
+        if self.query_engine is None:
+            Settings.llm = llama3_8b_interface.llm
+            use_embedding_cache()
+            if self.index_manager is not None:
+                if self.index_manager.current is None:
+                    await asyncio.to_thread(
+                        self.index_manager.rebuild,
+                        maintenance_requests,
+                        background=False,
+                    )
+                self.query_engine = self.index_manager.create_engine(
+                    Settings.llm, streaming=True
+                )
+            else:
+                self.query_engine, _ = await asyncio.to_thread(
+                    create_engine,
+                    Settings.llm,
+                    maintenance_requests,
+                    streaming=True,
+                )
+        self._batcher = RetrievalBatcher(self.query_engine, **self._batch_args)
+        self._batcher.start()
+
+    async def shutdown(self):
+        if self._batcher is not None:
+            await self._batcher.stop()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        route = (scope["method"], scope["path"])
+        if route == ("GET", "/health"):
+            health = {"status": "ok", "admission": self.admission.stats()}
+            if self.index_manager is not None:
+                health["index"] = self.index_manager.status()
+            await send_json(send, 200, health)
+            return
+        if route not in (("POST", "/complete"), ("POST", "/feedback")):
+            await send_json(send, 404, {"error": "not found"})
+            return
+
+        try:
+            body = await read_json(receive)
+        except ValueError as error:
+            await send_json(send, 400, {"error": str(error)})
+            return
+
+        # Queues by priority and department, shedding load when full
+        priority, department = await self._schedule_hints(route[1], body)
+        deadline = body.get("deadline")
+        if not isinstance(deadline, (int, float)) or deadline <= 0:
+            deadline = None
+        try:
+            await self.admission.acquire(priority, department, deadline)
+        except Rejected as error:
+            await send_json(
+                send,
+                503 if error.reason == "shed" else 504,
+                {"error": str(error)},
+                headers=[(b"retry-after", b"1")],
+            )
+            return
+        try:
+            if route[1] == "/complete":
+                await self._complete(body, send)
+            else:
+                await self._feedback(body, send)
+        finally:
+            self.admission.release()
+
+    async def _schedule_hints(self, path, body):
+        """
+        Returns the priority and department a request is queued with: the
+        client's hints, else the submitted form's values for feedback, else
+        the classifier's prediction when it can change the queue order and
+        a classification slot is free.
+
+        Args:
+            path (str): "/complete" or "/feedback".
+            body (dict): The request body.
+
+        Returns:
+            tuple: The priority and the department (or None).
+        """
+        priority = body.get("priority")
+        department = body.get("department")
+        if path == "/feedback" and isinstance(body.get("form"), dict):
+            priority = priority or _top(body["form"].get("Priority"))
+            department = department or _top(body["form"].get("Department"))
+        description = body.get("description")
+        if (
+            (priority is None or department is None)
+            and self.classifier is not None
+            and isinstance(description, str)
+            and description.strip()
+            and self.admission.would_wait()
+            and not self.admission.is_full()
+            and not self._classify_slots.locked()
+        ):
+            async with self._classify_slots:
+                labels = await asyncio.to_thread(
+                    self.classifier.classify, description
+                )
+            priority = priority or labels["Priority"][0]
+            department = department or labels["Department"][0]
+        if priority not in PRIORITY_ORDER:
+            priority = "Medium"
+        return priority, department if isinstance(department, str) else None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as error:
+                    await send(
+                        {"type": "lifespan.startup.failed", "message": str(error)}
+                    )
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _complete(self, body, send):
+        description = body.get("description")
+        if not isinstance(description, str) or not description.strip():
+            await send_json(send, 400, {"error": "'description' is required"})
+            return
+
+        start = time.perf_counter()
+        bundle, nodes = await self._batcher.retrieve(
+            build_completion_prompt(description)
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+
+        # Runs the blocking LLM stream in a thread and forwards each field
+        loop = asyncio.get_running_loop()
+        fields = asyncio.Queue()
+
+        def produce():
+            try:
+                if self.direct:
+                    prompt = build_completion_prompt(
+                        description, context=format_context(nodes)
+                    )
+                    chunks = (
+                        chunk.delta or ""
+                        for chunk in engine_llm(self.query_engine).stream_complete(
+                            prompt
+                        )
+                    )
+                else:
+                    chunks = self.query_engine.synthesize(
+                        bundle, nodes
+                    ).response_gen
+                for field in iter_form_fields(chunks):
+                    loop.call_soon_threadsafe(fields.put_nowait, field)
+            except Exception as error:
+                loop.call_soon_threadsafe(
+                    fields.put_nowait, {"error": str(error)}
+                )
+            finally:
+                loop.call_soon_threadsafe(fields.put_nowait, None)
+
+        producer = loop.run_in_executor(None, produce)
+        while True:
+            field = await fields.get()
+            if field is None:
+                break
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": json.dumps(field).encode() + b"\n",
+                    "more_body": True,
+                }
+            )
+        await producer
+        done = {"done": True, "seconds": time.perf_counter() - start}
+        await send(
+            {
+                "type": "http.response.body",
+                "body": json.dumps(done).encode() + b"\n",
+                "more_body": False,
+            }
+        )
+
+    async def _feedback(self, body, send):
+        form = body.get("form")
+        fields_to_regenerate = body.get("fields_to_regenerate")
+        if not isinstance(form, dict) or not isinstance(
+            fields_to_regenerate, dict
+        ):
+            await send_json(
+                send,
+                400,
+                {"error": "'form' and 'fields_to_regenerate' are required"},
+            )
+            return
+        feedback_input = dict(form, **{"Fields to Regenerate": fields_to_regenerate})
+        try:
+            regenerated = await asyncio.to_thread(
+                generate_feedback, feedback_input, self.feedback_model
+            )
+        except (ValueError, SyntaxError) as error:
+            await send_json(send, 502, {"error": f"unparseable output: {error}"})
+            return
+        await send_json(send, 200, regenerated)
+
+
+def _top(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value if isinstance(value, str) else None
+
+
+async def read_json(receive):
+    """
+    Reads and decodes a JSON request body.
+
+    Args:
+        receive (callable): ASGI receive channel.
+
+    Returns:
+        dict: The decoded body.
+    """
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("request body too large")
+        if not message.get("more_body"):
+            break
+    try:
+        decoded = json.loads(body or b"{}")
+    except json.JSONDecodeError as error:
+        raise ValueError(f"invalid JSON: {error}") from None
+    if not isinstance(decoded, dict):
+        raise ValueError("request body must be a JSON object")
+    return decoded
+
+
+async def send_json(send, status, payload, headers=()):
+    """
+    Sends a complete JSON response.
+
+    Args:
+        send (callable): ASGI send channel.
+        status (int): HTTP status code.
+        payload (dict): Response body.
+        headers (iterable, optional): Extra (name, value) byte pairs.
+
+    Returns:
+        None.
+    """
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), *headers],
+        }
+    )
+    await send(
+        {"type": "http.response.body", "body": json.dumps(payload).encode()}
+    )
+
+
+# ASGI entry point; the engine is built once, at startup
+app = FormCompletionService()
@@ -0,0 +1,563 @@
+"""
+This file contains the sharded index, searched by scatter-gather
+
+The corpus is partitioned into shards by a hash of "Request ID" or of a
+record field such as "Form Type", and every shard is published as its own
+shared index (see `src/shared_index.py`). Each shard is served by a shard
+server process, on this machine or another node. The coordinator,
+`ShardedRetriever`, embeds a query once, sends the vector to every shard in
+parallel, and merges their top k. Shards that do not answer before the
+timeout are skipped, so a slow node degrades recall instead of latency.
+
+Usage:
+    python -m src.sharding publish <directory> --shards 4 [--by "Form Type"]
+    python -m src.sharding serve <directory>/shard-000 --port 6000
+"""
+
+import argparse
+import concurrent.futures
+import heapq
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+from data.corpus import Corpus
+from data.examples import maintenance_requests
+from src.engine import create_document, create_query_engine
+from src.shared_index import (
+    CORPUS_FILE,
+    EMBEDDINGS_FILE,
+    MANIFEST_FILE,
+    publish_index,
+)
+from src.vectors import normalize, top_k_indices
+
+
+SHARDS_FILE = "shards.json"
+AUTHKEY_VARIABLE = "FORM_SHARD_AUTHKEY"
+HANDSHAKE_TIMEOUT = 5.0
+
+
+def shard_authkey():
+    """
+    Returns the key shared by the shard servers and their coordinators,
+    read from the FORM_SHARD_AUTHKEY environment variable. There is no
+    default, since a well-known key would let anyone on the network send
+    pickles to the servers.
+
+    Returns:
+        bytes: The authentication key.
+    """
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise RuntimeError(
+            f"Set {AUTHKEY_VARIABLE} to the key shared by the shard servers"
+        )
+    return authkey.encode("utf-8")
+
+
+def shard_of(record, n_shards, by="hash"):
+    """
+    Returns the shard of a maintenance request. The hash is stable across
+    processes and machines, unlike Python's `hash`.
+
+    Args:
+        record (MaintenanceRecord | dict): The maintenance request.
+        n_shards (int): Number of shards.
+        by (str, optional): "hash" to spread records by "Request ID", or the
+                            field whose value picks the shard.
+
+    Returns:
+        int: The shard number.
+    """
+    key = record["Request ID"] if by == "hash" else record[by]
+    return zlib.crc32(str(key).encode("utf-8")) % n_shards
+
+
+def shard_directory(directory, shard):
+    return os.path.join(directory, f"shard-{shard:03d}")
+
+
+def publish_shards(requests, directory, n_shards, by="hash", embed_model=None,
+                   batch_size=1024):
+    """
+    Partitions the maintenance requests and publishes every shard. Each
+    shard is one pass over the requests, so they are never all held in
+    memory.
+
+    Args:
+        requests (Corpus | list): Maintenance requests, iterable repeatedly.
+        directory (str): Output directory, created if missing.
+        n_shards (int): Number of shards.
+        by (str, optional): Partitioning key, see `shard_of`.
+        embed_model (BaseEmbedding, optional): Embedding model, defaults to
+                                               `Settings.embed_model`.
+        batch_size (int, optional): Records embedded per call.
+
+    Returns:
+        list: The shard directories.
+    """
+    os.makedirs(directory, exist_ok=True)
+    directories = []
+    for shard in range(n_shards):
+        path = shard_directory(directory, shard)
+        publish_index(
+            (entry for entry in requests if shard_of(entry, n_shards, by) == shard),
+            path,
+            embed_model=embed_model,
+            batch_size=batch_size,
+        )
+        directories.append(path)
+    with open(os.path.join(directory, SHARDS_FILE), "w") as file:
+        json.dump(
+            {"shards": n_shards, "by": by, "directories": directories},
+            file,
+            indent=4,
+        )
+    return directories
+
+
+class Shard:
+    """
+    One shard's records and memory-mapped embeddings.
+
+    Attributes:
+        directory (str): Directory written by `publish_index`.
+        embeddings (np.ndarray): Normalized embeddings, or None when empty.
+        records (Corpus): The shard's maintenance requests.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE)) as file:
+            self.manifest = json.load(file)
+        self.records = Corpus(os.path.join(directory, CORPUS_FILE))
+        self.embeddings = None
+        if self.manifest["count"]:
+            self.embeddings = np.load(
+                os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r"
+            )
+
+    def search(self, query_vector, k):
+        """
+        Finds the records most similar to a query.
+
+        Args:
+            query_vector (np.ndarray): Normalized query embedding.
+            k (int): Number of records.
+
+        Returns:
+            list: (row, score, record dictionary) tuples, best first.
+        """
+        if self.embeddings is None:
+            return []
+        scores = self.embeddings @ np.asarray(query_vector, dtype=np.float32)
+        return [
+            (int(row), float(scores[row]), self.records[int(row)].to_dict())
+            for row in top_k_indices(scores, k)
+        ]
+
+
+class _HandshakeChannel:
+    """
+    The message framing of `Connection` over a socket with a timeout, so
+    the challenge of `multiprocessing.connection` can be bounded with
+    `socket.settimeout` on every platform.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def send_bytes(self, data):
+        self._sock.sendall(struct.pack("!i", len(data)) + data)
+
+    def recv_bytes(self, maxlength=None):
+        (size,) = struct.unpack("!i", self._recv(4))
+        if size < 0 or (maxlength is not None and size > maxlength):
+            raise OSError("bad message length")
+        return self._recv(size)
+
+    def _recv(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+
+def _authenticate(sock, authkey, timeout, server):
+    """
+    Runs the mutual challenge of `multiprocessing.connection` on a
+    connected socket and wraps it in a `Connection`, giving up after
+    `timeout` seconds so a peer that never answers cannot hold it.
+
+    Args:
+        sock (socket.socket): Connected socket, owned by the connection
+                              from now on.
+        authkey (bytes): Authentication key.
+        timeout (float): Seconds the handshake may take.
+        server (bool): Whether this is the accepting side.
+
+    Returns:
+        Connection: The authenticated connection.
+    """
+    channel = _HandshakeChannel(sock)
+    try:
+        sock.settimeout(max(timeout, 0.001))
+        if server:
+            multiprocessing.connection.deliver_challenge(channel, authkey)
+            multiprocessing.connection.answer_challenge(channel, authkey)
+        else:
+            multiprocessing.connection.answer_challenge(channel, authkey)
+            multiprocessing.connection.deliver_challenge(channel, authkey)
+        # Blocking mode, as `Connection` reads the descriptor directly
+        sock.settimeout(None)
+    except BaseException:
+        sock.close()
+        raise
+    return multiprocessing.connection.Connection(sock.detach())
+
+
+def serve_shard(directory, address, authkey, ready=None):
+    """
+    Serves searches of one shard until the process is stopped. Every
+    connection is authenticated and handled by its own thread, so a client
+    that stalls during the handshake only holds its own thread. A
+    connection carries one request at a time: ("search", query vector, k),
+    answered with ("ok", results) or ("error", message).
+
+    Args:
+        directory (str): Shard directory written by `publish_index`.
+        address (tuple): (host, port) to listen on; port 0 picks a free one.
+        authkey (bytes): Key clients must authenticate with.
+        ready (Connection, optional): Receives the listening address once
+                                      the shard is loaded.
+
+    Returns:
+        None.
+    """
+    shard = Shard(directory)
+    with socket.create_server(tuple(address)) as listener:
+        if ready is not None:
+            ready.send(listener.getsockname()[:2])
+            ready.close()
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                continue
+            threading.Thread(
+                target=_handle, args=(shard, sock, authkey), daemon=True
+            ).start()
+
+
+def _handle(shard, sock, authkey):
+    try:
+        connection = _authenticate(sock, authkey, HANDSHAKE_TIMEOUT, server=True)
+    except (OSError, EOFError, multiprocessing.AuthenticationError):
+        return
+    with connection:
+        while True:
+            try:
+                _, query_vector, k = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ("ok", shard.search(query_vector, k))
+            except Exception as error:
+                reply = ("error", repr(error))
+            try:
+                connection.send(reply)
+            except OSError:
+                return
+
+
+class ShardClient:
+    """
+    Connections to one shard server. Connections are reused between
+    searches; one that times out is closed, since its late answer would
+    otherwise be read by the next search.
+
+    Attributes:
+        address (tuple): (host, port) of the shard server.
+        authkey (bytes): Authentication key.
+        timeouts (int): Searches that timed out.
+        errors (int): Searches that failed.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.timeouts = 0
+        self.errors = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connection(self, deadline):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise TimeoutError("Deadline passed before connecting")
+        sock = socket.create_connection(self.address, timeout=timeout)
+        return _authenticate(
+            sock, self.authkey, deadline - time.monotonic(), server=False
+        )
+
+    def search(self, query_vector, k, deadline):
+        """
+        Searches the shard.
+
+        Args:
+            query_vector (np.ndarray): Normalized query embedding.
+            k (int): Number of records.
+            deadline (float): `time.monotonic()` by which to give up.
+
+        Returns:
+            list: The shard's results, or None if it failed or was too slow.
+        """
+        connection = None
+        try:
+            connection = self._connection(deadline)
+            connection.send(("search", query_vector, k))
+            if not connection.poll(max(0.0, deadline - time.monotonic())):
+                self.timeouts += 1
+                connection.close()
+                return None
+            status, results = connection.recv()
+        except TimeoutError:
+            # Connecting or authenticating took past the deadline
+            self.timeouts += 1
+            return None
+        except (OSError, EOFError, multiprocessing.AuthenticationError):
+            self.errors += 1
+            if connection is not None:
+                connection.close()
+            return None
+        with self._lock:
+            self._idle.append(connection)
+        if status != "ok":
+            self.errors += 1
+            return None
+        return results
+
+    def close(self):
+        with self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    A coordinator that scatters a query to every shard and gathers the
+    overall top k. Node ids are "<shard>:<row>".
+
+    Attributes:
+        clients (list): One ShardClient per shard.
+        embed_model (BaseEmbedding): Model used to embed queries, which must
+                                     match the shards'.
+        similarity_top_k (int): Number of records to retrieve.
+        timeout (float): Seconds to wait for the shards.
+    """
+
+    def __init__(self, addresses, embed_model=None, similarity_top_k=5,
+                 timeout=1.0, authkey=None, **kwargs):
+        """
+        Initializes the ShardedRetriever class.
+
+        Args:
+            addresses (list): (host, port) of every shard server.
+            embed_model (BaseEmbedding, optional): Query embedding model,
+                                                   defaults to
+                                                   `Settings.embed_model`.
+            similarity_top_k (int, optional): Records to retrieve, default
+                                              is 5.
+            timeout (float, optional): Seconds to wait for the shards.
+            authkey (bytes, optional): Key of the shard servers, defaults
+                                       to FORM_SHARD_AUTHKEY.
+        """
+        authkey = authkey or shard_authkey()
+        self.clients = [ShardClient(address, authkey) for address in addresses]
+        self.embed_model = embed_model or Settings.embed_model
+        self.similarity_top_k = similarity_top_k
+        self.timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4 * len(self.clients), thread_name_prefix="scatter"
+        )
+        super().__init__(**kwargs)
+
+    def _retrieve(self, query_bundle):
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        query_vector = normalize(query_bundle.embedding)
+        deadline = time.monotonic() + self.timeout
+
+        searches = [
+            self._executor.submit(
+                client.search, query_vector, self.similarity_top_k, deadline
+            )
+            for client in self.clients
+        ]
+        # Also bounds shards that are still connecting
+        concurrent.futures.wait(
+            searches, timeout=max(0.0, deadline - time.monotonic())
+        )
+        candidates = []
+        answered = 0
+        for shard, search in enumerate(searches):
+            if not search.done():
+                # A queued search never starts and is counted here; a
+                # running one stops and counts itself at the deadline
+                if search.cancel():
+                    self.clients[shard].timeouts += 1
+                continue
+            results = search.result()
+            if results is None:
+                continue
+            answered += 1
+            candidates.extend(
+                (score, shard, row, record) for row, score, record in results
+            )
+        if not answered:
+            raise RuntimeError("No shard answered within the timeout")
+
+        nodes = []
+        for score, shard, row, record in heapq.nlargest(
+            self.similarity_top_k, candidates, key=lambda candidate: candidate[0]
+        ):
+            document = create_document(record)
+            document.id_ = f"{shard}:{row}"
+            nodes.append(NodeWithScore(node=document, score=score))
+        return nodes
+
+    def stats(self):
+        return [
+            {
+                "address": client.address,
+                "timeouts": client.timeouts,
+                "errors": client.errors,
+            }
+            for client in self.clients
+        ]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for client in self.clients:
+            client.close()
+
+
+class LocalShards:
+    """
+    Shard servers run as local processes, standing in for separate nodes.
+
+    Attributes:
+        directories (list): Shard directories.
+        addresses (list): (host, port) of every shard server.
+        authkey (bytes): Key of the shard servers, to pass to
+                         `ShardedRetriever`.
+    """
+
+    def __init__(self, directories, authkey=None):
+        """
+        Initializes the LocalShards class, starting one server process per
+        shard and waiting until they are listening.
+
+        Args:
+            directories (list): Shard directories.
+            authkey (bytes, optional): Key of the shard servers, random by
+                                       default.
+        """
+        context = multiprocessing.get_context("spawn")
+        self.authkey = authkey or os.urandom(32)
+        self.directories = list(directories)
+        self.addresses = []
+        self._processes = []
+        for directory in self.directories:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=serve_shard,
+                args=(directory, ("localhost", 0), self.authkey, sender),
+                daemon=True,
+            )
+            process.start()
+            sender.close()
+            self._processes.append(process)
+            self.addresses.append(receiver.recv())
+            receiver.close()
+
+    def close(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create_sharded_engine(llm_config, addresses, streaming=False, timeout=1.0,
+                          authkey=None):
+    """
+    Creates a query engine that retrieves from shard servers, the sharded
+    counterpart of `create_engine`.
+
+    Args:
+        llm_config (Replicate): Replicate (API) object that represents
+                                a large language model (LLM).
+        addresses (list): (host, port) of every shard server.
+        streaming (bool, optional): Whether to stream the LLM response.
+        timeout (float, optional): Seconds to wait for the shards.
+        authkey (bytes, optional): Key of the shard servers, defaults to
+                                   FORM_SHARD_AUTHKEY.
+
+    Returns:
+        RetrieverQueryEngine: The query engine.
+    """
+    retriever = ShardedRetriever(addresses, timeout=timeout, authkey=authkey)
+    return create_query_engine(retriever, llm_config, streaming=streaming)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Sharded index tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="Partition and publish")
+    publish.add_argument("directory", help="Output directory")
+    publish.add_argument("--shards", type=int, default=4)
+    publish.add_argument(
+        "--by", default="hash", help='"hash" (of Request ID) or a field'
+    )
+    serve = commands.add_parser("serve", help="Serve one shard")
+    serve.add_argument("directory", help="Shard directory")
+    serve.add_argument("--host", default="localhost")
+    serve.add_argument("--port", type=int, default=6000)
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        for path in publish_shards(
+            maintenance_requests, args.directory, args.shards, args.by
+        ):
+            print(path)
+    else:
+        if not os.environ.get(AUTHKEY_VARIABLE):
+            parser.error(f"{AUTHKEY_VARIABLE} must be set to the shared key")
+        serve_shard(args.directory, (args.host, args.port), shard_authkey())
@@ -0,0 +1,359 @@
+"""
+This file lets many worker processes share one read-only index
+
+The parent process embeds the corpus once and publishes it as a directory
+holding the columnar corpus and a .npy matrix of normalized embeddings.
+Workers memory-map both files, so every process reads the same physical
+pages from the OS page cache instead of building its own copy.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.schema import MetadataMode
+from data.corpus import Corpus, write_corpus
+from data.examples import maintenance_requests
+from src.engine import (
+    create_document,
+    create_query_engine,
+    generate_form_completion,
+    iter_batches,
+)
+from src.quantization import (
+    QUANTIZERS,
+    QuantizedRetriever,
+    load_quantizer,
+    save_quantizer,
+)
+from src.retrieval import ClusteredRetriever, MatrixRetriever
+from src.vectors import normalize
+import models.models
+
+
+CORPUS_FILE = "records.corpus"
+EMBEDDINGS_FILE = "embeddings.npy"
+MANIFEST_FILE = "manifest.json"
+CODES_FILE = "codes.npy"
+QUANTIZER_FILE = "quantizer.npz"
+
+
+def _partial(path):
+    # Scratch name of a file published with `os.replace`, so workers that
+    # mapped the previous version keep reading it intact
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".partial-{name}")
+
+
+def publish_index(requests, directory, embed_model=None, batch_size=1024,
+                  quantization=None):
+    """
+    Embeds the maintenance requests once and publishes them for workers.
+    The embedded text is the same as what `create_engine` embeds. Every
+    file is written aside and renamed into place, the manifest last, so a
+    directory can be republished while workers have it mapped.
+
+    Args:
+        requests (Corpus | list): Maintenance requests to publish.
+        directory (str): Output directory, created if missing.
+        embed_model (BaseEmbedding, optional): Embedding model, defaults to
+                                               `Settings.embed_model`.
+        batch_size (int, optional): Records embedded per call.
+        quantization (str | object, optional): Also publishes quantized
+                                               embeddings: "int8", "pq" or
+                                               a quantizer instance.
+
+    Returns:
+        str: The published directory.
+    """
+    embed_model = embed_model or Settings.embed_model
+    os.makedirs(directory, exist_ok=True)
+    corpus_path = os.path.join(directory, CORPUS_FILE)
+    embeddings_path = os.path.join(directory, EMBEDDINGS_FILE)
+    count = write_corpus(requests, _partial(corpus_path))
+
+    with Corpus(_partial(corpus_path)) as corpus:
+        embeddings = None
+        row = 0
+        for batch in iter_batches(corpus, batch_size):
+            texts = [
+                create_document(entry).get_content(
+                    metadata_mode=MetadataMode.EMBED
+                )
+                for entry in batch
+            ]
+            vectors = normalize(embed_model.get_text_embedding_batch(texts))
+            if embeddings is None:
+                # Writes the matrix in place instead of holding it in memory
+                embeddings = np.lib.format.open_memmap(
+                    _partial(embeddings_path),
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(count, vectors.shape[1]),
+                )
+            embeddings[row : row + len(vectors)] = vectors
+            row += len(vectors)
+        if embeddings is not None:
+            embeddings.flush()
+            dimension = embeddings.shape[1]
+            del embeddings
+        else:
+            dimension = 0
+    os.replace(_partial(corpus_path), corpus_path)
+    if dimension:
+        os.replace(_partial(embeddings_path), embeddings_path)
+
+    manifest = {
+        "count": count,
+        "dimension": dimension,
+        "embed_model": embed_model.model_name,
+    }
+    if quantization is not None and count:
+        manifest["quantization"] = quantize_index(directory, quantization)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(_partial(manifest_path), "w") as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(_partial(manifest_path), manifest_path)
+    return directory
+
+
+def quantize_index(directory, quantization="int8"):
+    """
+    Trains a quantizer on published embeddings and writes their codes next
+    to them.
+
+    Args:
+        directory (str): Directory written by `publish_index`.
+        quantization (str | object, optional): "int8", "pq" or a quantizer
+                                               instance.
+
+    Returns:
+        str: The kind of quantization.
+    """
+    quantizer = quantization
+    if isinstance(quantization, str):
+        quantizer = QUANTIZERS[quantization]()
+    embeddings = np.load(
+        os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r"
+    )
+    quantizer.fit(embeddings)
+    codes_path = os.path.join(directory, CODES_FILE)
+    quantizer_path = os.path.join(directory, QUANTIZER_FILE)
+    np.save(_partial(codes_path), quantizer.encode(embeddings))
+    save_quantizer(quantizer, _partial(quantizer_path))
+    os.replace(_partial(codes_path), codes_path)
+    os.replace(_partial(quantizer_path), quantizer_path)
+    return quantizer.kind
+
+
+def read_manifest(directory, embed_model):
+    """
+    Reads the manifest of a published index and checks it can be queried
+    with an embedding model.
+
+    Args:
+        directory (str): Directory written by `publish_index`.
+        embed_model (BaseEmbedding): Query embedding model.
+
+    Returns:
+        dict: The manifest.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+    if manifest["embed_model"] != embed_model.model_name:
+        raise ValueError(
+            f"Index in {directory} was built with {manifest['embed_model']}, "
+            f"not {embed_model.model_name}"
+        )
+    if not manifest["count"]:
+        # An empty corpus publishes no embeddings to search
+        raise ValueError(f"Index in {directory} holds no records")
+    return manifest
+
+
+def attach_index(directory, embed_model=None, similarity_top_k=5,
+                 quantized=False, rerank_k=50, clusters=None, n_probe=2):
+    """
+    Attaches to a published index without copying it.
+
+    Args:
+        directory (str): Directory written by `publish_index`.
+        embed_model (BaseEmbedding, optional): Query embedding model, which
+                                               must match the published one.
+        similarity_top_k (int, optional): Records to retrieve, default is 5.
+        quantized (bool, optional): Whether to search the quantized
+                                    embeddings, loaded in memory, and only
+                                    read exact ones to re-rank.
+        rerank_k (int, optional): Candidates re-ranked when quantized; 0
+                                  disables re-ranking.
+        clusters (str | int, optional): Searches two-stage, by the centroids
+                                        of this field's values or of this
+                                        many k-means clusters first (see
+                                        `ClusteredRetriever`).
+        n_probe (int, optional): Clusters searched per query.
+
+    Returns:
+        MatrixRetriever: A retriever over the memory-mapped index.
+    """
+    embed_model = embed_model or Settings.embed_model
+    manifest = read_manifest(directory, embed_model)
+    embeddings = np.load(
+        os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r"
+    )
+    records = Corpus(os.path.join(directory, CORPUS_FILE))
+    if quantized:
+        if "quantization" not in manifest:
+            raise ValueError(f"Index in {directory} was published unquantized")
+        return QuantizedRetriever(
+            np.load(os.path.join(directory, CODES_FILE)),
+            load_quantizer(os.path.join(directory, QUANTIZER_FILE)),
+            records,
+            embeddings=embeddings if rerank_k else None,
+            rerank_k=rerank_k,
+            embed_model=embed_model,
+            similarity_top_k=similarity_top_k,
+        )
+    if clusters is not None:
+        return ClusteredRetriever(
+            embeddings,
+            records,
+            clusters=clusters,
+            n_probe=n_probe,
+            embed_model=embed_model,
+            similarity_top_k=similarity_top_k,
+        )
+    return MatrixRetriever(
+        embeddings,
+        records,
+        embed_model=embed_model,
+        similarity_top_k=similarity_top_k,
+    )
+
+
+def create_shared_engine(llm_config, directory, streaming=False,
+                         embed_model=None):
+    """
+    Creates a query engine over a published index, the shared counterpart
+    of `create_engine`.
+
+    Args:
+        llm_config (Replicate): Replicate (API) object that represents
+                                a large language model (LLM).
+        directory (str): Directory written by `publish_index`.
+        streaming (bool, optional): Whether to stream the LLM response.
+        embed_model (BaseEmbedding, optional): Query embedding model,
+                                               defaults to
+                                               `Settings.embed_model`.
+
+    Returns:
+        RetrieverQueryEngine: The query engine.
+    """
+    retriever = attach_index(directory, embed_model=embed_model)
+    return create_query_engine(retriever, llm_config, streaming=streaming)
+
+
+# Engine of the current worker process, set by `_init_worker`
+_worker_engine = None
+
+
+def _init_worker(directory, model_name, embed_model):
+    global _worker_engine
+    # Spawned workers start from default settings, so the parent's
+    # embedding model is passed in explicitly
+    Settings.llm = getattr(models.models, model_name).llm
+    Settings.embed_model = embed_model
+    _worker_engine = create_shared_engine(
+        Settings.llm, directory, embed_model=embed_model
+    )
+
+
+def _complete(description):
+    return generate_form_completion(_worker_engine, description)
+
+
+class WorkerPool:
+    """
+    A pool of worker processes that complete forms against one shared,
+    memory-mapped index.
+
+    Attributes:
+        directory (str): Directory written by `publish_index`.
+        model_name (str): Name of the `models.models` object whose LLM the
+                          workers use, e.g. "llama3_8b_interface".
+        processes (int): Number of worker processes.
+        embed_model (BaseEmbedding): Query embedding model of the workers.
+    """
+
+    def __init__(self, directory, model_name="llama3_8b_interface",
+                 processes=None, embed_model=None):
+        """
+        Initializes the WorkerPool class and starts the workers.
+
+        Args:
+            directory (str): Directory written by `publish_index`.
+            model_name (str, optional): `models.models` object to use.
+            processes (int, optional): Worker count, defaults to one per
+                                       core.
+            embed_model (BaseEmbedding, optional): Query embedding model,
+                                                   which must match the
+                                                   published one; defaults
+                                                   to `Settings.embed_model`.
+        """
+        self.directory = directory
+        self.model_name = model_name
+        self.processes = processes or os.cpu_count()
+        self.embed_model = embed_model or Settings.embed_model
+        # Fails here rather than in every worker's initializer, which the
+        # pool would keep restarting
+        read_manifest(directory, self.embed_model)
+        self._pool = multiprocessing.get_context("spawn").Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(directory, model_name, self.embed_model),
+        )
+
+    def complete(self, descriptions, ordered=True):
+        """
+        Completes forms for many descriptions across the workers.
+
+        Args:
+            descriptions (iterable): Descriptions of problems.
+            ordered (bool, optional): Whether to yield results in input
+                                      order rather than as they finish.
+
+        Returns:
+            generator: The completed forms in dictionary form.
+        """
+        if ordered:
+            return self._pool.imap(_complete, descriptions)
+        return self._pool.imap_unordered(_complete, descriptions)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Publish the corpus as a shared, memory-mapped index."
+    )
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument(
+        "--quantization", choices=["int8", "pq"], help="Also quantize"
+    )
+    args = parser.parse_args()
+
+    publish_index(
+        maintenance_requests, args.directory, quantization=args.quantization
+    )
+    print(f"Published {len(maintenance_requests)} records to {args.directory}")
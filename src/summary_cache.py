@@ -0,0 +1,155 @@
+"""
+This file contains the on-disk cache of rephrased summaries used by the
+evaluation harness
+
+Rephrasing every description with GPT-4o is the slowest and most expensive
+step of an evaluation, and at temperature 0.9 it makes runs incomparable.
+The cache is content-addressed: a summary's key hashes the normalized
+description, the system prompt, the user prompt templates and the
+generation parameters, so editing a prompt or a parameter never serves
+stale summaries, while evaluating
+another model against the same corpus reuses them.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from src.embedding_cache import normalize_text
+from src.prompts import (
+    augmented_prompt_template,
+    batch_augmented_prompt,
+    generating_augmented_summaries_prompt,
+)
+
+
+DEFAULT_SUMMARY_CACHE = "cache/summaries.sqlite3"
+
+# Prompts the summaries are generated with; the batched prompt is rendered
+# with placeholders, since it is built by a function
+REPHRASING_PROMPTS = (
+    generating_augmented_summaries_prompt,
+    augmented_prompt_template,
+    batch_augmented_prompt(["{description}", "{description}"]),
+)
+
+
+class SummaryCache:
+    """
+    An SQLite store of rephrased summaries per description.
+
+    Attributes:
+        path (str): SQLite cache file.
+        prompt_hash (str): Hash of the prompts the summaries were
+                           generated with.
+        parameters (dict): Generation parameters, e.g. model and
+                           temperature.
+        hits (int): Descriptions served from the cache.
+        misses (int): Descriptions that had to be rephrased.
+    """
+
+    def __init__(self, path=DEFAULT_SUMMARY_CACHE,
+                 prompts=REPHRASING_PROMPTS, parameters=None):
+        """
+        Initializes the SummaryCache class.
+
+        Args:
+            path (str, optional): SQLite cache file.
+            prompts (tuple, optional): System prompt and user prompt
+                                       templates of the rephrasing.
+            parameters (dict, optional): Generation parameters, part of the
+                                         key.
+        """
+        self.path = path
+        self.prompt_hash = hashlib.sha256(
+            json.dumps(list(prompts)).encode("utf-8")
+        ).hexdigest()
+        self.parameters = dict(parameters or {})
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries "
+            "(key TEXT PRIMARY KEY, summaries TEXT)"
+        )
+        self._db.commit()
+
+    def key(self, description):
+        content = json.dumps(
+            {
+                "description": normalize_text(description),
+                "prompt": self.prompt_hash,
+                "parameters": self.parameters,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get_many(self, descriptions, n_rephrasings=1):
+        """
+        Looks up the cached summaries of descriptions.
+
+        Args:
+            descriptions (list): Descriptions of problems.
+            n_rephrasings (int, optional): Summaries needed per description;
+                                           descriptions with fewer cached
+                                           are treated as missing.
+
+        Returns:
+            dict: The first `n_rephrasings` summaries of every description
+                  found.
+        """
+        keys = {self.key(description): description for description in descriptions}
+        found = {}
+        with self._lock:
+            items = list(keys)
+            for start in range(0, len(items), 500):
+                chunk = items[start : start + 500]
+                rows = self._db.execute(
+                    "SELECT key, summaries FROM summaries WHERE key IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, summaries in rows:
+                    summaries = json.loads(summaries)
+                    if len(summaries) >= n_rephrasings:
+                        found[keys[key]] = summaries[:n_rephrasings]
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, summaries):
+        """
+        Stores summaries, replacing earlier ones for the same descriptions.
+
+        Args:
+            summaries (dict): List of summaries per description.
+
+        Returns:
+            None.
+        """
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?)",
+                [
+                    (self.key(description), json.dumps(values))
+                    for description, values in summaries.items()
+                ],
+            )
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -6,14 +6,45 @@ from llama_index.core import Settings
 from data.examples import maintenance_requests
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics import classification_report
-from engine import create_engine, generate_form_completion
+from src.engine import (
+    ESCALATION_CONFIG,
+    adapt_record_to_form,
+    create_engine,
+    engine_llm,
+    generate_form_completion,
+    iter_batches,
+    model_version,
+    nearest_records,
+)
+from src.classifier import FieldClassifier
+from src.embedding_cache import use_embedding_cache
+from src.jsonl import truncate_torn_line
+from src.summary_cache import DEFAULT_SUMMARY_CACHE, SummaryCache
 from rouge_score import rouge_scorer
 from bert_score import score
+import contextlib
+import hashlib
 import json
-from src.prompts import generate_data, generating_augmented_summaries_prompt
+import os
+import time
+from src.prompts import (
+    generate_data,
+    generating_augmented_summaries_prompt,
+    batch_augmented_prompt,
+    parse_batched_outputs,
+)
 from collections import Counter
 
 
+# Generation parameters of the rephrased summaries, part of their cache key
+REPHRASE_PARAMETERS = {
+    "model": "gpt-4o",
+    "temperature": 0.9,
+    "max_tokens": 500,
+    "batch_max_tokens_per_description": 200,
+}
+
+
 def calculate_rouge(generated, reference):
     """
     Calculates the Rouge score based on the generated description
@@ -53,33 +84,250 @@ def calculate_bert(generated, reference):
     }
 
 
-def write_results_to_file(
-    filename,
-    department_results,
-    priority_results,
-    generated_summaries,
-    generated_descriptions,
-    expected_descriptions,
-):
+class ResultsWriter:
+    """
+    Streaming sink for evaluation results. Each completed form is appended
+    to a JSONL file, together with its metrics, as soon as it finishes, so
+    a crash loses at most the record in progress. The first line records
+    the run (see `run_identity`), and only the same run may resume the file.
+
+    Attributes:
+        path (str): Path to the JSONL results file.
+        run (dict): Identity of the run writing the results.
+        completed (set): Positions of the records already in the file.
+    """
+
+    def __init__(self, path, resume=True, run=None):
+        """
+        Initializes the ResultsWriter class.
+
+        Args:
+            path (str): Path to the JSONL results file.
+            resume (bool, optional): Whether to keep the results of a
+                                     previous run and skip those records.
+                                     Otherwise the file is truncated.
+            run (dict, optional): Identity of the run, which must match the
+                                  one in the file to resume it.
+        """
+        self.path = path
+        self.run = run
+        self.completed = set()
+        resume = resume and os.path.exists(path)
+        if resume:
+            truncate_torn_line(path)
+            resume = os.path.getsize(path) > 0
+        if resume:
+            previous = results_run(path)
+            if previous != run:
+                raise ValueError(
+                    f"{path} holds the results of another run ({previous}); "
+                    "pass resume=False to overwrite them or use another "
+                    "results_path"
+                )
+            self.completed = {result["index"] for result in iter_results(path)}
+            self.file = open(path, "a")
+        else:
+            self.file = open(path, "w")
+            self.file.write(json.dumps({"run": run}) + "\n")
+            self.file.flush()
+
+    def write(self, result):
+        """
+        Appends one result and flushes it to disk.
+
+        Args:
+            result (dict): The result for a single record.
+
+        Returns:
+            None.
+        """
+        self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+        self.completed.add(result["index"])
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_results(results_path):
+    """
+    Streams the results written by `ResultsWriter`, one record at a time.
+
+    Args:
+        results_path (str): Path to the JSONL results file.
+
+    Returns:
+        generator: The results in dictionary form.
+    """
+    with open(results_path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn final line from an interrupted run
+                return
+            if "run" not in result:
+                yield result
+
+
+def results_run(results_path):
+    """
+    Reads the run identity that `ResultsWriter` stores in the first line of
+    a results file.
+
+    Args:
+        results_path (str): Path to the JSONL results file.
+
+    Returns:
+        dict: The run identity, or None if the file has none.
+    """
+    with open(results_path) as file:
+        try:
+            header = json.loads(file.readline())
+        except json.JSONDecodeError:
+            return None
+    return header.get("run")
+
+
+def run_identity(query_engine, direct=False):
+    """
+    Returns what decides the completions of an evaluation run: the LLM, the
+    completion prompt and the engine's prompt templates.
+
+    Args:
+        query_engine (QueryEngine): Query engine for RAG system.
+        direct (bool, optional): Whether forms are completed with the direct
+                                 single-call path.
+
+    Returns:
+        dict: The run identity, stored in the results file.
+    """
+    templates = json.dumps(
+        {
+            name: prompt.get_template()
+            for name, prompt in query_engine.get_prompts().items()
+        },
+        sort_keys=True,
+    )
+    return {
+        "model": model_version(engine_llm(query_engine)),
+        "templates": hashlib.sha256(templates.encode("utf-8")).hexdigest(),
+        "direct": direct,
+    }
+
+
+def results_path_for(filename):
+    """
+    Returns the JSONL results file of a report, so evaluations written to
+    different reports never share results.
+
+    Args:
+        filename (str): Report filename.
+
+    Returns:
+        str: The report's path with a .jsonl extension.
+    """
+    return os.path.splitext(filename)[0] + ".jsonl"
+
+
+def label_report(pairs):
+    """
+    Builds a classification report from (expected, generated) label pair
+    counts, so the report needs memory for the distinct pairs only.
+
+    Args:
+        pairs (Counter): Counts of (expected, generated) label pairs.
+
+    Returns:
+        str: The sklearn classification report.
+    """
+    expected, generated = zip(*pairs) if pairs else ((), ())
+    return classification_report(
+        expected, generated, sample_weight=list(pairs.values())
+    )
+
+
+def top_label(value):
+    """
+    Returns the most likely label of a field, which the interface prompt
+    returns as a list sorted in decreasing order of probability.
+
+    Args:
+        value (str | list): A generated Department or Priority value.
+
+    Returns:
+        str: The most likely label.
+    """
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else ""
+    return value
+
+
+def latency_summary(latencies):
     """
-    Writes the LLM results to the designated filepath.
+    Summarizes a list of latencies.
+
+    Args:
+        latencies (list): Latencies in seconds.
+
+    Returns:
+        str: Mean, p50 and p95 latency in milliseconds.
+    """
+    if not latencies:
+        return "n/a"
+    ordered = sorted(latencies)
+    p50 = ordered[int(0.50 * (len(ordered) - 1))]
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    mean = sum(ordered) / len(ordered)
+    return (
+        f"mean {1000 * mean:.1f} ms, p50 {1000 * p50:.1f} ms, "
+        f"p95 {1000 * p95:.1f} ms"
+    )
+
+
+def write_results_to_file(filename, results_path):
+    """
+    Writes the LLM results to the designated filepath. The report is
+    computed by streaming over the JSONL results file.
 
     Args:
         filename (str): Output filename.
-        department_results (str): LLM prediction of department.
-        priority_results (str): LLM prediction of priority.
-        generated_summaries (str): LLM prediction of summary.
-        generated_descriptions (str): LLM prediction of description.
-        expected_descriptions (str): Actual description for reference.
+        results_path (str): Path to the JSONL results file.
 
     Returns:
         None.
     """
+    department_pairs = Counter()
+    priority_pairs = Counter()
+    classifier_pairs = {"Department": Counter(), "Priority": Counter()}
+    llm_latencies = []
+    classifier_latencies = []
+    classifier_protocols = set()
+    for result in iter_results(results_path):
+        expected, form = result["expected"], result["form"]
+        department_pairs[
+            (expected["Department"], top_label(form["Department"]))
+        ] += 1
+        priority_pairs[(expected["Priority"], top_label(form["Priority"]))] += 1
+        if "llm_seconds" in result:
+            llm_latencies.append(result["llm_seconds"])
+        if "classifier" in result:
+            for field, pairs in classifier_pairs.items():
+                pairs[(expected[field], result["classifier"][field][0])] += 1
+            classifier_latencies.append(result["classifier"]["seconds"])
+            classifier_protocols.add(result["classifier"].get("protocol", "unknown"))
+
     # Formats the results for easy reasability.
     with open(filename, "w") as file:
         file.write("Department Scores:\n")
         file.write("-----------------------------------------\n")
-        file.write(f"{department_results}\n\n")
+        file.write(f"{label_report(department_pairs)}\n\n")
 
         file.write("\n")
         file.write("-----------------------------------------\n")
@@ -87,41 +335,77 @@ def write_results_to_file(
 
         file.write("Priority Scores:\n")
         file.write("-----------------------------------------\n")
-        file.write(f"{priority_results}\n\n")
+        file.write(f"{label_report(priority_pairs)}\n\n")
 
-        for generated, expected, summary in zip(
-            generated_descriptions, expected_descriptions, generated_summaries
-        ):
-            file.write(f"Generated Summary: {summary}\n")
+        # Local classifier fast path compared against the LLM path
+        if classifier_latencies:
             file.write("\n")
-            file.write(f"Generated Description: {generated}\n")
+            file.write("-----------------------------------------\n")
             file.write("\n")
-            file.write(f"Actual Description: {expected}\n")
+            file.write(
+                "Classifier evaluation protocol: "
+                f"{', '.join(sorted(classifier_protocols))} (the evaluated "
+                "record is held out of the classifier's training data)\n"
+            )
+            for field, pairs in classifier_pairs.items():
+                file.write("\n")
+                file.write("-----------------------------------------\n")
+                file.write("\n")
+                file.write(f"Classifier {field} Scores:\n")
+                file.write("-----------------------------------------\n")
+                file.write(f"{label_report(pairs)}\n\n")
+            file.write("Latency:\n")
+            file.write("-----------------------------------------\n")
+            file.write(f"LLM form completion: {latency_summary(llm_latencies)}\n")
+            file.write(
+                f"Classifier (Department, Priority): "
+                f"{latency_summary(classifier_latencies)}\n\n"
+            )
+            file.write("-----------------------------------------\n")
+            file.write("\n")
+
+        for result in iter_results(results_path):
+            file.write(f"Generated Summary: {result['summary']}\n")
             file.write("\n")
-            bert = calculate_bert(generated, expected)
-            file.write(f"BERT Score: {bert}\n")
+            file.write(
+                f"Generated Description: "
+                f"{result['form']['Description of Issue']}\n"
+            )
+            file.write("\n")
+            file.write(
+                f"Actual Description: "
+                f"{result['expected']['Description of Issue']}\n"
+            )
+            file.write("\n")
+            file.write(f"BERT Score: {result['metrics']['bert']}\n")
             file.write("\n")
             file.write("-----------------------------------------\n")
             file.write("\n")
 
 
-def write_results_to_json(results):
+def write_results_to_json(results_path, output="model_results/forms.json"):
     """
-    Writes the results to json format.
+    Writes the completed forms to json format, streaming them from the
+    JSONL results file.
 
     Args:
-        results (list): list of completed forms.
+        results_path (str): Path to the JSONL results file.
+        output (str, optional): Path to the json file.
 
     Returns:
         None. The resulting file will have the completed
               forms in json format for future downstream
               tasks.
     """
-    with open("model_results/forms.json", "w") as file:
-        json.dump(results, file, indent=4)
+    with open(output, "w") as file:
+        file.write("[")
+        for i, result in enumerate(iter_results(results_path)):
+            file.write(",\n" if i else "\n")
+            file.write(json.dumps(result["form"], indent=4))
+        file.write("\n]\n")
 
 
-def generate_rephrased_summary(description):
+def generate_rephrased_summary(description, n_rephrasings=1):
     """
     Uses gpt-4o to generate synthetic summaries of
     potential problems for model testing. This function
@@ -130,18 +414,84 @@ def generate_rephrased_summary(description):
 
     Args:
         description (str): The description of a problem.
+        n_rephrasings (int, optional): Number of rephrasings, all returned
+                                       by a single request.
 
     Returns:
-        str: a rephrased summary of the description.
+        list: rephrased summaries of the description.
     """
-    rephrased_summary = generate_data(
+    rephrased_summaries = generate_data(
         system_prompt=generating_augmented_summaries_prompt,
         description=description,
         augmented=True,
-        max_tokens=500,
-        temperature=0.9,
+        n_samples=n_rephrasings,
+        max_tokens=REPHRASE_PARAMETERS["max_tokens"],
+        temperature=REPHRASE_PARAMETERS["temperature"],
+        model=REPHRASE_PARAMETERS["model"],
     )
-    return rephrased_summary
+    return rephrased_summaries
+
+
+def generate_rephrased_summaries(descriptions, n_rephrasings=1, batch_size=10,
+                                 cache=None, refresh=False):
+    """
+    Rephrases many descriptions with few requests. Each request carries
+    `batch_size` descriptions and asks for `n_rephrasings` completions, so
+    the number of round-trips drops by both factors.
+
+    Args:
+        descriptions (list): Descriptions of problems.
+        n_rephrasings (int, optional): Rephrasings per description.
+        batch_size (int, optional): Descriptions per request.
+        cache (SummaryCache, optional): Store of earlier rephrasings; only
+                                        descriptions missing from it are
+                                        sent to the model.
+        refresh (bool, optional): Whether to rephrase every description
+                                  again and overwrite the cached summaries.
+
+    Returns:
+        list: One list of rephrased summaries per description.
+    """
+    cached = {}
+    if cache is not None and not refresh:
+        cached = cache.get_many(descriptions, n_rephrasings)
+    pending = [
+        description
+        for description in dict.fromkeys(descriptions)
+        if description not in cached
+    ]
+
+    generated = {}
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
+        choices = generate_data(
+            system_prompt=generating_augmented_summaries_prompt,
+            prompt=batch_augmented_prompt(batch),
+            n_samples=n_rephrasings,
+            max_tokens=REPHRASE_PARAMETERS["batch_max_tokens_per_description"]
+            * len(batch),
+            temperature=REPHRASE_PARAMETERS["temperature"],
+            model=REPHRASE_PARAMETERS["model"],
+        )
+        outputs = [
+            parse_batched_outputs(choice, len(batch)) for choice in choices
+        ]
+
+        # Falls back to single requests for descriptions the model skipped
+        for i, description in enumerate(batch):
+            summaries = [output[i] for output in outputs if output[i]]
+            if len(summaries) < n_rephrasings:
+                summaries += generate_rephrased_summary(
+                    description, n_rephrasings - len(summaries)
+                )
+            generated[description] = summaries
+
+    if cache is not None and generated:
+        cache.put_many(generated)
+    return [
+        cached[description] if description in cached else generated[description]
+        for description in descriptions
+    ]
 
 
 def most_common_responses(generated_dictionaries):
@@ -172,62 +522,274 @@ def most_common_responses(generated_dictionaries):
     ]
 
 
-def evaluate_performance(query_engine, documents, filename):
+def calibrate_escalation_threshold(
+    query_engine,
+    results_path,
+    output=ESCALATION_CONFIG,
+    target_accuracy=None,
+    report_filename=None,
+):
     """
-    Combines the functions to create a testing pipeline.
+    Tunes the similarity threshold of `generate_gated_form_completion` on
+    the evaluation results. Each rephrased summary is answered from its
+    nearest record (leaving the record it was rephrased from out), and the
+    lowest threshold whose answers are at least as accurate as the target
+    on Department and Priority is kept.
 
     Args:
         query_engine (QueryEngine): Query engine for RAG system.
-        documents (list): list of document objects for RAG system.
+        results_path (str): JSONL results written by `evaluate_performance`.
+        output (str, optional): Path of the calibration file the engine
+                                loads the threshold from.
+        target_accuracy (float, optional): Accuracy the answers without an
+                                           LLM call must reach. Defaults to
+                                           the LLM's accuracy on the same
+                                           summaries.
+        report_filename (str, optional): Report to append the calibration
+                                         table to.
+
+    Returns:
+        dict: The threshold, its coverage (share of summaries answered
+              without an LLM call) and accuracy, and the sweep table.
+    """
+    scored = []
+    total = 0
+    llm_correct = 0
+    for result in iter_results(results_path):
+        expected = result["expected"]
+        nodes = nearest_records(
+            query_engine,
+            result["summary"],
+            exclude_description=expected["Description of Issue"],
+        )
+        if not nodes:
+            continue
+        total += 1
+        llm_correct += (
+            top_label(result["form"]["Department"]) == expected["Department"]
+            and top_label(result["form"]["Priority"]) == expected["Priority"]
+        )
+        form = adapt_record_to_form(nodes)
+        if form is None:
+            # Escalated at any threshold
+            continue
+        correct = (
+            form["Department"][0] == expected["Department"]
+            and form["Priority"][0] == expected["Priority"]
+        )
+        scored.append((nodes[0].score or 0.0, correct))
+    if not scored:
+        raise ValueError(f"No results to calibrate on in {results_path}")
+    if target_accuracy is None:
+        target_accuracy = llm_correct / total
+
+    # Sweeps thresholds from the most to the least similar answer
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    table = []
+    correct_so_far = 0
+    for accepted, (similarity, correct) in enumerate(scored, 1):
+        correct_so_far += correct
+        table.append(
+            {
+                "threshold": similarity,
+                "coverage": accepted / total,
+                "accuracy": correct_so_far / accepted,
+            }
+        )
+
+    # Scores above 1 are impossible for cosine similarity, so 1.01 means
+    # every summary is escalated
+    eligible = [row for row in table if row["accuracy"] >= target_accuracy]
+    chosen = min(eligible, key=lambda row: row["threshold"]) if eligible else {
+        "threshold": 1.01,
+        "coverage": 0.0,
+        "accuracy": None,
+    }
+    calibration = dict(chosen, target_accuracy=target_accuracy, table=table)
+    with open(output, "w") as file:
+        json.dump(calibration, file, indent=4)
+
+    if report_filename is not None:
+        with open(report_filename, "a") as file:
+            file.write("Escalation Threshold Calibration:\n")
+            file.write("-----------------------------------------\n")
+            file.write(f"Target accuracy: {target_accuracy:.3f}\n")
+            file.write(
+                f"Chosen threshold: {chosen['threshold']:.4f} "
+                f"(answers {100 * chosen['coverage']:.1f}% without an LLM call)\n"
+            )
+            step = max(1, len(table) // 20)
+            for row in table[::step]:
+                file.write(
+                    f"threshold {row['threshold']:.4f}  "
+                    f"coverage {row['coverage']:.3f}  "
+                    f"accuracy {row['accuracy']:.3f}\n"
+                )
+            file.write("\n")
+    return calibration
+
+
+def compare_completion_paths(query_engine, descriptions, filename=None):
+    """
+    Completes the same descriptions through `engine.query` and through the
+    direct single-call path, and compares their latency and outputs.
+
+    Args:
+        query_engine (QueryEngine): Query engine for RAG system.
+        descriptions (list): Descriptions to complete.
+        filename (str, optional): File the report is appended to.
+
+    Returns:
+        str: The report.
+    """
+    latencies = {"query engine": [], "direct": []}
+    agreement = Counter()
+    for description in descriptions:
+        forms = {}
+        for path, direct in (("query engine", False), ("direct", True)):
+            start = time.perf_counter()
+            forms[path] = generate_form_completion(
+                query_engine, description, direct=direct
+            )
+            latencies[path].append(time.perf_counter() - start)
+        for field in ("Department", "Priority"):
+            agreement[field] += top_label(
+                forms["query engine"].get(field)
+            ) == top_label(forms["direct"].get(field))
+
+    report = f"Completion paths ({len(descriptions)} descriptions):\n"
+    for path, values in latencies.items():
+        report += f"{path} latency: {latency_summary(values)}\n"
+    for field in ("Department", "Priority"):
+        rate = agreement[field] / len(descriptions) if descriptions else 0.0
+        report += f"{field} top-label agreement: {rate:.2%}\n"
+    if filename is not None:
+        with open(filename, "a") as file:
+            file.write("\n" + report)
+    return report
+
+
+def evaluate_performance(
+    query_engine,
+    records,
+    filename,
+    results_path=None,
+    resume=True,
+    batch_size=10,
+    classifier=None,
+    direct=False,
+    summary_cache=DEFAULT_SUMMARY_CACHE,
+    refresh_summaries=False,
+):
+    """
+    Combines the functions to create a testing pipeline. Each completed
+    form is streamed to `results_path` with its metrics as soon as it
+    finishes, and the reports are computed from that file, so memory stays
+    constant and an interrupted run can be resumed. Resuming a file written
+    with another LLM, prompt or path raises a ValueError.
+
+    Args:
+        query_engine (QueryEngine): Query engine for RAG system.
+        records (Corpus | list): Maintenance requests the RAG system was
+                                 built from.
         filename (str): Output filename.
+        results_path (str, optional): Path to the JSONL results file,
+                                      defaults to `filename` with a .jsonl
+                                      extension. The completed forms are
+                                      also written next to it as .json.
+        resume (bool, optional): Whether to skip the records already in
+                                 `results_path`.
+        batch_size (int, optional): Descriptions rephrased per request.
+        classifier (FieldClassifier, optional): Local classifier to score
+                                                and time against the LLM
+                                                for Department and Priority.
+                                                The evaluated record is held
+                                                out of its training data.
+        direct (bool, optional): Whether to complete forms with the direct
+                                 single-call path instead of `engine.query`.
+        summary_cache (str, optional): SQLite file of rephrased summaries,
+                                       so runs reuse the same summaries,
+                                       or None to always rephrase.
+        refresh_summaries (bool, optional): Whether to rephrase again and
+                                            overwrite the cached summaries.
 
     Returns:
         None: The function will write the results to the designated files.
     """
-    # Actual form fields
-    expected_departments = [doc.metadata["Department"] for doc in documents]
-    expected_priorities = [doc.metadata["Priority"] for doc in documents]
-    expected_descriptions = [
-        doc.metadata["Description of Issue"] for doc in documents
-    ]  # noqa
-
-    # Lists for LLM predictions
-    generated_forms = []
-    generated_departments = []
-    generated_priorities = []
-    generated_descriptions = []
-    generated_summaries = []
-
-    # Iterates through LLM output to parse the fields for formatting
-    for description in expected_descriptions:
-        rephrased_summary = generate_rephrased_summary(description)
-        completed_form = generate_form_completion(
-            query_engine, rephrased_summary
-        )  # noqa
-        generated_priorities.append(completed_form["Priority"])
-        generated_departments.append(completed_form["Department"])
-        generated_descriptions.append(completed_form["Description of Issue"])
-        generated_summaries.append(rephrased_summary)
-        generated_forms.append(completed_form)
-
-    # Sklearn function to calculate metrics
-    department_results = classification_report(
-        expected_departments, generated_departments
-    )
-    priority_results = classification_report(
-        expected_priorities, generated_priorities  # noqa
-    )
+    if results_path is None:
+        results_path = results_path_for(filename)
+    if summary_cache is not None:
+        cache_context = SummaryCache(summary_cache, parameters=REPHRASE_PARAMETERS)
+    else:
+        cache_context = contextlib.nullcontext()
+    run = run_identity(query_engine, direct)
+    with cache_context as cache, ResultsWriter(
+        results_path, resume=resume, run=run
+    ) as writer:
+        pending = (
+            index
+            for index in range(len(records))
+            if index not in writer.completed
+        )
+        for batch in iter_batches(pending, batch_size):
+            # Actual form fields, referencing the records' (interned) strings
+            batch_records = [records[index] for index in batch]
+            expected = [
+                {
+                    field: record[field]
+                    for field in ("Department", "Priority", "Description of Issue")
+                }
+                for record in batch_records
+            ]
+
+            # Rephrases the batch's uncached descriptions in one request
+            rephrased_summaries = generate_rephrased_summaries(
+                [fields["Description of Issue"] for fields in expected],
+                batch_size=batch_size,
+                cache=cache,
+                refresh=refresh_summaries,
+            )
+
+            # Completes, scores and writes each form as soon as it finishes
+            for index, record, fields, summaries in zip(
+                batch, batch_records, expected, rephrased_summaries
+            ):
+                rephrased_summary = summaries[0]
+                start = time.perf_counter()
+                completed_form = generate_form_completion(
+                    query_engine,
+                    rephrased_summary,
+                    request_id=record["Request ID"],
+                    direct=direct,
+                )  # noqa
+                llm_seconds = time.perf_counter() - start
+                bert = calculate_bert(
+                    completed_form["Description of Issue"],
+                    fields["Description of Issue"],
+                )
+                result = {
+                    "index": index,
+                    "Request ID": record["Request ID"],
+                    "summary": rephrased_summary,
+                    "expected": fields,
+                    "form": completed_form,
+                    "metrics": {"bert": bert},
+                    "llm_seconds": llm_seconds,
+                }
+                if classifier is not None:
+                    classified, seconds = classifier.timed_classify(
+                        rephrased_summary, exclude=index
+                    )
+                    result["classifier"] = dict(
+                        classified, seconds=seconds, protocol=classifier.protocol
+                    )
+                writer.write(result)
 
     # Code to write the results in a readable format + json format for future.
-    write_results_to_file(
-        filename,
-        department_results,
-        priority_results,
-        generated_summaries,
-        generated_descriptions,
-        expected_descriptions,
+    write_results_to_file(filename, results_path)
+    write_results_to_json(
+        results_path, os.path.splitext(results_path)[0] + ".json"
     )
-    write_results_to_json(generated_forms)
 
 
 if __name__ == "__main__":
@@ -237,5 +799,14 @@ if __name__ == "__main__":
     filename = "model_results/mixtral_7b_results.txt"
 
     # Engine that preprocesses, runs the LLM, and generated the documents
-    query_engine, documents = create_engine(Settings.llm, maintenance_requests)
-    evaluate_performance(query_engine, documents, filename)
+    use_embedding_cache()
+    query_engine, _ = create_engine(Settings.llm, maintenance_requests)
+    evaluate_performance(
+        query_engine,
+        maintenance_requests,
+        filename,
+        classifier=FieldClassifier(maintenance_requests),
+    )
+    calibrate_escalation_threshold(
+        query_engine, results_path_for(filename), report_filename=filename
+    )
@@ -0,0 +1,83 @@
+"""
+This file contains the vector helpers shared by the retrievers and node
+postprocessors
+"""
+
+import numpy as np
+
+
+def normalize(vectors):
+    """
+    Scales vectors to unit length so dot products are cosine similarities.
+
+    Args:
+        vectors (np.ndarray): A vector or a matrix with one vector per row.
+
+    Returns:
+        np.ndarray: The normalized float32 vectors.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_indices(scores, k):
+    """
+    Returns the positions of the `k` highest scores, best first.
+
+    Args:
+        scores (np.ndarray): One score per candidate.
+        k (int): Number of positions to return.
+
+    Returns:
+        np.ndarray: The positions, sorted by decreasing score.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def nearest_centers(points, centers):
+    """
+    Returns the nearest center (by Euclidean distance) of every point.
+
+    Args:
+        points (np.ndarray): Points, one per row.
+        centers (np.ndarray): Centers, one per row.
+
+    Returns:
+        np.ndarray: Position of the nearest center of every point.
+    """
+    # Squared distances without the constant |point|^2 term
+    distances = (centers**2).sum(axis=1) - 2 * points @ centers.T
+    return np.argmin(distances, axis=1)
+
+
+def kmeans(points, k, iterations=20, rng=None):
+    """
+    Clusters points with Lloyd's k-means, starting from random points.
+    Empty clusters are restarted at a random point.
+
+    Args:
+        points (np.ndarray): Points, one per row.
+        k (int): Number of clusters, at most the number of points.
+        iterations (int, optional): Number of iterations.
+        rng (np.random.Generator, optional): Random generator.
+
+    Returns:
+        np.ndarray: The k centers.
+    """
+    rng = rng or np.random.default_rng(0)
+    points = np.asarray(points, dtype=np.float32)
+    centers = points[rng.choice(len(points), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centers(points, centers)
+        for c in range(k):
+            members = points[assignment == c]
+            if len(members):
+                centers[c] = members.mean(axis=0)
+            else:
+                centers[c] = points[rng.integers(len(points))]
+    return centers